@@ -0,0 +1,66 @@
+"""Materialize each user's transactions into a Parquet snapshot.
+
+Served by GET /transactions/snapshot. A user with a snapshot is patched
+from the change feed (upserts since its token, tombstoned deletes); a new
+user, one whose token has aged out of tombstone retention, or ``--full``
+reads every row. Run it on a schedule shorter than the retention window.
+
+    python -m jobs.build_snapshots --dry-run
+    python -m jobs.build_snapshots --uid <uid> --full
+"""
+from typing import Any, Dict, Iterator, List, Optional
+import argparse, json, sys
+
+import storage
+from utils.snapshot import build_snapshot
+
+def _db():
+    return storage.client()
+
+def _pages(col: Any, page_size: int, start_after: str = "", fields: Optional[List[str]] = None) -> Iterator[List[Any]]:
+    cursor = start_after
+    while True:
+        q = col.order_by("__name__")
+        if fields is not None:
+            q = q.select(fields)
+        if cursor:
+            q = q.start_after({"__name__": col.document(cursor)})
+        page = list(q.limit(page_size).stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1].id
+
+def run(db: Any, *, uids: Optional[List[str]], full: bool, dry_run: bool, page_size: int, start_after: str) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"dryRun": dry_run, "users": 0, "full": 0, "incremental": 0, "unchanged": 0, "rows": 0, "bytes": 0, "failed": [], "lastUid": ""}
+    users = ([u] for u in uids) if uids else (
+        [s.id for s in page] for page in _pages(db.collection("users"), page_size, start_after, fields=[])
+    )
+    for batch_uids in users:
+        for uid in batch_uids:
+            res = build_snapshot(db, uid, full=full, dry_run=dry_run)
+            report["users"] += 1
+            report[res["mode"]] += 1
+            report["rows"] += res["rows"]
+            report["bytes"] += res["bytes"]
+            if res["mode"] != "unchanged" and not dry_run and not res["written"]:
+                report["failed"].append(uid)
+            report["lastUid"] = uid
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Build per-user Parquet snapshots of transactions.")
+    ap.add_argument("--uid", action="append", help="Limit to this user (repeatable)")
+    ap.add_argument("--full", action="store_true", help="Rebuild from every row instead of the change feed")
+    ap.add_argument("--dry-run", action="store_true", help="Build but do not store")
+    ap.add_argument("--page-size", type=int, default=1000)
+    ap.add_argument("--start-after", default="", help="Resume after this user id (see lastUid in the report)")
+    args = ap.parse_args(argv)
+    report = run(_db(), uids=args.uid, full=args.full, dry_run=args.dry_run, page_size=max(1, args.page_size), start_after=args.start_after)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if not report["failed"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Backfill the indexed lookup fields on stored transactions.
+
+Writes ``clientUid``, ``absCents`` and ``fingerprintHash`` (see
+utils.fingerprints) where they are missing or out of date, and rewrites
+``dateKey`` to YYYYMMDD on rows stored in the older MMDDYYYY form. Safe
+to re-run; only changed rows are written.
+
+Run it before deploying a build that resolves ids through
+utils.transaction_lookup: slug lookups only match rows with a YYYYMMDD
+dateKey and absCents, and client ids of rows without clientUid fall back
+to a per-day scan.
+
+    python -m jobs.migrate_lookup_fields --dry-run
+    python -m jobs.migrate_lookup_fields --uid <uid>
+"""
+from typing import Any, Dict, Iterator, List, Optional
+import argparse, json, sys
+
+from firebase_admin import firestore as fa_firestore
+
+import storage
+from utils.aggregates import AGGREGATE_FIELDS, AggregatedWrites
+from utils.data_version import bump_version
+from utils.fingerprints import LOOKUP_FIELDS, LOOKUP_SOURCE_FIELDS, lookup_fields
+from utils.pagination import to_date_key
+
+def _db():
+    return storage.client()
+
+def _pages(col: Any, page_size: int, start_after: str = "", fields: Optional[List[str]] = None) -> Iterator[List[Any]]:
+    cursor = start_after
+    while True:
+        q = col.order_by("__name__")
+        if fields is not None:
+            q = q.select(fields)
+        if cursor:
+            q = q.start_after({"__name__": col.document(cursor)})
+        page = list(q.limit(page_size).stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1].id
+
+def migrated_fields(rec: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields to write so ``rec`` matches what ingest stores today."""
+    out = {k: v for k, v in lookup_fields(rec).items() if rec.get(k) != v}
+    try:
+        date_key = to_date_key(str(rec.get("date") or "").split("T")[0])
+    except ValueError:
+        date_key = ""
+    if date_key and date_key != rec.get("dateKey"):
+        out["dateKey"] = date_key
+        out["updatedAt"] = fa_firestore.SERVER_TIMESTAMP
+    return out
+
+def run(db: Any, *, uids: Optional[List[str]], dry_run: bool, page_size: int, start_after: str) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"dryRun": dry_run, "users": 0, "scanned": 0, "changed": 0, "dateKeysFixed": 0, "failedChunks": 0, "lastUid": ""}
+    fields = sorted(set(LOOKUP_SOURCE_FIELDS) | set(LOOKUP_FIELDS) | set(AGGREGATE_FIELDS))
+    users = ([u] for u in uids) if uids else (
+        [s.id for s in page] for page in _pages(db.collection("users"), page_size, start_after, fields=[])
+    )
+    for batch_uids in users:
+        for uid in batch_uids:
+            report["users"] += 1
+            changed = 0
+            for page in _pages(db.collection("users").document(uid).collection("transactions"), page_size, fields=fields):
+                report["scanned"] += len(page)
+                writes = AggregatedWrites(db, db.collection("users").document(uid))
+                for snap in page:
+                    rec = snap.to_dict() or {}
+                    data = migrated_fields(rec)
+                    if not data:
+                        continue
+                    changed += 1
+                    report["dateKeysFixed"] += int("dateKey" in data)
+                    writes.update(snap.reference, data, old=rec)
+                if writes and not dry_run:
+                    report["failedChunks"] += len(writes.commit().failed)
+            report["changed"] += changed
+            if changed and not dry_run:
+                bump_version(db, uid)
+            report["lastUid"] = uid
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Backfill indexed transaction lookup fields.")
+    ap.add_argument("--uid", action="append", help="Limit to this user (repeatable)")
+    ap.add_argument("--dry-run", action="store_true", help="Count rows that would change without writing")
+    ap.add_argument("--page-size", type=int, default=500)
+    ap.add_argument("--start-after", default="", help="Resume after this user id (see lastUid in the report)")
+    args = ap.parse_args(argv)
+    report = run(_db(), uids=args.uid, dry_run=args.dry_run, page_size=max(1, args.page_size), start_after=args.start_after)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if not report["failedChunks"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
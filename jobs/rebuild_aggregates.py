@@ -0,0 +1,85 @@
+"""Recompute the per-user monthly aggregate docs from stored transactions.
+
+Write paths keep ``users/{uid}/aggregates`` current incrementally; run
+this once to backfill users whose rows predate the aggregates, or to
+repair drift. Each user's docs are replaced wholesale, so run it while
+the user is not uploading or syncing.
+
+    python -m jobs.rebuild_aggregates --dry-run
+    python -m jobs.rebuild_aggregates --uid <uid>
+"""
+from typing import Any, Dict, Iterator, List, Optional
+import argparse, json, sys
+
+from firebase_admin import firestore as fa_firestore
+
+import storage
+from utils.aggregates import AGGREGATE_FIELDS, AGGREGATES, rebuild_docs
+from utils.bulk_writes import BulkWrites
+from utils.data_version import bump_version
+
+def _db():
+    return storage.client()
+
+def _pages(col: Any, page_size: int, start_after: str = "", fields: Optional[List[str]] = None) -> Iterator[List[Any]]:
+    cursor = start_after
+    while True:
+        q = col.order_by("__name__")
+        if fields is not None:
+            q = q.select(fields)
+        if cursor:
+            q = q.start_after({"__name__": col.document(cursor)})
+        page = list(q.limit(page_size).stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1].id
+
+def rebuild_user(db: Any, uid: str, *, dry_run: bool, page_size: int) -> Dict[str, int]:
+    uref = db.collection("users").document(uid)
+    rows = (s.to_dict() or {} for page in _pages(uref.collection("transactions"), page_size, fields=list(AGGREGATE_FIELDS)) for s in page)
+    docs = rebuild_docs(rows)
+    stale = [s.reference for s in uref.collection(AGGREGATES).select([]).stream() if s.id not in docs]
+    out = {"months": len(docs), "rows": sum(c["count"] for d in docs.values() for c in d["cells"].values()), "stale": len(stale), "failedChunks": 0}
+    if dry_run:
+        return out
+    writes = BulkWrites(db)
+    for month, data in docs.items():
+        writes.set(uref.collection(AGGREGATES).document(month), {**data, "updatedAt": fa_firestore.SERVER_TIMESTAMP})
+    for ref in stale:
+        writes.delete(ref)
+    out["failedChunks"] = len(writes.commit().failed)
+    bump_version(db, uid)
+    return out
+
+def run(db: Any, *, uids: Optional[List[str]], dry_run: bool, page_size: int, start_after: str) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"dryRun": dry_run, "users": 0, "rows": 0, "months": 0, "staleMonths": 0, "failedChunks": 0, "lastUid": ""}
+    users = ([u] for u in uids) if uids else (
+        [s.id for s in page] for page in _pages(db.collection("users"), page_size, start_after, fields=[])
+    )
+    for batch_uids in users:
+        for uid in batch_uids:
+            res = rebuild_user(db, uid, dry_run=dry_run, page_size=page_size)
+            report["users"] += 1
+            report["rows"] += res["rows"]
+            report["months"] += res["months"]
+            report["staleMonths"] += res["stale"]
+            report["failedChunks"] += res["failedChunks"]
+            report["lastUid"] = uid
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Rebuild per-user monthly aggregates from transactions.")
+    ap.add_argument("--uid", action="append", help="Limit to this user (repeatable)")
+    ap.add_argument("--dry-run", action="store_true", help="Report what would be written")
+    ap.add_argument("--page-size", type=int, default=1000)
+    ap.add_argument("--start-after", default="", help="Resume after this user id (see lastUid in the report)")
+    args = ap.parse_args(argv)
+    report = run(_db(), uids=args.uid, dry_run=args.dry_run, page_size=max(1, args.page_size), start_after=args.start_after)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if not report["failedChunks"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""Re-run classification over stored transactions.
+
+Targets rows still booked to the uncategorized account or classified by
+the ``ai`` tier. Users and transactions are walked with key-range
+pagination and progress is checkpointed to a JSON file so an interrupted
+run resumes where it stopped.
+
+    python -m jobs.reclassify_backfill --dry-run
+    python -m jobs.reclassify_backfill --uid <uid> --llm-concurrency 4 --llm-rate 5
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import argparse, json, os, sys, threading, time
+
+from firebase_admin import firestore as fa_firestore
+
+from utils.clean_vendor_name import clean_vendor_name
+from utils.classify_transaction import classify_with_memory, finalize_classification, prefetch_vendor_memory
+from utils.chart_of_accounts import chart_for_user, UNCATEGORIZED
+import storage
+from utils.aggregates import AggregatedWrites
+from utils.data_version import bump_version
+
+PHASES: List[Tuple[str, str, str]] = [
+    ("uncategorized", "account", UNCATEGORIZED),
+    ("ai", "classificationSource", "ai"),
+]
+_WRITE_CHUNK = 450
+
+def _db():
+    return storage.client()
+
+class _RateLimiter:
+    def __init__(self, per_second: float) -> None:
+        self._interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self._interval
+        if at > now:
+            time.sleep(at - now)
+
+class _Checkpoint:
+    def __init__(self, path: str, enabled: bool) -> None:
+        self.path = path
+        self.enabled = enabled
+        self.state: Dict[str, Any] = {"usersCursor": "", "users": {}}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fh:
+                self.state = json.load(fh)
+
+    def user(self, uid: str) -> Dict[str, Any]:
+        return self.state.setdefault("users", {}).setdefault(uid, {"phase": 0, "cursor": "", "done": False})
+
+    def save(self) -> None:
+        if not self.enabled or not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self.path)
+
+def _iter_user_ids(db: Any, start_after: str, page_size: int) -> Iterator[str]:
+    col = db.collection("users")
+    cursor = start_after
+    while True:
+        q = col.order_by("__name__")
+        if cursor:
+            q = q.start_after({"__name__": col.document(cursor)})
+        page = list(q.select([]).limit(page_size).stream())
+        for snap in page:
+            yield snap.id
+        if len(page) < page_size:
+            return
+        cursor = page[-1].id
+
+def _commit_updates(db: Any, uid: str, updates: List[Tuple[Any, Dict[str, Any], Dict[str, Any]]]) -> None:
+    writes = AggregatedWrites(db, db.collection("users").document(uid), chunk=_WRITE_CHUNK)
+    for ref, data, old in updates:
+        writes.update(ref, data, old=old)
+    res = writes.commit()
+    if not res.ok:
+        raise RuntimeError(f"backfill writes failed in chunks {res.failed}")
+
+def _reclassify_page(db: Any, uid: str, docs: List[Any], chart: Any, pool: ThreadPoolExecutor, limiter: _RateLimiter, use_llm: bool, seen: set) -> List[Tuple[Any, Dict[str, Any], str, Dict[str, Any]]]:
+    rows = []
+    for d in docs:
+        if d.id in seen:
+            continue
+        seen.add(d.id)
+        rec = d.to_dict() or {}
+        memo = str(rec.get("memo") or "")
+        rows.append((d, rec, memo, clean_vendor_name(memo).lower()))
+    user_cache, global_cache = prefetch_vendor_memory(db, uid, [r[3] for r in rows])
+
+    def _classify(row) -> Tuple[str, str]:
+        d, rec, memo, vendor_key = row
+        acc, via = classify_with_memory(db=db, uid=uid, vendor_key=vendor_key, user_mem_cache=user_cache, global_mem_cache=global_cache)
+        if acc:
+            return acc, via
+        if not use_llm:
+            return "", ""
+        limiter.wait()
+        return finalize_classification(
+            db=db, uid=uid, vendor_key=vendor_key, memo=memo,
+            amount=float(rec.get("amount") or 0.0), source=str(rec.get("source") or ""),
+            allowed_accounts=chart, user_mem_cache=user_cache, global_mem_cache=global_cache,
+        )
+
+    out = []
+    for row, (account, via) in zip(rows, pool.map(_classify, rows)):
+        d, rec, _, _ = row
+        if account and account != str(rec.get("account") or ""):
+            out.append((d.reference, {"account": account, "classificationSource": via, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, via, rec))
+    return out
+
+def run(db: Any, *, uids: Optional[List[str]], dry_run: bool, page_size: int, llm_concurrency: int, llm_rate: float, use_llm: bool, checkpoint: _Checkpoint) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"dryRun": dry_run, "users": 0, "scanned": 0, "changed": 0, "byTier": {}}
+    limiter = _RateLimiter(llm_rate)
+    user_ids = iter(uids) if uids else _iter_user_ids(db, str(checkpoint.state.get("usersCursor") or ""), page_size)
+    with ThreadPoolExecutor(max_workers=max(1, llm_concurrency), thread_name_prefix="backfill") as pool:
+        for uid in user_ids:
+            state = checkpoint.user(uid)
+            if state.get("done"):
+                continue
+            report["users"] += 1
+            chart = chart_for_user(db, uid)
+            tcol = db.collection("users").document(uid).collection("transactions")
+            seen: set = set()
+            while int(state.get("phase") or 0) < len(PHASES):
+                _, field, value = PHASES[int(state["phase"])]
+                cursor = str(state.get("cursor") or "")
+                q = tcol.where(field, "==", value).order_by("__name__")
+                if cursor:
+                    q = q.start_after({"__name__": tcol.document(cursor)})
+                docs = list(q.limit(page_size).stream())
+                report["scanned"] += len(docs)
+                changes = _reclassify_page(db, uid, docs, chart, pool, limiter, use_llm, seen)
+                for _, _, via, _ in changes:
+                    report["byTier"][via] = report["byTier"].get(via, 0) + 1
+                report["changed"] += len(changes)
+                if changes and not dry_run:
+                    _commit_updates(db, uid, [(ref, data, old) for ref, data, _, old in changes])
+                    bump_version(db, uid)
+                if len(docs) < page_size:
+                    state["phase"] = int(state["phase"]) + 1
+                    state["cursor"] = ""
+                else:
+                    state["cursor"] = docs[-1].id
+                checkpoint.save()
+            state["done"] = True
+            if not uids:
+                checkpoint.state["usersCursor"] = uid
+            checkpoint.save()
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Re-run transaction classification with checkpointing.")
+    ap.add_argument("--uid", action="append", help="Limit to this user (repeatable)")
+    ap.add_argument("--dry-run", action="store_true", help="Report changes by tier without writing")
+    ap.add_argument("--page-size", type=int, default=200)
+    ap.add_argument("--llm-concurrency", type=int, default=4)
+    ap.add_argument("--llm-rate", type=float, default=5.0, help="Max LLM calls per second (0 = unlimited)")
+    ap.add_argument("--no-llm", action="store_true", help="Only apply memory tiers")
+    ap.add_argument("--checkpoint", default="reclassify_backfill.checkpoint.json")
+    ap.add_argument("--reset", action="store_true", help="Ignore and overwrite an existing checkpoint")
+    args = ap.parse_args(argv)
+    if args.reset and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = _Checkpoint("" if args.dry_run else args.checkpoint, enabled=not args.dry_run)
+    report = run(
+        _db(),
+        uids=args.uid,
+        dry_run=args.dry_run,
+        page_size=max(1, args.page_size),
+        llm_concurrency=args.llm_concurrency,
+        llm_rate=args.llm_rate,
+        use_llm=not args.no_llm,
+        checkpoint=checkpoint,
+    )
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
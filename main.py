@@ -1,19 +1,37 @@
 from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Query, Body, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime, timezone
-import os, json, uuid, hmac, hashlib, base64, httpx
+import os, json, uuid, hmac, hashlib, base64, httpx, threading, itertools, asyncio
 
 from universal_parser import extract_transactions_from_bytes
 import firebase_admin
-from firebase_admin import auth as fb_auth, credentials
+from firebase_admin import credentials
 from firebase_admin import firestore as fa_firestore
+from google.api_core import exceptions as gexc
 
 from routes import ai_router, journal_router, vendors_router, plaid_router, demo_router
 from routes.coa import router as coa_router
+from routes.security import verify_bearer, touch_user_profile, touch_user_profile_async
+from routes.transactions_changes import router as transactions_changes_router
+from routes.reports import router as reports_router
+from routes.export import router as export_router
+from routes.search import router as search_router
 from routes.transactions_detail import router as transactions_detail_router
 from routes.journal_detail import router as journal_detail_router
-from utils.display_amount import compute_display_amount
+from utils.display_amount import compute_display_amounts, bank_match_keys, BankMatchIndex
+from utils.transfer_pairing import pair_or_defer
+from utils.deletion import delete_matching
+from utils.fingerprints import lookup_fields
+from utils.transaction_lookup import existing_rows, rows_by_fingerprint
+from utils.classification_pipeline import pipeline as classification_pipeline
+from utils.pagination import page_transactions_async, iter_transactions, decode_cursor, parse_fields, to_date_key, MISSING_INDEX_DETAIL
+from utils.streaming import stream_rows, peeked, STREAM_FORMATS
+from utils.data_version import conditional_async, set_etag, bump_version, stage_version_bump
+from utils.aggregates import AGGREGATE_FIELDS, AggregatedWrites
+import storage
+from utils.async_store import async_db, stream_all, commit_chunks_async
 
 app = FastAPI()
 
@@ -39,6 +57,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Disposition", "X-Changes-Token", "X-Snapshot-Rows"],
 )
 
 app.include_router(ai_router)
@@ -47,6 +66,10 @@ app.include_router(vendors_router)
 app.include_router(plaid_router)
 app.include_router(demo_router)
 app.include_router(coa_router)
+app.include_router(transactions_changes_router)
+app.include_router(reports_router)
+app.include_router(export_router)
+app.include_router(search_router)
 app.include_router(transactions_detail_router)
 app.include_router(journal_detail_router)
 
@@ -59,21 +82,36 @@ def _init_firebase_once():
         firebase_admin.initialize_app(cred)
 
 def _db():
-    _init_firebase_once()
-    return fa_firestore.client()
+    return storage.client()
+
+def _adb():
+    return async_db()
 
 def _verify_and_decode(authorization: Optional[str]) -> dict:
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = authorization.split(" ", 1)[1].strip()
     _init_firebase_once()
-    try:
-        decoded = fb_auth.verify_id_token(token, check_revoked=False)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    if not decoded.get("uid"):
-        raise HTTPException(status_code=401, detail="Invalid token")
-    return decoded
+    return verify_bearer(authorization)
+
+@app.on_event("startup")
+def _resume_classification():
+    if (os.environ.get("CLASSIFY_RESUME_ON_STARTUP", "1") or "").strip() in ("0", "false", "no"):
+        return
+    def _resume():
+        try:
+            classification_pipeline.resume_pending(_db())
+        except Exception:
+            pass
+    threading.Thread(target=_resume, name="classify-resume", daemon=True).start()
+
+@app.on_event("shutdown")
+def _drain_on_shutdown():
+    from utils.classify_transaction import flush_learning
+    classification_pipeline.shutdown(wait=True)
+    flush_learning()
+
+@app.on_event("shutdown")
+async def _close_http_clients():
+    from utils.embeddings import embedding_service
+    await embedding_service.aclose()
 
 @app.get("/")
 def root():
@@ -98,120 +136,193 @@ def _parse_date_key(s: str) -> str:
             pass
     return ""
 
-def _touch_user_profile(db: Any, uid: str, email: str | None):
-    try:
-        uref = db.collection("users").document(uid)
-        uref.set(
-            {
-                "email": (email or "").lower(),
-                "createdAt": fa_firestore.SERVER_TIMESTAMP,
-                "updatedAt": fa_firestore.SERVER_TIMESTAMP,
-            },
-            merge=True,
-        )
-    except Exception:
-        pass
-
-def _delete_query(q: fa_firestore.Query, chunk: int = 450):
-    docs = list(q.stream())
-    while docs:
-        batch = q._client.batch()
-        for d in docs[:chunk]:
-            batch.delete(d.reference)
-        try:
-            batch.commit()
-        except Exception:
-            break
-        docs = docs[chunk:]
-
-def _server_allowed_accounts() -> List[str]:
-    raw = os.environ.get("ALLOWED_ACCOUNTS_JSON", "").strip()
-    if raw:
-        try:
-            arr = json.loads(raw)
-            if isinstance(arr, list):
-                return [str(x) for x in arr if x]
-        except Exception:
-            pass
-    return [
-        "1000 - Checking Account","1010 - Savings Account","1020 - Petty Cash",
-        "1030 - Accounts Receivable","1050 - Inventory","1060 - Fixed Assets",
-        "1070 - Accumulated Depreciation","2000 - Accounts Payable","2010 - Credit Card Payables",
-        "2040 - Loan Payable","2020 - Payroll Liabilities","2030 - Sales Tax Payable",
-        "3000 - Contributions","3010 - Draws","3020 - Retained Earnings",
-        "4000 - Product Sales","4010 - Service Income","4020 - Subscription Revenue",
-        "4030 - Consulting Income","4040 - Other Revenue","4090 - Refunds and Discounts",
-        "5000 - Inventory Purchases","5010 - Subcontracted Labor","5020 - Packaging & Shipping Supplies",
-        "5030 - Merchant Fees",
-        "6000 - Salaries and Wages","6010 - Payroll Taxes","6020 - Employee Benefits",
-        "6030 - Independent Contractors","6040 - Bonuses & Commissions","6050 - Workers Compensation Insurance",
-        "6060 - Recruiting & Hiring","6100 - Rent or Lease Expense","6110 - Utilities","6120 - Insurance",
-        "6130 - Repairs & Maintenance","6140 - Office Supplies","6150 - Telephone & Internet",
-        "6200 - Advertising & Promotion","6210 - Social Media & Digital Ads",
-        "6220 - Meals & Entertainment","6230 - Client Gifts",
-        "6300 - Software Subscriptions","6310 - Bank Fees","6320 - Dues & Licenses","6330 - Postage & Delivery",
-        "6400 - Legal Fees","6410 - Accounting & Bookkeeping","6420 - Consulting Fees","6430 - Tax Prep & Advisory",
-        "6500 - Travel - Airfare","6510 - Travel - Lodging","6520 - Travel - Meals","6530 - Travel - Other (Taxis, Parking)",
-        "8000 - State Income Tax","8010 - Franchise Tax","8020 - Local Business Taxes","8030 - Estimated Tax Payments",
-        "7090 - Uncategorized Expense",
-    ]
+def _delete_query(q: fa_firestore.Query, uid: Optional[str] = None) -> None:
+    """Delete every doc matched by ``q``; with ``uid``, the docs are that user's
+    transactions and are also tombstoned and dropped from the pairing index."""
+    res = delete_matching(q._client, [q], uid=uid)
+    if not res.ok:
+        if uid:
+            bump_version(q._client, uid)
+        raise HTTPException(status_code=502, detail=res.detail())
+
+def _stream_format(stream: Optional[str]) -> str:
+    fmt = (stream or "").strip().lower()
+    if fmt and fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream must be ndjson or json")
+    return fmt
+
+def _with_id(snaps: Any, key: str) -> Any:
+    for d in snaps:
+        rec = d.to_dict() or {}
+        rec[key] = d.id
+        yield rec
 
 @app.get("/uploads")
-def list_uploads(authorization: str = Header(None)):
+async def list_uploads(request: Request, response: Response, authorization: str = Header(None), stream: Optional[str] = Query(None)):
     decoded = _verify_and_decode(authorization)
-    db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
+    fmt = _stream_format(stream)
     uid = decoded["uid"]
-    uref = db.collection("users").document(uid)
-    out = []
-    for d in uref.collection("uploads").order_by("createdAt", direction=fa_firestore.Query.DESCENDING).stream():
-        rec = d.to_dict() or {}
-        rec["uploadId"] = d.id
-        out.append(rec)
-    return {"uploads": out}
+    adb = _adb()
+    (etag, not_modified), _ = await asyncio.gather(
+        conditional_async(adb, uid, request.headers.get("if-none-match"), "uploads", fmt),
+        touch_user_profile_async(adb, uid, decoded.get("email")),
+    )
+    if not_modified:
+        return not_modified
+    if fmt:
+        q = _db().collection("users").document(uid).collection("uploads").order_by("createdAt", direction=fa_firestore.Query.DESCENDING)
+        res = stream_rows(_with_id(q.stream(), "uploadId"), fmt, "uploads")
+        set_etag(res, etag)
+        return res
+    q = adb.collection("users").document(uid).collection("uploads").order_by("createdAt", direction=fa_firestore.Query.DESCENDING)
+    snaps = await stream_all(q)
+    set_etag(response, etag)
+    return {"uploads": list(_with_id(snaps, "uploadId"))}
 
 @app.post("/delete-upload")
 def delete_upload(authorization: str = Header(None), body: Dict[str, Any] = Body(...)):
     decoded = _verify_and_decode(authorization)
     db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
+    touch_user_profile(db, decoded["uid"], decoded.get("email"))
     uid = decoded["uid"]
     upload_id = str(body.get("uploadId") or body.get("id") or "").strip()
     if not upload_id:
         raise HTTPException(status_code=400, detail="Missing uploadId")
     uref = db.collection("users").document(uid)
-    _delete_query(uref.collection("transactions").where("uploadId", "==", upload_id))
+    _delete_query(uref.collection("transactions").where("uploadId", "==", upload_id), uid=uid)
     try:
         uref.collection("uploads").document(upload_id).delete()
     except Exception:
         pass
+    bump_version(db, uid)
     return {"ok": True, "uploadId": upload_id}
 
 @app.post("/delete-all-uploads")
 def delete_all_uploads(authorization: str = Header(None)):
     decoded = _verify_and_decode(authorization)
     db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
+    touch_user_profile(db, decoded["uid"], decoded.get("email"))
     uid = decoded["uid"]
     uref = db.collection("users").document(uid)
-    _delete_query(uref.collection("transactions").where("uploadId", ">=", "").where("uploadId", "<=", "\uf8ff"))
+    _delete_query(uref.collection("transactions").where("uploadId", ">=", "").where("uploadId", "<=", "\uf8ff"), uid=uid)
     _delete_query(uref.collection("uploads").where("fileName", ">=", "").where("fileName", "<=", "\uf8ff"))
+    bump_version(db, uid)
     return {"ok": True}
 
 @app.get("/transactions")
-def list_transactions(authorization: str = Header(None), limit: int = Query(5000), offset: int = Query(0)):
+async def list_transactions(
+    request: Request,
+    response: Response,
+    authorization: str = Header(None),
+    limit: Optional[int] = Query(None),
+    offset: int = Query(0),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    source: Optional[str] = Query(None),
+    sourceType: Optional[str] = Query(None),
+    stream: Optional[str] = Query(None),
+):
     decoded = _verify_and_decode(authorization)
-    db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
+    fmt = _stream_format(stream)
     uid = decoded["uid"]
-    uref = db.collection("users").document(uid)
-    snaps = list(uref.collection("transactions").order_by("dateKey").stream())
-    rows = []
-    for s in snaps[offset: offset + max(0, limit)]:
-        rec = s.to_dict() or {}
-        rec["id"] = s.id
-        rows.append(rec)
-    return {"transactions": rows}
+    adb = _adb()
+    (etag, not_modified), _ = await asyncio.gather(
+        conditional_async(adb, uid, request.headers.get("if-none-match"), "transactions", request.url.query),
+        touch_user_profile_async(adb, uid, decoded.get("email")),
+    )
+    if not_modified:
+        return not_modified
+    try:
+        filters = dict(
+            start_key=to_date_key(start),
+            end_key=to_date_key(end),
+            source=(source or "").strip(),
+            source_type=(sourceType or "").strip().lower(),
+            fields=parse_fields(fields),
+        )
+        if fmt:
+            if cursor:
+                decode_cursor(cursor)
+            snaps = iter_transactions(_db().collection("users").document(uid).collection("transactions"), cursor=cursor, **filters)
+            if limit is not None:
+                snaps = itertools.islice(snaps, max(0, limit))
+            snaps = await run_in_threadpool(peeked, snaps)
+            res = stream_rows(_with_id(snaps, "id"), fmt, "transactions")
+            set_etag(res, etag)
+            return res
+        tcol = adb.collection("users").document(uid).collection("transactions")
+        rows, next_cursor = await page_transactions_async(tcol, limit=5000 if limit is None else limit, cursor=cursor, offset=offset, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except gexc.FailedPrecondition:
+        raise HTTPException(status_code=503, detail=MISSING_INDEX_DETAIL)
+    set_etag(response, etag)
+    return {"transactions": rows, "nextCursor": next_cursor}
+
+def _upload_status(auto_classify: bool, rows: List[Dict[str, Any]]) -> str:
+    return "classifying" if auto_classify and rows else "ready"
+
+def _upload_row_docs(rows: List[Dict[str, Any]], source: str, src_type_default: str) -> List[Dict[str, Any]]:
+    docs: List[Dict[str, Any]] = []
+    for r in rows:
+        date = str(r.get("date") or "")
+        docs.append({
+            "date": date,
+            "dateKey": _parse_date_key(date),
+            "memo": str(r.get("memo") or r.get("memo_raw") or r.get("memo_clean") or ""),
+            "amount": float(r.get("amount") or 0.0),
+            "account": str(r.get("account") or ""),
+            "source": str(r.get("source") or source),
+            "sourceType": str(r.get("sourceType") or src_type_default or "bank"),
+        })
+    return docs
+
+def _display_rows(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"amount": t["amount"], "source_type": t["sourceType"], "source": t["source"], "date": t["date"], "date_key": t["dateKey"]} for t in docs]
+
+def _stage_upload_rows(writes: Any, tcol: Any, upload_id: str, file_name: str, docs: List[Dict[str, Any]], disps: List[float]) -> Dict[str, Dict[str, Any]]:
+    staged: Dict[str, Dict[str, Any]] = {}
+    for t, disp in zip(docs, disps):
+        docref = tcol.document()
+        staged[docref.id] = {
+            **t,
+            **lookup_fields(t),
+            "displayAmount": disp,
+            "uploadId": upload_id,
+            "fileName": file_name,
+            "createdAt": fa_firestore.SERVER_TIMESTAMP,
+            "updatedAt": fa_firestore.SERVER_TIMESTAMP,
+        }
+        writes.set(docref, staged[docref.id])
+    return staged
+
+async def _save_upload_rows(adb: Any, uref: Any, upref: Any, docs: List[Dict[str, Any]], bank_index: BankMatchIndex, file_name: str, status: str) -> Dict[str, Dict[str, Any]]:
+    """Write the rows in parallel chunks, then flip the "saving" upload to its final
+    status only if every chunk committed. Returns the written rows by doc id."""
+    disps = compute_display_amounts(db=None, uid=None, rows=_display_rows(docs), bank_index=bank_index)
+    writes = AggregatedWrites(adb, uref)
+    staged = _stage_upload_rows(writes, uref.collection("transactions"), upref.id, file_name, docs, disps)
+    saved = await commit_chunks_async(adb, writes.take_chunks())
+    batch = adb.batch()
+    if saved.ok:
+        batch.update(upref, {"status": status, "writeErrors": fa_firestore.DELETE_FIELD, "updatedAt": fa_firestore.SERVER_TIMESTAMP})
+    else:
+        batch.update(upref, {"status": "error", "writeErrors": saved.to_dict(), "updatedAt": fa_firestore.SERVER_TIMESTAMP})
+    stage_version_bump(batch, uref)
+    await batch.commit()
+    if not saved.ok:
+        raise HTTPException(
+            status_code=502,
+            detail=f"{len(saved.failed)} of {saved.chunks} write chunks failed; replace the upload to retry",
+        )
+    return staged
+
+def _upload_meta(meta: Dict[str, Any]) -> tuple:
+    source = str(meta.get("source_account") or meta.get("source") or "Unknown")
+    src_type_default = str(meta.get("source_type") or meta.get("source_kind") or "").lower().strip() or "bank"
+    return source, src_type_default
 
 @app.post("/parse-and-persist")
 async def parse_and_persist(
@@ -220,82 +331,47 @@ async def parse_and_persist(
     autoClassify: bool = Query(True),
 ):
     decoded = _verify_and_decode(authorization)
-    db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
     uid = decoded["uid"]
+    db = _db()
+    adb = _adb()
     pdf_bytes = await file.read()
-    rows, meta = extract_transactions_from_bytes(pdf_bytes)
-    source = str(meta.get("source_account") or meta.get("source") or "Unknown")
-    src_type_default = str(meta.get("source_type") or meta.get("source_kind") or "").lower().strip() or "bank"
-    uref = db.collection("users").document(uid)
+    (rows, meta), _ = await asyncio.gather(
+        run_in_threadpool(extract_transactions_from_bytes, pdf_bytes),
+        touch_user_profile_async(adb, uid, decoded.get("email")),
+    )
+    rows = rows or []
+    source, src_type_default = _upload_meta(meta)
+    docs = _upload_row_docs(rows, source, src_type_default)
+    uref = adb.collection("users").document(uid)
     upref = uref.collection("uploads").document()
     upload_id = upref.id
-    created: List[Dict[str, Any]] = []
-    batch = db.batch()
-    batch.set(
-        upref,
-        {
-            "fileName": file.filename,
-            "source": source,
-            "transactionCount": int(len(rows or [])),
-            "status": "ready",
-            "createdAt": fa_firestore.SERVER_TIMESTAMP,
-            "updatedAt": fa_firestore.SERVER_TIMESTAMP,
-        },
-    )
-    tcol = uref.collection("transactions")
-    for r in rows or []:
-        memo = str(r.get("memo") or r.get("memo_raw") or r.get("memo_clean") or "")
-        date = str(r.get("date") or "")
-        amount = float(r.get("amount") or 0.0)
-        acct = str(r.get("account") or "")
-        src = str(r.get("source") or source)
-        date_key = _parse_date_key(date)
-        row_src_type = str(r.get("sourceType") or src_type_default or "bank")
-        disp = compute_display_amount(db=db, uid=uid, amount=amount, source_type=row_src_type, source=src, date=date, date_key=date_key)
-        docref = tcol.document()
-        batch.set(
-            docref,
+    status = _upload_status(autoClassify, rows)
+    bank_index, _ = await asyncio.gather(
+        BankMatchIndex.load_async(adb, uid, bank_match_keys(_display_rows(docs))),
+        upref.set(
             {
-                "date": date,
-                "dateKey": date_key,
-                "memo": memo,
-                "amount": amount,
-                "displayAmount": disp,
-                "account": acct,
-                "source": src,
-                "sourceType": row_src_type,
-                "uploadId": upload_id,
                 "fileName": file.filename,
+                "source": source,
+                "transactionCount": int(len(rows)),
+                "status": "saving",
+                "classifiedCount": 0,
                 "createdAt": fa_firestore.SERVER_TIMESTAMP,
+                "updatedAt": fa_firestore.SERVER_TIMESTAMP,
             },
-        )
-        created.append({"id": docref.id, "memo": memo, "amount": amount, "source": src})
-    batch.commit()
-    if autoClassify and created:
-        from utils.clean_vendor_name import clean_vendor_name
-        from utils.classify_transaction import finalize_classification, record_learning
-        allowed = _server_allowed_accounts()
-        batch2 = db.batch()
-        for it in created:
-            vendor_key = clean_vendor_name(it["memo"]).lower()
-            account, via = finalize_classification(db=db, uid=uid, vendor_key=vendor_key, memo=it["memo"], amount=float(it["amount"] or 0.0), source=str(it["source"] or ""), allowed_accounts=allowed)
-            record_learning(db=db, vendor_key=vendor_key, account=account, uid=uid)
-            try:
-                batch2.update(tcol.document(it["id"]), {"account": account, "classificationSource": via})
-            except Exception:
-                pass
-        try:
-            batch2.commit()
-        except Exception:
-            pass
+        ),
+    )
+    staged = await _save_upload_rows(adb, uref, upref, docs, bank_index, file.filename, status)
+    await run_in_threadpool(pair_or_defer, db, uid, list(staged), staged)
+    if status == "classifying":
+        classification_pipeline.submit(db, uid, upload_id)
     return {
         "ok": True,
         "uploadId": upload_id,
         "fileName": file.filename,
         "source": source,
-        "transactionCount": len(rows or []),
+        "transactionCount": len(rows),
         "autoClassified": bool(autoClassify),
+        "status": status,
     }
 
 @app.post("/replace-upload")
@@ -306,83 +382,56 @@ async def replace_upload(
     autoClassify: bool = Query(True),
 ):
     decoded = _verify_and_decode(authorization)
-    db = _db()
-    _touch_user_profile(db, decoded["uid"], decoded.get("email"))
     uid = decoded["uid"]
-    pdf_bytes = await file.read()
-    rows, meta = extract_transactions_from_bytes(pdf_bytes)
-    source = str(meta.get("source_account") or meta.get("source") or "Unknown")
-    src_type_default = str(meta.get("source_type") or meta.get("source_kind") or "").lower().strip() or "bank"
-    uref = db.collection("users").document(uid)
+    db = _db()
+    adb = _adb()
+    uref = adb.collection("users").document(uid)
     upref = uref.collection("uploads").document(uploadId)
-    if not upref.get().exists:
+    pdf_bytes = await file.read()
+    (rows, meta), existing, _ = await asyncio.gather(
+        run_in_threadpool(extract_transactions_from_bytes, pdf_bytes),
+        upref.get(),
+        touch_user_profile_async(adb, uid, decoded.get("email")),
+    )
+    if not existing.exists:
         raise HTTPException(status_code=404, detail="Upload not found")
-    _delete_query(uref.collection("transactions").where("uploadId", "==", uploadId))
-    created: List[Dict[str, Any]] = []
-    batch = db.batch()
-    tcol = uref.collection("transactions")
-    for r in rows or []:
-        memo = str(r.get("memo") or r.get("memo_raw") or r.get("memo_clean") or "")
-        date = str(r.get("date") or "")
-        amount = float(r.get("amount") or 0.0)
-        acct = str(r.get("account") or "")
-        src = str(r.get("source") or source)
-        date_key = _parse_date_key(date)
-        row_src_type = str(r.get("sourceType") or src_type_default or "bank")
-        disp = compute_display_amount(db=db, uid=uid, amount=amount, source_type=row_src_type, source=src, date=date, date_key=date_key)
-        docref = tcol.document()
-        batch.set(
-            docref,
+    rows = rows or []
+    source, src_type_default = _upload_meta(meta)
+    docs = _upload_row_docs(rows, source, src_type_default)
+    status = _upload_status(autoClassify, rows)
+    bank_index, _ = await asyncio.gather(
+        BankMatchIndex.load_async(adb, uid, bank_match_keys(_display_rows(docs)), exclude_upload=uploadId),
+        upref.update(
             {
-                "date": date,
-                "dateKey": date_key,
-                "memo": memo,
-                "amount": amount,
-                "displayAmount": disp,
-                "account": acct,
-                "source": src,
-                "sourceType": row_src_type,
-                "uploadId": uploadId,
                 "fileName": file.filename,
-                "createdAt": fa_firestore.SERVER_TIMESTAMP,
+                "source": source,
+                "transactionCount": int(len(rows)),
+                "status": "saving",
+                "classifiedCount": 0,
+                "classifyCursor": fa_firestore.DELETE_FIELD,
+                # a run still classifying the old rows sees the new run number and stops
+                "classifyRun": fa_firestore.Increment(1),
+                "classifyOwner": fa_firestore.DELETE_FIELD,
+                "classifyLeaseUntil": fa_firestore.DELETE_FIELD,
+                "classifyError": fa_firestore.DELETE_FIELD,
+                "updatedAt": fa_firestore.SERVER_TIMESTAMP,
             },
-        )
-        created.append({"id": docref.id, "memo": memo, "amount": amount, "source": src})
-    batch.update(
-        upref,
-        {
-            "fileName": file.filename,
-            "source": source,
-            "transactionCount": int(len(rows or [])),
-            "status": "ready",
-            "updatedAt": fa_firestore.SERVER_TIMESTAMP,
-        },
+        ),
     )
-    batch.commit()
-    if autoClassify and created:
-        from utils.clean_vendor_name import clean_vendor_name
-        from utils.classify_transaction import finalize_classification, record_learning
-        allowed = _server_allowed_accounts()
-        batch2 = db.batch()
-        for it in created:
-            vendor_key = clean_vendor_name(it["memo"]).lower()
-            account, via = finalize_classification(db=db, uid=uid, vendor_key=vendor_key, memo=it["memo"], amount=float(it["amount"] or 0.0), source=str(it["source"] or ""), allowed_accounts=allowed)
-            record_learning(db=db, vendor_key=vendor_key, account=account, uid=uid)
-            try:
-                batch2.update(tcol.document(it["id"]), {"account": account, "classificationSource": via})
-            except Exception:
-                pass
-        try:
-            batch2.commit()
-        except Exception:
-            pass
+    old_rows = db.collection("users").document(uid).collection("transactions").where("uploadId", "==", uploadId)
+    await run_in_threadpool(_delete_query, old_rows, uid)
+    staged = await _save_upload_rows(adb, uref, upref, docs, bank_index, file.filename, status)
+    await run_in_threadpool(pair_or_defer, db, uid, list(staged), staged)
+    if status == "classifying":
+        classification_pipeline.submit(db, uid, uploadId)
     return {
         "ok": True,
         "uploadId": uploadId,
         "fileName": file.filename,
         "source": source,
-        "transactionCount": len(rows or []),
+        "transactionCount": len(rows),
         "autoClassified": bool(autoClassify),
+        "status": status,
     }
 
 def _sq_base() -> str:
@@ -549,15 +598,20 @@ async def square_webhook(request: Request):
                     },
                     merge=True,
                 )
+                bump_version(db, target_uid)
     return {"ok": True}
 
 @app.get("/billing/status")
-def billing_status(authorization: str = Header(None)):
+async def billing_status(request: Request, response: Response, authorization: str = Header(None)):
     decoded = _verify_and_decode(authorization)
     uid = decoded["uid"]
-    db = _db()
-    ref = db.collection("users").document(uid).collection("billing").document("status")
-    doc = ref.get()
+    adb = _adb()
+    etag, not_modified = await conditional_async(adb, uid, request.headers.get("if-none-match"), "billing/status")
+    if not_modified:
+        return not_modified
+    set_etag(response, etag)
+    ref = adb.collection("users").document(uid).collection("billing").document("status")
+    doc = await ref.get()
     if not doc.exists:
         return {"status": "none"}
     return doc.to_dict() or {"status": "none"}
@@ -572,41 +626,19 @@ def bulk_reclassify(authorization: str = Header(None), body: Dict[str, Any] = Bo
     fps = list(body.get("fingerprints") or [])
     if not account or (not uids and not fps):
         raise HTTPException(status_code=400, detail="Missing input")
-    uref = db.collection("users").document(uid)
-    tcol = uref.collection("transactions")
-    updated = 0
-    if uids:
-        batch = db.batch()
-        for txid in uids:
-            try:
-                docref = tcol.document(str(txid))
-                if docref.get().exists:
-                    batch.update(docref, {"account": account, "updatedAt": fa_firestore.SERVER_TIMESTAMP})
-                    updated += 1
-            except Exception:
-                pass
-        try:
-            batch.commit()
-        except Exception:
-            pass
-    for fp in fps:
-        try:
-            date = str(fp.get("date") or "")
-            memo = str(fp.get("memo") or "")
-            amount = float(fp.get("amount") or 0.0)
-            q = tcol.where("date", "==", date).where("amount", "==", amount).where("memo", "==", memo)
-            docs = list(q.stream())
-            if docs:
-                batch2 = db.batch()
-                for d in docs:
-                    batch2.update(d.reference, {"account": account, "updatedAt": fa_firestore.SERVER_TIMESTAMP})
-                try:
-                    batch2.commit()
-                    updated += len(docs)
-                except Exception:
-                    pass
-        except Exception:
-            pass
+    tcol = db.collection("users").document(uid).collection("transactions")
+    targets = {s.id: s for s in existing_rows(db, tcol, uids, AGGREGATE_FIELDS)}
+    for s in rows_by_fingerprint(tcol, fps, AGGREGATE_FIELDS):
+        targets.setdefault(s.id, s)
+    writes = AggregatedWrites(db, db.collection("users").document(uid))
+    for s in targets.values():
+        writes.update(s.reference, {"account": account, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, old=s.to_dict())
+    res = writes.commit()
+    updated = res.committed_ops
+    if updated:
+        bump_version(db, uid)
+    if not res.ok:
+        raise HTTPException(status_code=502, detail=f"Updated {updated} of {len(targets)} transactions; retry the rest")
     return {"ok": True, "updated": int(updated)}
 
 @app.post("/vendors/train-bulk")
@@ -618,7 +650,8 @@ def vendors_train_bulk(authorization: str = Header(None), body: Dict[str, Any] =
     if not pairs:
         raise HTTPException(status_code=400, detail="No pairs")
     from utils.clean_vendor_name import clean_vendor_name
-    from utils.classify_transaction import record_learning
+    from utils.classify_transaction import LearningBatch, record_learning_batch
+    learning = LearningBatch()
     count = 0
     for p in pairs:
         memo = str((p or {}).get("memo") or "")
@@ -626,9 +659,7 @@ def vendors_train_bulk(authorization: str = Header(None), body: Dict[str, Any] =
         if not memo or not account:
             continue
         key = clean_vendor_name(memo).lower()
-        try:
-            record_learning(db=db, vendor_key=key, account=account, uid=uid)
-            count += 1
-        except Exception:
-            pass
+        learning.add(key, account, uid)
+        count += 1
+    record_learning_batch(db, learning)
     return {"ok": True, "trained": int(count)}
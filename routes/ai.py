@@ -1,32 +1,45 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 from fastapi import APIRouter, Body, Depends, HTTPException, status
 from .security import require_auth
-import os, json, urllib.request
+from utils.embeddings import embedding_service, EmbeddingError
+import os
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
-def _post_json(url: str, body: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers=headers, method="POST")
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+MAX_BATCH_TEXTS = 2048
 
-@router.post("/embedding")
-def embedding(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(require_auth)):
-    text = str(payload.get("text") or "")
+def _api_key() -> str:
     key = os.environ.get("OPENAI_API_KEY", "").strip()
     if not key:
         raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED)
-    if not text:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
-    url = "https://api.openai.com/v1/embeddings"
-    body = {"model": "text-embedding-3-small", "input": text}
-    headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json", "Accept": "application/json"}
+    return key
+
+async def _embed(texts: List[str]):
     try:
-        data = _post_json(url, body, headers)
-    except Exception:
+        return await embedding_service.embed(_api_key(), texts)
+    except EmbeddingError:
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY)
-    arr = (data.get("data") or [])
-    if not arr:
+
+@router.post("/embedding")
+async def embedding(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(require_auth)):
+    text = str(payload.get("text") or "")
+    _api_key()
+    if not text:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+    vecs, _ = await _embed([text])
+    vec = vecs[0] if vecs else []
+    if not vec:
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY)
-    vec = arr[0].get("embedding") or []
     return {"ok": True, "embedding": vec, "dims": len(vec)}
+
+@router.post("/embeddings")
+async def embeddings(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(require_auth)):
+    raw = payload.get("texts")
+    _api_key()
+    if not isinstance(raw, list) or not raw or len(raw) > MAX_BATCH_TEXTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+    texts = [str(t or "") for t in raw]
+    if not all(texts):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+    vecs, cached = await _embed(texts)
+    return {"ok": True, "embeddings": vecs, "dims": len(vecs[0]) if vecs else 0, "cached": int(cached)}
@@ -0,0 +1,158 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from datetime import date
+import io, itertools
+import pandas as pd
+from google.api_core import exceptions as gexc
+import storage
+from .security import require_auth
+from utils.ledger import LEDGER_FIELDS, frame as ledger_frame, postings
+from utils.pagination import MISSING_INDEX_DETAIL, iter_transactions, to_date_key
+from utils.snapshot import SNAPSHOT_FIELDS, frame as snapshot_frame
+from utils.streaming import peeked, stream_bytes
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FORMATS = ("csv", "parquet")
+_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "parquet": "application/vnd.apache.parquet"}
+# Spreadsheet apps evaluate cells starting with these; text cells get a leading quote.
+_FORMULA_PREFIX = r"^([=+\-@\t\r])"
+
+def _db():
+    return storage.client()
+
+def _pages(snaps: Iterable[Any], size: int = EXPORT_PAGE_SIZE) -> Iterator[List[Any]]:
+    it = iter(snaps)
+    while True:
+        page = list(itertools.islice(it, size))
+        if not page:
+            return
+        yield page
+
+def _csv(frames: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    # BOM so Excel opens the file as UTF-8
+    yield b"\xef\xbb\xbf"
+    header = True
+    for df in frames:
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].astype("string").str.replace(_FORMULA_PREFIX, r"'\1", regex=True)
+        buf = io.StringIO()
+        df.to_csv(buf, header=header, index=False, lineterminator="\r\n")
+        header = False
+        yield buf.getvalue().encode("utf-8")
+
+class _Sink:
+    """Write-only file for ParquetWriter whose bytes are drained after each row group."""
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        b = bytes(data)
+        self.buf += b
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = bytes(self.buf)
+        self.buf.clear()
+        return out
+
+def _parquet(frames: Iterable[pd.DataFrame], empty: pd.DataFrame) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _Sink()
+    writer = None
+    for df in frames:
+        if df.empty:
+            continue
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression="zstd")
+        writer.write_table(table.cast(writer.schema))
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.Table.from_pandas(empty, preserve_index=False).schema, compression="zstd")
+    writer.close()
+    yield sink.drain()
+
+def _download(frames: Iterable[pd.DataFrame], empty: pd.DataFrame, fmt: str, name: str, start_key: str, end_key: str) -> Any:
+    span = f"{start_key or 'start'}-{end_key or date.today().strftime('%Y%m%d')}"
+    try:
+        # run the first page now so a missing index is a status code, not a truncated download
+        frames = peeked(frames)
+    except gexc.FailedPrecondition:
+        raise HTTPException(status_code=503, detail=MISSING_INDEX_DETAIL)
+    chunks = _csv(frames) if fmt == "csv" else _parquet(frames, empty)
+    return stream_bytes(chunks, _MEDIA_TYPES[fmt], f"{name}-{span}.{fmt}", {"Cache-Control": "private, no-store"})
+
+def _filters(fmt: str, start: Optional[str], end: Optional[str]) -> Dict[str, str]:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or parquet")
+    try:
+        return {"start_key": to_date_key(start), "end_key": to_date_key(end)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _tcol(user: Dict[str, Any]) -> Any:
+    return _db().collection("users").document(str(user.get("uid") or "")).collection("transactions")
+
+@router.get("/transactions")
+def export_transactions(
+    fmt: str = Query("csv", alias="format"),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    source: Optional[str] = Query(None),
+    sourceType: Optional[str] = Query(None),
+    account: Optional[str] = Query(None),
+    user: Dict[str, Any] = Depends(require_auth),
+):
+    """Every matching transaction in date order, streamed one keyset page at a time."""
+    fmt = fmt.strip().lower()
+    keys = _filters(fmt, start, end)
+    snaps = iter_transactions(
+        _tcol(user), page_size=EXPORT_PAGE_SIZE, fields=list(SNAPSHOT_FIELDS),
+        source=(source or "").strip(), source_type=(sourceType or "").strip().lower(), account=(account or "").strip(), **keys,
+    )
+    frames = (snapshot_frame((s.id, s.to_dict() or {}) for s in page) for page in _pages(snaps))
+    return _download(frames, snapshot_frame([]), fmt, "transactions", keys["start_key"], keys["end_key"])
+
+@router.get("/journal")
+def export_journal(
+    fmt: str = Query("csv", alias="format"),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    source: Optional[str] = Query(None),
+    sourceType: Optional[str] = Query(None),
+    account: Optional[str] = Query(None),
+    user: Dict[str, Any] = Depends(require_auth),
+):
+    """Debit/credit lines in date order; ``account`` keeps the lines posted to that account on either side."""
+    fmt = fmt.strip().lower()
+    keys = _filters(fmt, start, end)
+    acct = (account or "").strip()
+    snaps = iter_transactions(
+        _tcol(user), page_size=EXPORT_PAGE_SIZE, fields=list(LEDGER_FIELDS),
+        source=(source or "").strip(), source_type=(sourceType or "").strip().lower(), **keys,
+    )
+
+    def frames() -> Iterator[pd.DataFrame]:
+        for page in _pages(snaps):
+            lines = postings(ledger_frame((s.id, s.to_dict() or {}) for s in page))
+            yield lines[(lines["account"] == acct).to_numpy()] if acct else lines
+
+    return _download(frames(), postings(ledger_frame([])), fmt, "journal", keys["start_key"], keys["end_key"])
@@ -1,6 +1,11 @@
-from typing import Dict, Any, List
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+import storage
 from .security import require_auth
+from utils.chart_of_accounts import chart_for_user
+from utils.data_version import check_etag, read_version, set_etag
+from utils.ledger import iter_records, ledger_for, line_records
+from utils.streaming import STREAM_FORMATS, stream_rows
 
 router = APIRouter(prefix="/journal", tags=["journal"])
 
@@ -49,3 +54,53 @@ def entries(body: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(req
         lines.append(debit_line)
         lines.append(credit_line)
     return {"ok": True, "entries": lines}
+
+def _db():
+    return storage.client()
+
+def _ledger(request: Request, uid: str, *parts: str):
+    db = _db()
+    version = read_version(db, uid)
+    chart = chart_for_user(db, uid)
+    etag, not_modified = check_etag(version, request.headers.get("if-none-match"), chart.fingerprint, *parts)
+    if not_modified:
+        return etag, not_modified, None
+    return etag, None, ledger_for(db, uid, version, chart)
+
+@router.get("/ledger")
+def ledger(
+    request: Request,
+    response: Response,
+    account: Optional[str] = Query(None),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    stream: Optional[str] = Query(None),
+    user: Dict[str, Any] = Depends(require_auth),
+):
+    """General ledger lines with running balances per account, built from stored transactions."""
+    fmt = (stream or "").strip().lower()
+    if fmt and fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream must be ndjson or json")
+    uid = str(user.get("uid") or "")
+    acct = (account or "").strip()
+    etag, not_modified, book = _ledger(request, uid, "journal/ledger", acct, fmt, "" if fmt else f"{cursor}:{limit}")
+    if not_modified:
+        return not_modified
+    lines = book.for_account(acct)
+    if fmt:
+        out = stream_rows(iter_records(lines), fmt, "lines")
+        set_etag(out, etag)
+        return out
+    set_etag(response, etag)
+    page = line_records(lines, cursor, cursor + limit)
+    nxt = cursor + len(page)
+    return {"ok": True, "lines": page, "total": len(lines), "nextCursor": nxt if nxt < len(lines) else None}
+
+@router.get("/trial-balance")
+def trial_balance(request: Request, response: Response, user: Dict[str, Any] = Depends(require_auth)):
+    uid = str(user.get("uid") or "")
+    etag, not_modified, book = _ledger(request, uid, "journal/trial-balance")
+    if not_modified:
+        return not_modified
+    set_etag(response, etag)
+    return {"ok": True, **book.trial_balance()}
@@ -1,21 +1,18 @@
 from typing import Dict, Any, Optional, List
-import os, base64
+import os, base64, asyncio, logging
 from datetime import datetime
-from fastapi import APIRouter, Body, HTTPException, Depends
-from firebase_admin import firestore as fa_firestore, credentials, initialize_app, get_app
+from fastapi import APIRouter, Body, HTTPException, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from firebase_admin import firestore as fa_firestore
+import storage
 from .security import require_auth
-
-def _init_firebase_once():
-    try:
-        get_app()
-    except ValueError:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH", "/etc/secrets/firebase-service-account.json")
-        cred = credentials.Certificate(cred_path)
-        initialize_app(cred)
+from utils.async_store import async_db, stream_all, get_all, commit_chunks_async
 
 def _db():
-    _init_firebase_once()
-    return fa_firestore.client()
+    return storage.client()
+
+def _adb():
+    return async_db()
 
 try:
     from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -65,43 +62,16 @@ def _decrypt_to_str(enc: Dict[str, Any]) -> str:
     return pt.decode("utf-8")
 
 from utils.clean_vendor_name import clean_vendor_name
-from utils.classify_transaction import finalize_classification, record_learning
-from utils.display_amount import compute_display_amount
-from utils.transfer_pairing import pair_on_ingest
+from utils.classify_transaction import finalize_classification, LearningBatch, record_learning_batch, prefetch_vendor_memory_async
+from utils.display_amount import compute_display_amount, BankMatchIndex
+from utils.transfer_pairing import pair_or_defer
+from utils.deletion import ROW_FIELDS, delete_matching, delete_snapshots
+from utils.aggregates import AGGREGATE_FIELDS, AggregatedWrites
+from utils.fingerprints import lookup_fields
+from utils.data_version import conditional_async, set_etag, bump_version
+from utils.chart_of_accounts import chart_for_user
 
-def _server_allowed_accounts() -> List[str]:
-    import json
-    raw = os.environ.get("ALLOWED_ACCOUNTS_JSON", "").strip()
-    if raw:
-        try:
-            arr = json.loads(raw)
-            if isinstance(arr, list):
-                return [str(x) for x in arr if x]
-        except Exception:
-            pass
-    return [
-        "1000 - Checking Account","1010 - Savings Account","1020 - Petty Cash",
-        "1030 - Accounts Receivable","1050 - Inventory","1060 - Fixed Assets",
-        "1070 - Accumulated Depreciation","2000 - Accounts Payable","2010 - Credit Card Payables",
-        "2040 - Loan Payable","2020 - Payroll Liabilities","2030 - Sales Tax Payable",
-        "3000 - Contributions","3010 - Draws","3020 - Retained Earnings",
-        "4000 - Product Sales","4010 - Service Income","4020 - Subscription Revenue",
-        "4030 - Consulting Income","4040 - Other Revenue","4090 - Refunds and Discounts",
-        "5000 - Inventory Purchases","5010 - Subcontracted Labor","5020 - Packaging & Shipping Supplies",
-        "5030 - Merchant Fees",
-        "6000 - Salaries and Wages","6010 - Payroll Taxes","6020 - Employee Benefits",
-        "6030 - Independent Contractors","6040 - Bonuses & Commissions","6050 - Workers Compensation Insurance",
-        "6060 - Recruiting & Hiring","6100 - Rent or Lease Expense","6110 - Utilities","6120 - Insurance",
-        "6130 - Repairs & Maintenance","6140 - Office Supplies","6150 - Telephone & Internet",
-        "6200 - Advertising & Promotion","6210 - Social Media & Digital Ads",
-        "6220 - Meals & Entertainment","6230 - Client Gifts",
-        "6300 - Software Subscriptions","6310 - Bank Fees","6320 - Dues & Licenses","6330 - Postage & Delivery",
-        "6340 - Interest Expense",
-        "6400 - Legal Fees","6410 - Accounting & Bookkeeping","6420 - Consulting Fees","6430 - Tax Prep & Advisory",
-        "6500 - Travel - Airfare","6510 - Travel - Lodging","6520 - Travel - Meals","6530 - Travel - Other (Taxis, Parking)",
-        "8000 - State Income Tax","8010 - Franchise Tax","8020 - Local Business Taxes","8030 - Estimated Tax Payments",
-        "7090 - Uncategorized Expense",
-    ]
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/plaid", tags=["plaid"])
 
@@ -112,6 +82,17 @@ def _mmddyyyy(iso_date: str) -> str:
     except Exception:
         return iso_date
 
+def _item_tx_queries(uref: Any, item_id: str) -> List[Any]:
+    tcol = uref.collection("transactions")
+    start = f"plaid:{item_id}"; end = f"plaid:{item_id}:\uf8ff"
+    return [tcol.where("itemId", "==", item_id), tcol.where("uploadId", ">=", start).where("uploadId", "<=", end)]
+
+def _plaid_date_key(tx: Dict[str, Any]) -> str:
+    try:
+        return datetime.strptime(str(tx.get("date") or ""), "%Y-%m-%d").strftime("%Y%m%d")
+    except Exception:
+        return ""
+
 def _plaid_client():
     from plaid.api import plaid_api
     from plaid import Configuration, ApiClient
@@ -193,14 +174,19 @@ def exchange_public_token(payload: Dict[str, Any] = Body(...), user: Dict[str, A
     else:
         doc["access_token"] = access_token
     db.collection("users").document(uid).collection("plaid_items").document(item_id).set(doc, merge=True)
+    bump_version(db, uid)
     return {"ok": True, "item_id": item_id}
 
 @router.get("/items")
-def list_items(user: Dict[str, Any] = Depends(require_auth)):
-    db = _db()
+async def list_items(request: Request, response: Response, user: Dict[str, Any] = Depends(require_auth)):
+    adb = _adb()
     uid = str(user.get("uid") or "")
+    etag, not_modified = await conditional_async(adb, uid, request.headers.get("if-none-match"), "plaid/items")
+    if not_modified:
+        return not_modified
+    set_etag(response, etag)
     items = []
-    for d in db.collection("users").document(uid).collection("plaid_items").stream():
+    for d in await stream_all(adb.collection("users").document(uid).collection("plaid_items")):
         rec = d.to_dict() or {}
         items.append({
             "item_id": d.id,
@@ -210,21 +196,68 @@ def list_items(user: Dict[str, Any] = Depends(require_auth)):
         })
     return {"ok": True, "items": items}
 
+def _plaid_row(tx: Dict[str, Any], item_id: str, acct_map: Dict[str, str], acct_type_map: Dict[str, str], new: bool) -> Optional[Dict[str, Any]]:
+    plaid_tx_id = str(tx.get("transaction_id") or "")
+    if not plaid_tx_id:
+        return None
+    acc_id = str(tx.get("account_id") or "")
+    memo = str(tx.get("name") or tx.get("merchant_name") or tx.get("authorized_description") or tx.get("original_description") or "").strip()
+    amount = float(tx.get("amount") or 0.0)
+    date = _mmddyyyy(str(tx.get("date") or ""))
+    row = {"plaidTxId": plaid_tx_id, "plaidAccountId": acc_id, "itemId": item_id, "date": date, "dateKey": _plaid_date_key(tx), "memo": memo, "amount": amount, "source": acct_map.get(acc_id) or "Plaid Account", "sourceType": acct_type_map.get(acc_id, "bank"), **lookup_fields({"date": date, "memo": memo, "amount": amount}), "updatedAt": fa_firestore.SERVER_TIMESTAMP}
+    if new:
+        row.update({"uploadId": f"plaid:{item_id}", "fileName": "Plaid", "createdAt": fa_firestore.SERVER_TIMESTAMP})
+    return row
+
+async def _stored_rows(adb: Any, tcol: Any, item_id: str, rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate inputs and pairId of the rows a sync page is about to overwrite, keyed by doc id."""
+    refs = [tcol.document(f"plaid:{item_id}:{r['plaidTxId']}") for r in rows]
+    pages = await asyncio.gather(*(get_all(adb, refs[i:i + 300], field_paths=[*AGGREGATE_FIELDS, "pairId"]) for i in range(0, len(refs), 300)))
+    return {s.id: s.to_dict() or {} for page in pages for s in page if s.exists}
+
+def _stage_plaid_rows(db: Any, uid: str, writes: AggregatedWrites, tcol: Any, item_id: str, rows: List[Dict[str, Any]], stored: Dict[str, Dict[str, Any]], bank_index: BankMatchIndex, allowed: Any, learning: LearningBatch, user_mem: Dict[str, str], global_mem: Dict[str, str]) -> None:
+    for row in rows:
+        memo, amount, src, src_type = row["memo"], row["amount"], row["source"], row["sourceType"]
+        disp = compute_display_amount(db=db, uid=uid, amount=amount, source_type=src_type, source=src, date=row["date"], date_key=row["dateKey"], bank_index=bank_index)
+        vendor_key = clean_vendor_name(memo).lower()
+        account, via = finalize_classification(db=db, uid=uid, vendor_key=vendor_key, memo=memo, amount=amount, source=src, allowed_accounts=allowed, user_mem_cache=user_mem, global_mem_cache=global_mem)
+        learning.add(vendor_key, account, uid)
+        doc_id = f"plaid:{item_id}:{row['plaidTxId']}"
+        writes.set(tcol.document(doc_id), {**row, "displayAmount": disp, "account": account, "classificationSource": via}, merge=True, old=stored.get(doc_id))
+
+def _pair_and_remove(db: Any, uid: str, item_id: str, pairing: Dict[str, Dict[str, Any]], removed: List[Dict[str, Any]]) -> int:
+    pair_or_defer(db, uid, list(pairing), pairing)
+    if not removed:
+        return 0
+    tcol = db.collection("users").document(uid).collection("transactions")
+    rm_refs = [tcol.document(f"plaid:{item_id}:{r.get('transaction_id')}") for r in removed if r.get("transaction_id")]
+    rm_snaps = [s for s in db.get_all(rm_refs, field_paths=list(ROW_FIELDS)) if s.exists]
+    return delete_snapshots(db, rm_snaps, uid=uid).deleted
+
+def _finish_sync(db: Any, uid: str, learning: LearningBatch) -> None:
+    record_learning_batch(db, learning)
+    bump_version(db, uid)
+
 @router.post("/sync")
-def sync_transactions(user: Dict[str, Any] = Depends(require_auth)):
+async def sync_transactions(user: Dict[str, Any] = Depends(require_auth)):
     from plaid.model.accounts_get_request import AccountsGetRequest
     from plaid.model.transactions_sync_request import TransactionsSyncRequest
     client = _plaid_client()
     db = _db()
+    adb = _adb()
     uid = str(user.get("uid") or "")
-    uref = db.collection("users").document(uid)
-    items = list(uref.collection("plaid_items").stream())
+    auref = adb.collection("users").document(uid)
+    items, allowed = await asyncio.gather(
+        stream_all(auref.collection("plaid_items")),
+        run_in_threadpool(chart_for_user, db, uid),
+    )
     if not items:
         return {"ok": True, "synced": 0, "modified": 0, "removed": 0}
     total_added = 0
     total_modified = 0
     total_removed = 0
-    allowed = _server_allowed_accounts()
+    learning = LearningBatch()
+    failed: List[Dict[str, Any]] = []
     for d in items:
         rec = d.to_dict() or {}
         try:
@@ -235,7 +268,7 @@ def sync_transactions(user: Dict[str, Any] = Depends(require_auth)):
         if not access_token:
             continue
         new_cursor = rec.get("cursor") or None
-        accounts = client.accounts_get(AccountsGetRequest(access_token=access_token)).to_dict()
+        accounts = (await run_in_threadpool(client.accounts_get, AccountsGetRequest(access_token=access_token))).to_dict()
         acct_map: Dict[str, str] = {}
         acct_type_map: Dict[str, str] = {}
         for a in accounts.get("accounts") or []:
@@ -251,99 +284,53 @@ def sync_transactions(user: Dict[str, Any] = Depends(require_auth)):
             else:
                 acct_type_map[acc_id] = "bank"
         has_more = True
+        page = 0
         while has_more:
+            page += 1
             req_kwargs = {"access_token": access_token}
             if isinstance(new_cursor, str) and new_cursor:
                 req_kwargs["cursor"] = new_cursor
-            resp = client.transactions_sync(TransactionsSyncRequest(**req_kwargs)).to_dict()
-            new_cursor = resp.get("next_cursor") or new_cursor
-            has_more = bool(resp.get("has_more"))
+            resp = (await run_in_threadpool(client.transactions_sync, TransactionsSyncRequest(**req_kwargs))).to_dict()
             added = resp.get("added") or []
             modified = resp.get("modified") or []
             removed = resp.get("removed") or []
-            if added:
-                batch = db.batch()
-                classify = db.batch()
-                for tx in added:
-                    plaid_tx_id = str(tx.get("transaction_id") or "")
-                    if not plaid_tx_id:
-                        continue
-                    acc_id = str(tx.get("account_id") or "")
-                    src = acct_map.get(acc_id) or "Plaid Account"
-                    src_type = acct_type_map.get(acc_id, "bank")
-                    memo = str(tx.get("name") or tx.get("merchant_name") or tx.get("authorized_description") or tx.get("original_description") or "").strip()
-                    amount = float(tx.get("amount") or 0.0)
-                    date = _mmddyyyy(str(tx.get("date") or ""))
-                    date_key = date.replace("/", "")
-                    disp = compute_display_amount(db=db, uid=uid, amount=amount, source_type=src_type, source=src, date=date, date_key=date_key)
-                    doc_id = f"plaid:{d.id}:{plaid_tx_id}"
-                    docref = uref.collection("transactions").document(doc_id)
-                    batch.set(docref, {"plaidTxId": plaid_tx_id, "plaidAccountId": acc_id, "itemId": d.id, "date": date, "dateKey": date_key, "memo": memo, "amount": amount, "displayAmount": disp, "account": "", "source": src, "sourceType": src_type, "uploadId": f"plaid:{d.id}", "fileName": "Plaid", "createdAt": fa_firestore.SERVER_TIMESTAMP, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, merge=True)
-                    vendor_key = clean_vendor_name(memo).lower()
-                    account, via = finalize_classification(db=db, uid=uid, vendor_key=vendor_key, memo=memo, amount=amount, source=src, allowed_accounts=allowed)
-                    record_learning(db=db, vendor_key=vendor_key, account=account, uid=uid)
-                    classify.set(docref, {"account": account, "classificationSource": via}, merge=True)
-                try:
-                    batch.commit(); classify.commit()
-                except Exception:
-                    pass
-                try:
-                    for tx in added:
-                        plaid_tx_id = str(tx.get("transaction_id") or "")
-                        if plaid_tx_id:
-                            pair_on_ingest(db, uid, f"plaid:{d.id}:{plaid_tx_id}")
-                except Exception:
-                    pass
-                total_added += len(added)
-            if modified:
-                batch = db.batch()
-                classify = db.batch()
-                for tx in modified:
-                    plaid_tx_id = str(tx.get("transaction_id") or "")
-                    if not plaid_tx_id:
-                        continue
-                    acc_id = str(tx.get("account_id") or "")
-                    src = acct_map.get(acc_id) or "Plaid Account"
-                    src_type = acct_type_map.get(acc_id, "bank")
-                    memo = str(tx.get("name") or tx.get("merchant_name") or tx.get("authorized_description") or tx.get("original_description") or "").strip()
-                    amount = float(tx.get("amount") or 0.0)
-                    date = _mmddyyyy(str(tx.get("date") or ""))
-                    date_key = date.replace("/", "")
-                    disp = compute_display_amount(db=db, uid=uid, amount=amount, source_type=src_type, source=src, date=date, date_key=date_key)
-                    doc_id = f"plaid:{d.id}:{plaid_tx_id}"
-                    docref = uref.collection("transactions").document(doc_id)
-                    batch.set(docref, {"plaidTxId": plaid_tx_id, "plaidAccountId": acc_id, "itemId": d.id, "date": date, "dateKey": date_key, "memo": memo, "amount": amount, "displayAmount": disp, "source": src, "sourceType": src_type, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, merge=True)
-                    vendor_key = clean_vendor_name(memo).lower()
-                    account, via = finalize_classification(db=db, uid=uid, vendor_key=vendor_key, memo=memo, amount=amount, source=src, allowed_accounts=allowed)
-                    record_learning(db=db, vendor_key=vendor_key, account=account, uid=uid)
-                    classify.set(docref, {"account": account, "classificationSource": via}, merge=True)
-                try:
-                    batch.commit(); classify.commit()
-                except Exception:
-                    pass
-                try:
-                    for tx in modified:
-                        plaid_tx_id = str(tx.get("transaction_id") or "")
-                        if plaid_tx_id:
-                            pair_on_ingest(db, uid, f"plaid:{d.id}:{plaid_tx_id}")
-                except Exception:
-                    pass
-                total_modified += len(modified)
-            if removed:
-                batch = db.batch()
-                for r in removed:
-                    rid = str(r.get("transaction_id") or "")
-                    if not rid:
-                        continue
-                    doc_id = f"plaid:{d.id}:{rid}"
-                    batch.delete(uref.collection("transactions").document(doc_id))
-                try:
-                    batch.commit()
-                except Exception:
-                    pass
-                total_removed += len(removed)
-        uref.collection("plaid_items").document(d.id).set({"cursor": new_cursor, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, merge=True)
-    return {"ok": True, "synced": int(total_added), "modified": int(total_modified), "removed": int(total_removed)}
+            rows = [r for r in (_plaid_row(tx, d.id, acct_map, acct_type_map, True) for tx in added) if r]
+            rows += [r for r in (_plaid_row(tx, d.id, acct_map, acct_type_map, False) for tx in modified) if r]
+            stored: Dict[str, Dict[str, Any]] = {}
+            if rows:
+                tcol = auref.collection("transactions")
+                # bank-match window, vendor memory and the rows being replaced are independent reads
+                bank_index, (user_mem, global_mem), stored = await asyncio.gather(
+                    BankMatchIndex.load_async(adb, uid, [r["dateKey"] for r in rows if r["sourceType"] == "card" and r["amount"] < 0]),
+                    prefetch_vendor_memory_async(adb, uid, [clean_vendor_name(r["memo"]).lower() for r in rows]),
+                    _stored_rows(adb, tcol, d.id, rows),
+                )
+                writes = AggregatedWrites(adb, auref)
+                page_learning = LearningBatch()
+                await run_in_threadpool(_stage_plaid_rows, db, uid, writes, tcol, d.id, rows, stored, bank_index, allowed, page_learning, user_mem, global_mem)
+                res = await commit_chunks_async(adb, writes.take_chunks())
+                if not res.ok:
+                    # stop at the last committed page so the next sync replays this one
+                    logger.error("plaid sync for user %s item %s stopped at page %d: %s", uid, d.id, page, res.to_dict())
+                    failed.append({"itemId": d.id, "page": page, "committedOps": res.committed_ops})
+                    break
+                learning.merge(page_learning)
+            total_added += len(added)
+            total_modified += len(modified)
+            # rows were merged over the stored ones, so an existing pairId still applies
+            pairing = {doc_id: {**stored.get(doc_id, {}), **r} for doc_id, r in ((f"plaid:{d.id}:{r['plaidTxId']}", r) for r in rows)}
+            total_removed += await run_in_threadpool(_pair_and_remove, db, uid, d.id, pairing, removed)
+            new_cursor = resp.get("next_cursor") or new_cursor
+            has_more = bool(resp.get("has_more"))
+        await auref.collection("plaid_items").document(d.id).set({"cursor": new_cursor, "updatedAt": fa_firestore.SERVER_TIMESTAMP}, merge=True)
+    await run_in_threadpool(_finish_sync, db, uid, learning)
+    if failed and not (total_added or total_modified or total_removed):
+        raise HTTPException(status_code=502, detail="Sync failed before any page was saved; retry")
+    out = {"ok": True, "synced": int(total_added), "modified": int(total_modified), "removed": int(total_removed)}
+    if failed:
+        # the cursor stops at the failed page, so the next sync resumes there
+        out.update(partial=True, failed=failed)
+    return out
 
 @router.post("/clear-item-transactions")
 def clear_item_transactions(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(require_auth)):
@@ -352,39 +339,22 @@ def clear_item_transactions(payload: Dict[str, Any] = Body(...), user: Dict[str,
     item_id = str(payload.get("item_id") or "").strip()
     if not item_id:
         raise HTTPException(status_code=400, detail="missing item_id")
-    uref = db.collection("users").document(uid)
-    docs = list(uref.collection("transactions").where("itemId", "==", item_id).stream())
-    start = f"plaid:{item_id}"; end = f"plaid:{item_id}:\uf8ff"
-    docs += list(uref.collection("transactions").where("uploadId", ">=", start).where("uploadId", "<=", end).stream())
-    seen, uniq = set(), []
-    for d in docs:
-        if d.id in seen: continue
-        seen.add(d.id); uniq.append(d)
-    deleted = 0
-    while uniq:
-        batch = db.batch()
-        chunk = uniq[:450]
-        for d in chunk: batch.delete(d.reference)
-        try: batch.commit(); deleted += len(chunk)
-        except Exception: break
-        uniq = uniq[450:]
-    return {"ok": True, "deleted": int(deleted)}
+    res = delete_matching(db, _item_tx_queries(db.collection("users").document(uid), item_id), uid=uid)
+    bump_version(db, uid)
+    if not res.ok:
+        raise HTTPException(status_code=502, detail=res.detail())
+    return {"ok": True, "deleted": int(res.deleted)}
 
 @router.post("/clear-all-linked-transactions")
 def clear_all_linked_transactions(user: Dict[str, Any] = Depends(require_auth)):
     db = _db()
     uid = str(user.get("uid") or "")
-    uref = db.collection("users").document(uid)
-    docs = list(uref.collection("transactions").where("uploadId", ">=", "plaid:").where("uploadId", "<=", "plaid:\uf8ff").stream())
-    deleted = 0
-    while docs:
-        batch = db.batch()
-        chunk = docs[:450]
-        for d in chunk: batch.delete(d.reference)
-        try: batch.commit(); deleted += len(chunk)
-        except Exception: break
-        docs = docs[450:]
-    return {"ok": True, "deleted": int(deleted)}
+    tcol = db.collection("users").document(uid).collection("transactions")
+    res = delete_matching(db, [tcol.where("uploadId", ">=", "plaid:").where("uploadId", "<=", "plaid:\uf8ff")], uid=uid)
+    bump_version(db, uid)
+    if not res.ok:
+        raise HTTPException(status_code=502, detail=res.detail())
+    return {"ok": True, "deleted": int(res.deleted)}
 
 @router.post("/disconnect")
 def disconnect_item(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(require_auth)):
@@ -402,7 +372,7 @@ def disconnect_item(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] =
     targets: List[fa_firestore.DocumentSnapshot] = [snap] if snap.exists else list(uref.collection("plaid_items").where("item_id","==",item_id_in).stream())
     if not targets:
         return {"ok": True, "removed": False, "deletedTransactions": False}
-    removed_any = False; deleted_tx_total = 0
+    removed_any = False; deleted_tx_total = 0; failed_tx_total = 0
     for s in targets:
         rec = s.to_dict() or {}; doc_id = s.id
         try:
@@ -414,21 +384,11 @@ def disconnect_item(payload: Dict[str, Any] = Body(...), user: Dict[str, Any] =
         try: s.reference.delete()
         except Exception: pass
         if delete_tx:
-            q1 = uref.collection("transactions").where("itemId","==",doc_id)
-            docs = list(q1.stream())
-            start=f"plaid:{doc_id}"; end=f"plaid:{doc_id}:\uf8ff"
-            docs += list(uref.collection("transactions").where("uploadId",">=",start).where("uploadId","<=",end).stream())
-            seen=set(); uniq=[]
-            for d in docs:
-                if d.id in seen: continue
-                seen.add(d.id); uniq.append(d)
-            while uniq:
-                batch = db.batch()
-                chunk = uniq[:450]
-                for d in chunk: batch.delete(d.reference)
-                try: batch.commit(); deleted_tx_total += len(chunk)
-                except Exception: break
-                uniq = uniq[450:]
+            res = delete_matching(db, _item_tx_queries(uref, doc_id), uid=uid)
+            deleted_tx_total += res.deleted; failed_tx_total += res.failed
+    bump_version(db, uid)
+    if failed_tx_total:
+        raise HTTPException(status_code=502, detail=f"Deleted {deleted_tx_total} transactions; {failed_tx_total} could not be deleted")
     return {"ok": True, "removed": bool(removed_any), "deletedTransactions": bool(delete_tx), "deletedCount": int(deleted_tx_total)}
 
 @router.post("/dedupe")
@@ -437,23 +397,21 @@ def dedupe_plaid(user: Dict[str, Any] = Depends(require_auth)):
     uid = str(user.get("uid") or "")
     uref = db.collection("users").document(uid)
     tcol = uref.collection("transactions")
-    snaps = list(tcol.stream())
     by_txid: Dict[str, List[Any]] = {}
-    for s in snaps:
+    for s in tcol.select(["plaidTxId", *ROW_FIELDS]).stream():
         rec = s.to_dict() or {}
         txid = str(rec.get("plaidTxId") or "")
         if not txid:
             continue
         by_txid.setdefault(txid, []).append(s)
-    deleted = 0
+    dupes = []
     for txid, group in by_txid.items():
         if len(group) <= 1:
             continue
         group.sort(key=lambda s: (s.update_time, s.create_time))
-        keep = group[-1]
-        for s in group[:-1]:
-            try:
-                s.reference.delete(); deleted += 1
-            except Exception:
-                pass
-    return {"ok": True, "deleted": int(deleted)}
+        dupes.extend(group[:-1])
+    res = delete_snapshots(db, dupes, uid=uid)
+    bump_version(db, uid)
+    if not res.ok:
+        raise HTTPException(status_code=502, detail=res.detail())
+    return {"ok": True, "deleted": int(res.deleted)}
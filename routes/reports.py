@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, Optional
+import asyncio
+import storage
+from .security import require_auth
+from utils.aggregates import AGGREGATES, summarize
+from utils.async_store import async_db, stream_all
+from utils.chart_of_accounts import chart_for_user
+from utils.data_version import check_etag, read_version_async, set_etag
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+def _month(value: Optional[str], name: str) -> str:
+    if not value:
+        return ""
+    s = value.replace("-", "").strip()
+    if len(s) != 6 or not s.isdigit() or not 1 <= int(s[4:]) <= 12:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}; expected YYYY-MM")
+    return s
+
+@router.get("/summary")
+async def summary(
+    request: Request,
+    response: Response,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    user: Dict[str, Any] = Depends(require_auth),
+):
+    """P&L for the months in [from, to] and balances as of ``to``, from the monthly aggregate docs."""
+    uid = str(user.get("uid") or "")
+    start_m, end_m = _month(start, "from"), _month(end, "to")
+    if start_m and end_m and start_m > end_m:
+        raise HTTPException(status_code=400, detail="from is after to")
+    adb = async_db()
+    # sections come from the chart, which edits do not version, so it is part of the ETag
+    version, chart = await asyncio.gather(read_version_async(adb, uid), run_in_threadpool(chart_for_user, storage.client(), uid))
+    etag, not_modified = check_etag(version, request.headers.get("if-none-match"), chart.fingerprint, "reports/summary", start_m, end_m)
+    if not_modified:
+        return not_modified
+    snaps = await stream_all(adb.collection("users").document(uid).collection(AGGREGATES))
+    set_etag(response, etag)
+    out = summarize((s.to_dict() or {} for s in snaps), chart, start_m, end_m)
+    return {"ok": True, "from": start_m, "to": end_m, **out}
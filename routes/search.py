@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Any, Dict, Optional
+import storage
+from .security import require_auth
+from utils.data_version import check_etag, read_version, set_etag
+from utils.search_index import MAX_RESULTS, index_for
+
+router = APIRouter(prefix="/transactions", tags=["transactions"])
+
+def _db():
+    return storage.client()
+
+@router.get("/search")
+def search(
+    request: Request,
+    response: Response,
+    q: str = Query(""),
+    min_amount: Optional[float] = Query(None, alias="min"),
+    max_amount: Optional[float] = Query(None, alias="max"),
+    limit: int = Query(50, ge=1, le=MAX_RESULTS),
+    user: Dict[str, Any] = Depends(require_auth),
+):
+    """Transactions whose memo, vendor, account or source match every term of ``q`` as a prefix,
+    optionally within [min, max] of absolute amount."""
+    if not q.strip() and min_amount is None and max_amount is None:
+        raise HTTPException(status_code=400, detail="q, min or max is required")
+    if min_amount is not None and max_amount is not None and abs(min_amount) > abs(max_amount):
+        raise HTTPException(status_code=400, detail="min is greater than max")
+    uid = str(user.get("uid") or "")
+    db = _db()
+    version = read_version(db, uid)
+    etag, not_modified = check_etag(version, request.headers.get("if-none-match"), "transactions/search", request.url.query)
+    if not_modified:
+        return not_modified
+    rows, total = index_for(db, uid, version).search(q, min_amount, max_amount, limit)
+    set_etag(response, etag)
+    return {"ok": True, "transactions": rows, "total": total}
@@ -1,10 +1,12 @@
-import os
+import os, hashlib, threading, time
+from collections import OrderedDict
 from typing import List, Optional, Dict, Any
 from fastapi import Header, HTTPException, status, FastAPI
 from starlette.middleware.cors import CORSMiddleware
 import firebase_admin
 from firebase_admin import auth as firebase_auth
 from firebase_admin import get_app, initialize_app
+from firebase_admin import firestore as fa_firestore
 
 try:
     get_app()
@@ -34,23 +36,112 @@ def install_cors(app: FastAPI) -> None:
         max_age=86400,
     )
 
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000") or 10000)
+PROFILE_TOUCH_SECONDS = int(os.getenv("PROFILE_TOUCH_SECONDS", "900") or 900)
+_TOKEN_EXP_SKEW = 30
+
+class _TokenCache:
+    """Decoded ID tokens keyed by a hash of the token, kept until shortly before ``exp``."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: str, decoded: Dict[str, Any]) -> None:
+        try:
+            until = float(decoded.get("exp") or 0) - _TOKEN_EXP_SKEW
+        except Exception:
+            return
+        if until <= time.time():
+            return
+        with self._lock:
+            self._data[key] = (until, decoded)
+            self._data.move_to_end(key)
+            while len(self._data) > self._size:
+                self._data.popitem(last=False)
+
+_TOKENS = _TokenCache(TOKEN_CACHE_SIZE)
+_PROFILE_TOUCHED: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_PROFILE_LOCK = threading.Lock()
+
 def _bearer_token(authorization: Optional[str]) -> str:
     if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
     return authorization.split(" ", 1)[1].strip()
 
-def require_auth(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+def verify_bearer(authorization: Optional[str]) -> Dict[str, Any]:
+    """Decoded Firebase ID token for an ``Authorization: Bearer`` header; raises 401."""
+    token = _bearer_token(authorization)
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    decoded = _TOKENS.get(key)
+    if decoded is not None:
+        return decoded
     try:
-        token = _bearer_token(authorization)
         decoded = firebase_auth.verify_id_token(token, check_revoked=False)
-        return {"uid": decoded.get("uid"), "token": decoded}
     except Exception:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if not decoded.get("uid"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    _TOKENS.put(key, decoded)
+    return decoded
 
-def optional_auth(authorization: Optional[str] = Header(None)) -> Optional[Dict[str, Any]]:
+def _claim_profile_touch(uid: str, email: str) -> bool:
+    now = time.time()
+    with _PROFILE_LOCK:
+        last = _PROFILE_TOUCHED.get(uid)
+        if last and last[1] == email and now - last[0] < PROFILE_TOUCH_SECONDS:
+            return False
+        _PROFILE_TOUCHED[uid] = (now, email)
+        _PROFILE_TOUCHED.move_to_end(uid)
+        while len(_PROFILE_TOUCHED) > TOKEN_CACHE_SIZE:
+            _PROFILE_TOUCHED.popitem(last=False)
+    return True
+
+def _release_profile_touch(uid: str) -> None:
+    with _PROFILE_LOCK:
+        _PROFILE_TOUCHED.pop(uid, None)
+
+def _profile_doc(email: str) -> Dict[str, Any]:
+    return {"email": email, "createdAt": fa_firestore.SERVER_TIMESTAMP, "updatedAt": fa_firestore.SERVER_TIMESTAMP}
+
+def touch_user_profile(db: Any, uid: str, email: Optional[str]) -> None:
+    """Upsert the user's profile doc at most once per PROFILE_TOUCH_SECONDS (or on email change)."""
+    email = (email or "").lower()
+    if not _claim_profile_touch(uid, email):
+        return
     try:
-        token = _bearer_token(authorization)
-        decoded = firebase_auth.verify_id_token(token, check_revoked=False)
-        return {"uid": decoded.get("uid"), "token": decoded}
+        db.collection("users").document(uid).set(_profile_doc(email), merge=True)
+    except Exception:
+        _release_profile_touch(uid)
+
+async def touch_user_profile_async(adb: Any, uid: str, email: Optional[str]) -> None:
+    email = (email or "").lower()
+    if not _claim_profile_touch(uid, email):
+        return
+    try:
+        await adb.collection("users").document(uid).set(_profile_doc(email), merge=True)
     except Exception:
+        _release_profile_touch(uid)
+
+def require_auth(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+    decoded = verify_bearer(authorization)
+    return {"uid": decoded.get("uid"), "token": decoded}
+
+def optional_auth(authorization: Optional[str] = Header(None)) -> Optional[Dict[str, Any]]:
+    try:
+        decoded = verify_bearer(authorization)
+    except HTTPException:
         return None
+    return {"uid": decoded.get("uid"), "token": decoded}
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Any, Dict, Optional
+import storage
+from .security import require_auth
+from utils.change_log import changes_since, decode_token
+from utils.data_version import check_etag
+from utils.snapshot import MEDIA_TYPE, load_snapshot, read_manifest
+
+router = APIRouter(prefix="/transactions", tags=["transactions"])
+
+def _db():
+    return storage.client()
+
+@router.get("/changes")
+def changes(since: Optional[str] = Query(None), user: Dict[str, Any] = Depends(require_auth)):
+    uid = str(user.get("uid") or "")
+    try:
+        at = decode_token(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since token")
+    return {"ok": True, **changes_since(_db(), uid, at)}
+
+@router.get("/snapshot")
+def snapshot(request: Request, user: Dict[str, Any] = Depends(require_auth)):
+    """The user's full history as one Parquet file; replay /transactions/changes from the
+    X-Changes-Token header to catch up with writes made since it was built."""
+    uid = str(user.get("uid") or "")
+    db = _db()
+    manifest = read_manifest(db, uid)
+    if manifest is not None:
+        _, not_modified = check_etag(int(manifest.get("version") or 0), request.headers.get("if-none-match"), "transactions/snapshot", str(manifest.get("generation") or ""))
+        if not_modified:
+            not_modified.headers["X-Changes-Token"] = str(manifest.get("token") or "")
+            return not_modified
+    loaded = load_snapshot(db, uid)
+    if loaded is None:
+        raise HTTPException(status_code=503, detail="Snapshot is being rebuilt; retry shortly")
+    manifest, data = loaded
+    etag, _ = check_etag(int(manifest.get("version") or 0), None, "transactions/snapshot", str(manifest.get("generation") or ""))
+    return Response(content=data, media_type=MEDIA_TYPE, headers={
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "X-Changes-Token": str(manifest.get("token") or ""),
+        "X-Snapshot-Rows": str(int(manifest.get("rows") or 0)),
+    })
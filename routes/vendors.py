@@ -1,6 +1,7 @@
 from typing import Dict, Any
 from fastapi import APIRouter, Body, Depends, HTTPException, status
 from .security import require_auth
+import storage
 from firebase_admin import firestore as fa_firestore
 from utils.clean_vendor_name import clean_vendor_name
 
@@ -18,7 +19,7 @@ def train(body: Dict[str, Any] = Body(...), user: Dict[str, Any] = Depends(requi
     vendor_key = clean_vendor_name(memo).lower()
     if not vendor_key:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
-    db = fa_firestore.client()
+    db = storage.client()
     ref = db.collection("users").document(uid).collection("vendor_memory").document(vendor_key)
     ref.set(
         {"account": account, "vendorKey": vendor_key, "memoSample": memo, "updatedAt": fa_firestore.SERVER_TIMESTAMP},
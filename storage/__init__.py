@@ -0,0 +1,70 @@
+# Storage backends. STORAGE_BACKEND picks the client every `_db()` hands out:
+#   firestore (default)  the real project, via firebase_admin
+#   memory               an in-process MemoryStore that counts RPCs
+#   sqlite               the same, persisted to STORAGE_SQLITE_PATH
+# STORAGE_LATENCY_MS / STORAGE_JITTER_MS inject per-RPC latency offline.
+# The local backends answer any query without an index: a missing composite
+# index only shows up against firestore (declare it in firestore.indexes.json).
+from typing import Any, Optional
+import os, threading
+
+from .memory import AsyncMemoryClient, MemoryClient, MemoryStore, RpcStats, store_from_env
+
+_lock = threading.Lock()
+_store: Optional[MemoryStore] = None
+
+def backend() -> str:
+    return (os.environ.get("STORAGE_BACKEND") or "firestore").strip().lower()
+
+def offline() -> bool:
+    return backend() in ("memory", "sqlite")
+
+def memory_store() -> MemoryStore:
+    """The process-wide local store; created from the environment on first use."""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = store_from_env()
+        return _store
+
+def use_store(store: Optional[MemoryStore]) -> None:
+    """Swap the process-wide local store (benchmarks and tests); None recreates it from the environment."""
+    global _store
+    with _lock:
+        _store = store
+
+def _init_firebase_once():
+    import firebase_admin
+    from firebase_admin import credentials
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH", "/etc/secrets/firebase-service-account.json")
+        firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+def client() -> Any:
+    if offline():
+        return MemoryClient(memory_store())
+    _init_firebase_once()
+    from firebase_admin import firestore
+    return firestore.client()
+
+def async_client() -> Any:
+    if offline():
+        return AsyncMemoryClient(memory_store())
+    _init_firebase_once()
+    from firebase_admin import firestore_async
+    return firestore_async.client()
+
+__all__ = [
+    "AsyncMemoryClient",
+    "MemoryClient",
+    "MemoryStore",
+    "RpcStats",
+    "async_client",
+    "backend",
+    "client",
+    "memory_store",
+    "offline",
+    "use_store",
+]
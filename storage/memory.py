@@ -0,0 +1,669 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from collections import Counter
+from datetime import datetime, timezone
+import asyncio, copy, functools, os, pickle, random, sqlite3, threading, time, uuid
+
+try:
+    from google.cloud.firestore_v1 import transforms as _transforms
+    SERVER_TIMESTAMP = _transforms.SERVER_TIMESTAMP
+    DELETE_FIELD = _transforms.DELETE_FIELD
+except Exception:
+    SERVER_TIMESTAMP = object()
+    DELETE_FIELD = object()
+
+try:
+    from google.api_core.exceptions import AlreadyExists, InvalidArgument, NotFound
+except Exception:
+    class NotFound(Exception):
+        pass
+
+    class AlreadyExists(Exception):
+        pass
+
+    class InvalidArgument(Exception):
+        pass
+
+MAX_BATCH_WRITES = 500
+_INEQUALITY_OPS = ("<", "<=", ">", ">=", "!=", "not-in")
+
+class RpcStats:
+    """RPC-equivalents issued against a MemoryStore, counted the way Firestore bills them.
+
+    ``rpcs`` counts round trips by kind (get, get_all, query, commit, write);
+    ``reads`` and ``writes`` count billed documents. A query that returns
+    nothing still costs one read.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.rpcs: Counter = Counter()
+        self.reads = 0
+        self.writes = 0
+
+    def record(self, kind: str, reads: int = 0, writes: int = 0) -> None:
+        with self._lock:
+            self.rpcs[kind] += 1
+            self.reads += reads
+            self.writes += writes
+
+    def reset(self) -> None:
+        with self._lock:
+            self.rpcs.clear()
+            self.reads = 0
+            self.writes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"rpcs": sum(self.rpcs.values()), "byKind": dict(self.rpcs), "reads": self.reads, "writes": self.writes}
+
+class _DictBackend:
+    def __init__(self) -> None:
+        self._docs: Dict[str, Dict[str, Tuple[Dict[str, Any], datetime, datetime]]] = {}
+
+    def get(self, parent: str, doc_id: str) -> Optional[Tuple[Dict[str, Any], datetime, datetime]]:
+        return self._docs.get(parent, {}).get(doc_id)
+
+    def put(self, parent: str, doc_id: str, rec: Tuple[Dict[str, Any], datetime, datetime]) -> None:
+        self._docs.setdefault(parent, {})[doc_id] = rec
+
+    def delete(self, parent: str, doc_id: str) -> None:
+        self._docs.get(parent, {}).pop(doc_id, None)
+
+    def items(self, parent: str) -> List[Tuple[str, Tuple[Dict[str, Any], datetime, datetime]]]:
+        return list(self._docs.get(parent, {}).items())
+
+    def parents(self) -> List[str]:
+        return [p for p, docs in self._docs.items() if docs]
+
+class _SqliteBackend:
+    """Same contract as _DictBackend, persisted to one SQLite table so datasets survive restarts."""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs (parent TEXT NOT NULL, id TEXT NOT NULL, rec BLOB NOT NULL, PRIMARY KEY (parent, id))")
+
+    def get(self, parent: str, doc_id: str) -> Optional[Tuple[Dict[str, Any], datetime, datetime]]:
+        row = self._conn.execute("SELECT rec FROM docs WHERE parent = ? AND id = ?", (parent, doc_id)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, parent: str, doc_id: str, rec: Tuple[Dict[str, Any], datetime, datetime]) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO docs (parent, id, rec) VALUES (?, ?, ?)", (parent, doc_id, pickle.dumps(rec)))
+
+    def delete(self, parent: str, doc_id: str) -> None:
+        self._conn.execute("DELETE FROM docs WHERE parent = ? AND id = ?", (parent, doc_id))
+
+    def items(self, parent: str) -> List[Tuple[str, Tuple[Dict[str, Any], datetime, datetime]]]:
+        return [(i, pickle.loads(r)) for i, r in self._conn.execute("SELECT id, rec FROM docs WHERE parent = ?", (parent,))]
+
+    def parents(self) -> List[str]:
+        return [r[0] for r in self._conn.execute("SELECT DISTINCT parent FROM docs")]
+
+class MemoryStore:
+    """Local stand-in for a Firestore database: documents, RPC accounting and injected latency.
+
+    ``path`` keeps the documents in SQLite instead of a dict. ``latency`` (seconds)
+    plus up to ``jitter`` is slept once per RPC, so concurrency wins show up in
+    wall time the way they would against the real service.
+    """
+
+    def __init__(self, path: str = "", latency: float = 0.0, jitter: float = 0.0) -> None:
+        self._backend = _SqliteBackend(path) if path else _DictBackend()
+        self._lock = threading.RLock()
+        self.stats = RpcStats()
+        self.latency = latency
+        self.jitter = jitter
+
+    def delay(self) -> float:
+        if self.latency <= 0 and self.jitter <= 0:
+            return 0.0
+        return max(0.0, self.latency + random.random() * self.jitter)
+
+    def rpc(self, kind: str, reads: int = 0, writes: int = 0) -> None:
+        self.stats.record(kind, reads, writes)
+        d = self.delay()
+        if d:
+            time.sleep(d)
+
+    async def rpc_async(self, kind: str, reads: int = 0, writes: int = 0) -> None:
+        self.stats.record(kind, reads, writes)
+        d = self.delay()
+        if d:
+            await asyncio.sleep(d)
+
+    def read(self, path: str) -> Optional[Tuple[Dict[str, Any], datetime, datetime]]:
+        parent, _, doc_id = path.rpartition("/")
+        with self._lock:
+            rec = self._backend.get(parent, doc_id)
+        return copy.deepcopy(rec) if rec else None
+
+    def scan(self, parents: Iterable[str]) -> List[Tuple[str, Tuple[Dict[str, Any], datetime, datetime]]]:
+        with self._lock:
+            return [(f"{p}/{i}", copy.deepcopy(rec)) for p in parents for i, rec in self._backend.items(p)]
+
+    def group_parents(self, collection_id: str) -> List[str]:
+        with self._lock:
+            return [p for p in self._backend.parents() if p.rpartition("/")[2] == collection_id]
+
+    def apply(self, writes: Sequence[Tuple[str, str, Optional[Dict[str, Any]], bool]]) -> None:
+        """Apply (kind, path, data, merge) writes atomically; kind is set, update, create or delete."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            staged: Dict[str, Optional[Tuple[Dict[str, Any], datetime, datetime]]] = {}
+            for kind, path, data, merge in writes:
+                parent, _, doc_id = path.rpartition("/")
+                cur = staged[path] if path in staged else self._backend.get(parent, doc_id)
+                if kind == "delete":
+                    staged[path] = None
+                    continue
+                if kind == "update" and cur is None:
+                    raise NotFound(f"No document to update: {path}")
+                if kind == "create" and cur is not None:
+                    raise AlreadyExists(f"Document already exists: {path}")
+                base = copy.deepcopy(cur[0]) if cur is not None and (merge or kind == "update") else {}
+                for key, value in (data or {}).items():
+                    parts = key.split(".") if kind == "update" else [key]
+                    _write_field(base, parts, value, now, merge or kind == "update")
+                staged[path] = (base, cur[1] if cur is not None else now, now)
+            for path, rec in staged.items():
+                parent, _, doc_id = path.rpartition("/")
+                if rec is None:
+                    self._backend.delete(parent, doc_id)
+                else:
+                    self._backend.put(parent, doc_id, rec)
+
+def _transform(current: Any, value: Any, now: datetime) -> Any:
+    if value is SERVER_TIMESTAMP:
+        return now
+    kind = type(value).__name__
+    if kind == "Increment":
+        return (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) + value.value
+    if kind == "ArrayUnion":
+        cur = list(current) if isinstance(current, list) else []
+        return cur + [v for v in value.values if v not in cur]
+    if kind == "ArrayRemove":
+        return [v for v in (current if isinstance(current, list) else []) if v not in value.values]
+    if isinstance(value, dict):
+        return {k: _transform(None, v, now) for k, v in value.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(value)
+
+def _write_field(doc: Dict[str, Any], parts: List[str], value: Any, now: datetime, merge: bool) -> None:
+    for p in parts[:-1]:
+        nxt = doc.get(p)
+        if not isinstance(nxt, dict):
+            nxt = doc[p] = {}
+        doc = nxt
+    last = parts[-1]
+    if value is DELETE_FIELD:
+        doc.pop(last, None)
+    elif merge and isinstance(value, dict) and isinstance(doc.get(last), dict):
+        for k, v in value.items():
+            _write_field(doc[last], [k], v, now, True)
+    else:
+        doc[last] = _transform(doc.get(last), value, now)
+
+def _field(data: Dict[str, Any], path: str) -> Tuple[bool, Any]:
+    cur: Any = data
+    for p in path.split("."):
+        if not isinstance(cur, dict) or p not in cur:
+            return False, None
+        cur = cur[p]
+    return True, cur
+
+def _rank(v: Any) -> Tuple[int, Any]:
+    """Firestore's cross-type ordering: null < bool < number < timestamp < string < bytes < reference."""
+    if v is None:
+        return (0, 0)
+    if isinstance(v, bool):
+        return (1, v)
+    if isinstance(v, (int, float)):
+        return (2, v)
+    if isinstance(v, datetime):
+        return (3, v if v.tzinfo else v.replace(tzinfo=timezone.utc))
+    if isinstance(v, str):
+        return (4, v)
+    if isinstance(v, bytes):
+        return (5, v)
+    if isinstance(v, MemoryDocumentReference):
+        return (6, v.path)
+    return (7, repr(v))
+
+def _matches(value: Any, present: bool, op: str, want: Any) -> bool:
+    if op == "not-in":
+        return present and value is not None and _rank(value) not in [_rank(w) for w in want]
+    if not present:
+        return False
+    if op == "==":
+        return _rank(value) == _rank(want)
+    if op == "!=":
+        return value is not None and _rank(value) != _rank(want)
+    if op == "in":
+        return _rank(value) in [_rank(w) for w in want]
+    if op == "array_contains":
+        return isinstance(value, list) and _rank(want) in [_rank(v) for v in value]
+    if op == "array_contains_any":
+        return isinstance(value, list) and any(_rank(w) in [_rank(v) for v in value] for w in want)
+    a, b = _rank(value), _rank(want)
+    if a[0] != b[0]:
+        return False
+    return {"<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference: "MemoryDocumentReference", rec: Optional[Tuple[Dict[str, Any], datetime, datetime]], field_paths: Optional[Sequence[str]] = None) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = rec is not None
+        data = rec[0] if rec else None
+        if data is not None and field_paths is not None:
+            picked: Dict[str, Any] = {}
+            for fp in field_paths:
+                ok, v = _field(data, fp)
+                if ok:
+                    _write_field(picked, fp.split("."), v, datetime.now(timezone.utc), False)
+            data = picked
+        self._data = data
+        self.create_time = rec[1] if rec else None
+        self.update_time = rec[2] if rec else None
+        self.read_time = datetime.now(timezone.utc)
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field_path: str) -> Any:
+        ok, v = _field(self._data or {}, field_path)
+        if not ok:
+            raise KeyError(field_path)
+        return copy.deepcopy(v)
+
+class MemoryDocumentReference:
+    def __init__(self, client: "MemoryClient", path: str) -> None:
+        self._client = client
+        self.path = path
+        self.id = path.rpartition("/")[2]
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.path}>"
+
+    @property
+    def parent(self) -> "MemoryCollectionReference":
+        return self._client._collection_cls(self._client, self.path.rpartition("/")[0])
+
+    def collection(self, collection_id: str) -> "MemoryCollectionReference":
+        return self._client._collection_cls(self._client, f"{self.path}/{collection_id}")
+
+    def _snap(self, field_paths: Optional[Sequence[str]] = None) -> MemoryDocumentSnapshot:
+        return MemoryDocumentSnapshot(self, self._client._store.read(self.path), field_paths)
+
+    def get(self, field_paths: Optional[Sequence[str]] = None, **kw: Any) -> MemoryDocumentSnapshot:
+        self._client._store.rpc("get", reads=1)
+        return self._snap(field_paths)
+
+    def _write(self, kind: str, data: Optional[Dict[str, Any]], merge: bool = False) -> None:
+        self._client._store.rpc("write", writes=1)
+        self._client._store.apply([(kind, self.path, data, merge)])
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._write("set", document_data, merge)
+
+    def update(self, field_updates: Dict[str, Any]) -> None:
+        self._write("update", field_updates)
+
+    def create(self, document_data: Dict[str, Any]) -> None:
+        self._write("create", document_data)
+
+    def delete(self) -> None:
+        self._write("delete", None)
+
+class MemoryQuery:
+    def __init__(self, client: "MemoryClient", parents: Optional[List[str]], collection_id: str, path: str = "") -> None:
+        self._client = client
+        self._parents = parents
+        self._collection_id = collection_id
+        self._path = path
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._orders: List[Tuple[str, str]] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._fields: Optional[List[str]] = None
+        self._start: Optional[Tuple[Any, bool]] = None
+        self._end: Optional[Tuple[Any, bool]] = None
+
+    def _copy(self, **changes: Any) -> "MemoryQuery":
+        q = copy.copy(self)
+        q._filters = list(self._filters)
+        q._orders = list(self._orders)
+        for k, v in changes.items():
+            setattr(q, k, v)
+        return q
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, *, filter: Any = None) -> "MemoryQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        q = self._copy()
+        q._filters.append((field_path, op_string, value))
+        return q
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "MemoryQuery":
+        q = self._copy()
+        q._orders.append((field_path, direction))
+        return q
+
+    def limit(self, count: int) -> "MemoryQuery":
+        return self._copy(_limit=count)
+
+    def offset(self, num_to_skip: int) -> "MemoryQuery":
+        return self._copy(_offset=num_to_skip)
+
+    def select(self, field_paths: Iterable[str]) -> "MemoryQuery":
+        return self._copy(_fields=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._copy(_start=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._copy(_start=(document_fields_or_snapshot, True))
+
+    def end_before(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._copy(_end=(document_fields_or_snapshot, False))
+
+    def end_at(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._copy(_end=(document_fields_or_snapshot, True))
+
+    def _order(self) -> List[Tuple[str, str]]:
+        orders = list(self._orders)
+        names = [f for f, _ in orders]
+        for f, op, _ in self._filters:
+            if op in _INEQUALITY_OPS and f not in names and f != "__name__":
+                orders.insert(0, (f, "ASCENDING"))
+                names.append(f)
+        if "__name__" not in names:
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        return orders
+
+    def _key(self, ref: MemoryDocumentReference, data: Dict[str, Any], orders: List[Tuple[str, str]]) -> Optional[List[Tuple[int, Any]]]:
+        key = []
+        for f, _ in orders:
+            if f == "__name__":
+                key.append(_rank(ref))
+                continue
+            ok, v = _field(data, f)
+            if not ok:
+                return None
+            key.append(_rank(v))
+        return key
+
+    def _cursor_key(self, cursor: Any, orders: List[Tuple[str, str]]) -> List[Tuple[int, Any]]:
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            return self._key(cursor.reference, cursor._data or {}, orders) or []
+        if isinstance(cursor, dict):
+            out = []
+            for f, _ in orders:
+                if f not in cursor:
+                    break
+                v = cursor[f]
+                out.append(_rank(self._client.document(f"{self._path}/{v}") if f == "__name__" and isinstance(v, str) else v))
+            return out
+        return [_rank(v) for v in cursor]
+
+    def _run(self) -> List[MemoryDocumentSnapshot]:
+        store = self._client._store
+        parents = self._parents if self._parents is not None else store.group_parents(self._collection_id)
+        orders = self._order()
+        rows = []
+        for path, rec in store.scan(parents):
+            ref = self._client.document(path)
+            data = rec[0]
+            if not all(self._match(ref, data, f, op, v) for f, op, v in self._filters):
+                continue
+            key = self._key(ref, data, orders)
+            if key is None:
+                continue
+            rows.append((key, ref, rec))
+
+        def _cmp(a: List[Tuple[int, Any]], b: List[Tuple[int, Any]]) -> int:
+            for (x, (_, d)) in zip(zip(a, b), orders):
+                if x[0] != x[1]:
+                    lt = x[0] < x[1]
+                    return (-1 if lt else 1) * (-1 if d == "DESCENDING" else 1)
+            return 0
+
+        rows.sort(key=functools.cmp_to_key(lambda a, b: _cmp(a[0], b[0])))
+        if self._start is not None:
+            ck = self._cursor_key(self._start[0], orders)
+            rows = [r for r in rows if (_cmp(r[0][:len(ck)], ck) >= 0 if self._start[1] else _cmp(r[0][:len(ck)], ck) > 0)]
+        if self._end is not None:
+            ck = self._cursor_key(self._end[0], orders)
+            rows = [r for r in rows if (_cmp(r[0][:len(ck)], ck) <= 0 if self._end[1] else _cmp(r[0][:len(ck)], ck) < 0)]
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return [MemoryDocumentSnapshot(ref, rec, self._fields) for _, ref, rec in rows]
+
+    @staticmethod
+    def _match(ref: MemoryDocumentReference, data: Dict[str, Any], f: str, op: str, v: Any) -> bool:
+        if f == "__name__":
+            return _matches(ref, True, op, v)
+        ok, value = _field(data, f)
+        return _matches(value, ok, op, v)
+
+    def get(self, **kw: Any) -> List[MemoryDocumentSnapshot]:
+        return list(self.stream())
+
+    def stream(self, **kw: Any) -> Iterator[MemoryDocumentSnapshot]:
+        snaps = self._run()
+        self._client._store.rpc("query", reads=max(1, len(snaps)))
+        return iter(snaps)
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client: "MemoryClient", path: str) -> None:
+        super().__init__(client, [path], path.rpartition("/")[2], path)
+        self.id = self._collection_id
+
+    @property
+    def parent(self) -> Optional[MemoryDocumentReference]:
+        head = self._path.rpartition("/")[0]
+        return self._client.document(head) if head else None
+
+    def document(self, document_id: Optional[str] = None) -> MemoryDocumentReference:
+        return self._client.document(f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def list_documents(self, page_size: Optional[int] = None) -> Iterator[MemoryDocumentReference]:
+        rows = self._client._store.scan([self._path])
+        self._client._store.rpc("query", reads=max(1, len(rows)))
+        return iter([self._client.document(p) for p, _ in rows])
+
+class MemoryWriteBatch:
+    def __init__(self, client: "MemoryClient") -> None:
+        self._client = client
+        self._writes: List[Tuple[str, str, Optional[Dict[str, Any]], bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(self, reference: MemoryDocumentReference, document_data: Dict[str, Any], merge: bool = False) -> "MemoryWriteBatch":
+        self._writes.append(("set", reference.path, document_data, merge))
+        return self
+
+    def update(self, reference: MemoryDocumentReference, field_updates: Dict[str, Any]) -> "MemoryWriteBatch":
+        self._writes.append(("update", reference.path, field_updates, False))
+        return self
+
+    def create(self, reference: MemoryDocumentReference, document_data: Dict[str, Any]) -> "MemoryWriteBatch":
+        self._writes.append(("create", reference.path, document_data, False))
+        return self
+
+    def delete(self, reference: MemoryDocumentReference) -> "MemoryWriteBatch":
+        self._writes.append(("delete", reference.path, None, False))
+        return self
+
+    def _check(self) -> None:
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+
+    def commit(self, **kw: Any) -> List[Any]:
+        self._check()
+        self._client._store.rpc("commit", writes=len(self._writes))
+        self._client._store.apply(self._writes)
+        return [None] * len(self._writes)
+
+class MemoryTransaction(MemoryWriteBatch):
+    """What ``firestore.transactional`` drives: begin, reads via ``ref.get(transaction=...)``, commit.
+
+    The store lock is held from begin to commit or rollback, so a transaction
+    serializes against every other read and write on the store.
+    """
+
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client: "MemoryClient") -> None:
+        super().__init__(client)
+        self._id: Optional[bytes] = None
+
+    def _release(self) -> None:
+        if self._id is not None:
+            self._id = None
+            self._client._store._lock.release()
+
+    def _clean_up(self) -> None:
+        self._release()
+        self._writes = []
+
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        self._client._store._lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self) -> List[Any]:
+        try:
+            self._check()
+            if self._writes:
+                self._client._store.rpc("commit", writes=len(self._writes))
+                self._client._store.apply(self._writes)
+            return [None] * len(self._writes)
+        finally:
+            self._release()
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+class MemoryClient:
+    """Firestore ``Client`` surface the app uses (collections, queries, get_all, batches) over a MemoryStore.
+
+    Queries are evaluated by scanning, so index requirements are not
+    enforced: a filter/order combination that needs a composite index runs
+    here but fails with FailedPrecondition against Firestore until the index
+    is declared in firestore.indexes.json and deployed.
+    """
+
+    _document_cls = MemoryDocumentReference
+    _collection_cls = MemoryCollectionReference
+    _query_cls = MemoryQuery
+    _batch_cls = MemoryWriteBatch
+
+    def __init__(self, store: Optional[MemoryStore] = None) -> None:
+        self._store = store or MemoryStore()
+
+    @property
+    def store(self) -> MemoryStore:
+        return self._store
+
+    @property
+    def stats(self) -> RpcStats:
+        return self._store.stats
+
+    def collection(self, *path: str) -> MemoryCollectionReference:
+        return self._collection_cls(self, "/".join(path))
+
+    def document(self, *path: str) -> MemoryDocumentReference:
+        return self._document_cls(self, "/".join(path))
+
+    def collection_group(self, collection_id: str) -> MemoryQuery:
+        return self._query_cls(self, None, collection_id)
+
+    def batch(self) -> MemoryWriteBatch:
+        return self._batch_cls(self)
+
+    def transaction(self, **kw: Any) -> MemoryTransaction:
+        return MemoryTransaction(self)
+
+    def _get_all(self, references: Iterable[MemoryDocumentReference], field_paths: Optional[Sequence[str]]) -> List[MemoryDocumentSnapshot]:
+        refs = list(dict.fromkeys(references))
+        return [self.document(r.path)._snap(field_paths) for r in refs]
+
+    def get_all(self, references: Iterable[MemoryDocumentReference], field_paths: Optional[Sequence[str]] = None, **kw: Any) -> Iterator[MemoryDocumentSnapshot]:
+        snaps = self._get_all(references, field_paths)
+        self._store.rpc("get_all", reads=len(snaps))
+        return iter(snaps)
+
+    def close(self) -> None:
+        pass
+
+class AsyncMemoryDocumentReference(MemoryDocumentReference):
+    async def get(self, field_paths: Optional[Sequence[str]] = None, **kw: Any) -> MemoryDocumentSnapshot:
+        await self._client._store.rpc_async("get", reads=1)
+        return self._snap(field_paths)
+
+    async def _write_async(self, kind: str, data: Optional[Dict[str, Any]], merge: bool = False) -> None:
+        await self._client._store.rpc_async("write", writes=1)
+        self._client._store.apply([(kind, self.path, data, merge)])
+
+    async def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        await self._write_async("set", document_data, merge)
+
+    async def update(self, field_updates: Dict[str, Any]) -> None:
+        await self._write_async("update", field_updates)
+
+    async def create(self, document_data: Dict[str, Any]) -> None:
+        await self._write_async("create", document_data)
+
+    async def delete(self) -> None:
+        await self._write_async("delete", None)
+
+class _AsyncQueryMixin:
+    async def get(self, **kw: Any) -> List[MemoryDocumentSnapshot]:
+        return [s async for s in self.stream()]
+
+    async def stream(self, **kw: Any):
+        snaps = self._run()
+        await self._client._store.rpc_async("query", reads=max(1, len(snaps)))
+        for s in snaps:
+            yield s
+
+class AsyncMemoryQuery(_AsyncQueryMixin, MemoryQuery):
+    pass
+
+class AsyncMemoryCollectionReference(_AsyncQueryMixin, MemoryCollectionReference):
+    pass
+
+class AsyncMemoryWriteBatch(MemoryWriteBatch):
+    async def commit(self, **kw: Any) -> List[Any]:
+        self._check()
+        await self._client._store.rpc_async("commit", writes=len(self._writes))
+        self._client._store.apply(self._writes)
+        return [None] * len(self._writes)
+
+class AsyncMemoryClient(MemoryClient):
+    """``AsyncClient`` counterpart of MemoryClient; share one MemoryStore between the two."""
+
+    _document_cls = AsyncMemoryDocumentReference
+    _collection_cls = AsyncMemoryCollectionReference
+    _query_cls = AsyncMemoryQuery
+    _batch_cls = AsyncMemoryWriteBatch
+
+    async def get_all(self, references: Iterable[MemoryDocumentReference], field_paths: Optional[Sequence[str]] = None, **kw: Any):
+        snaps = self._get_all(references, field_paths)
+        await self._store.rpc_async("get_all", reads=len(snaps))
+        for s in snaps:
+            yield s
+
+def store_from_env() -> MemoryStore:
+    return MemoryStore(
+        path=os.environ.get("STORAGE_SQLITE_PATH", "") if (os.environ.get("STORAGE_BACKEND") or "").strip().lower() == "sqlite" else "",
+        latency=float(os.environ.get("STORAGE_LATENCY_MS", "0") or 0) / 1000.0,
+        jitter=float(os.environ.get("STORAGE_JITTER_MS", "0") or 0) / 1000.0,
+    )
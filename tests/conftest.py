@@ -0,0 +1,107 @@
+"""Fixtures for the RPC-budget suite: the app wired to an in-memory datastore.
+
+Every request runs against storage.MemoryStore, which counts RPC-equivalents
+the way Firestore bills them. Set RPC_BUDGET_REPORT=path.json to keep the
+per-operation usage table the suite prints at the end.
+"""
+from typing import Any, Dict, List
+import json, os, sys, uuid
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("CLASSIFY_RESUME_ON_STARTUP", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import storage
+from storage import MemoryStore
+
+_REPORT: List[Dict[str, Any]] = []
+
+class RpcMeter:
+    """Usage of one measured operation; learning writes are flushed inside the window."""
+
+    def __init__(self, store: MemoryStore, label: str, rows: int) -> None:
+        self._store = store
+        self.label = label
+        self.rows = rows
+        self.usage: Dict[str, Any] = {}
+
+    def __enter__(self) -> "RpcMeter":
+        self._store.stats.reset()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        from utils.classify_transaction import flush_learning
+        flush_learning()
+        self.usage = self._store.stats.snapshot()
+
+    def kind(self, *kinds: str) -> int:
+        return sum(int(self.usage["byKind"].get(k, 0)) for k in kinds)
+
+    def check(self, *, point_rpcs: int, reads_per_row: float, writes_per_row: float, batched_rpcs: int = 0) -> None:
+        """Assert a budget: point RPCs (get, write, query) must not grow with the row count,
+        batched RPCs (get_all, commit) may only grow with the chunks the billed docs need."""
+        rows = max(1, self.rows)
+        point = self.kind("get", "write", "query")
+        batched = self.kind("get_all", "commit")
+        allowed_batched = batched_rpcs + -(-self.usage["reads"] // 300) + -(-self.usage["writes"] // 450)
+        _REPORT.append({
+            "operation": self.label,
+            "rows": self.rows,
+            **self.usage,
+            "readsPerRow": round(self.usage["reads"] / rows, 2),
+            "writesPerRow": round(self.usage["writes"] / rows, 2),
+            "budget": {"pointRpcs": point_rpcs, "batchedRpcs": allowed_batched, "readsPerRow": reads_per_row, "writesPerRow": writes_per_row},
+        })
+        assert point <= point_rpcs, f"{self.label}: {point} point RPCs for {self.rows} rows (budget {point_rpcs}); {self.usage}"
+        assert batched <= allowed_batched, f"{self.label}: {batched} batched RPCs (budget {allowed_batched}); {self.usage}"
+        assert self.usage["reads"] <= reads_per_row * rows, f"{self.label}: {self.usage['reads']} reads for {self.rows} rows; {self.usage}"
+        assert self.usage["writes"] <= writes_per_row * rows, f"{self.label}: {self.usage['writes']} writes for {self.rows} rows; {self.usage}"
+
+@pytest.fixture
+def store() -> MemoryStore:
+    st = MemoryStore()
+    storage.use_store(st)
+    yield st
+    storage.use_store(None)
+
+@pytest.fixture
+def uid() -> str:
+    # a fresh user per test, so per-user caches (chart, profile touch, lookups) start cold
+    return "u-" + uuid.uuid4().hex[:12]
+
+@pytest.fixture
+def app(store: MemoryStore, uid: str, monkeypatch: pytest.MonkeyPatch) -> Any:
+    import main
+    import utils.classify_transaction as classify_transaction
+    from routes.security import require_auth
+    monkeypatch.setattr(main, "_verify_and_decode", lambda authorization: {"uid": uid, "email": f"{uid}@example.com"})
+    monkeypatch.setattr(classify_transaction, "classify_llm", lambda **kw: "Office Supplies")
+    main.app.dependency_overrides[require_auth] = lambda: {"uid": uid}
+    yield main
+    main.app.dependency_overrides.pop(require_auth, None)
+
+@pytest.fixture
+def client(app: Any) -> TestClient:
+    return TestClient(app.app)
+
+@pytest.fixture
+def meter(store: MemoryStore):
+    return lambda label, rows: RpcMeter(store, label, rows)
+
+def pytest_terminal_summary(terminalreporter: Any) -> None:
+    if not _REPORT:
+        return
+    terminalreporter.section("RPC budgets")
+    terminalreporter.write_line(f"{'operation':<28}{'rows':>6}{'rpcs':>7}{'reads':>8}{'writes':>8}{'r/row':>8}{'w/row':>8}  by kind")
+    for r in _REPORT:
+        terminalreporter.write_line(
+            f"{r['operation']:<28}{r['rows']:>6}{r['rpcs']:>7}{r['reads']:>8}{r['writes']:>8}"
+            f"{r['readsPerRow']:>8}{r['writesPerRow']:>8}  {json.dumps(r['byKind'], sort_keys=True)}"
+        )
+    path = os.environ.get("RPC_BUDGET_REPORT")
+    if path:
+        with open(path, "w") as f:
+            json.dump(_REPORT, f, indent=2)
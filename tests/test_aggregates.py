@@ -0,0 +1,74 @@
+"""Incrementally maintained aggregates must match a rebuild from the stored rows."""
+from typing import Any, Dict
+
+from test_rpc_budgets import _StubPlaid, _upload
+
+def _stored(uid: str) -> Dict[str, Dict[str, Any]]:
+    import storage
+    from utils.aggregates import AGGREGATES
+    out: Dict[str, Dict[str, Any]] = {}
+    for snap in storage.client().collection("users").document(uid).collection(AGGREGATES).stream():
+        cells = {cid: {k: c[k] for k in ("account", "sourceType", "cents", "count")} for cid, c in (snap.to_dict() or {}).get("cells", {}).items() if c.get("count")}
+        if cells:
+            out[snap.id] = cells
+    return out
+
+def _rebuilt(uid: str) -> Dict[str, Dict[str, Any]]:
+    import storage
+    from utils.aggregates import rebuild_docs
+    rows = (s.to_dict() for s in storage.client().collection("users").document(uid).collection("transactions").stream())
+    return {m: d["cells"] for m, d in rebuild_docs(rows).items()}
+
+def test_write_paths_keep_aggregates_exact(client, app, monkeypatch, uid):
+    import storage
+    import routes.plaid as plaid
+    from utils.classification_pipeline import classify_upload
+    bank = _upload(client, app, monkeypatch, 120)["uploadId"]
+    card = _upload(client, app, monkeypatch, 80, "card")["uploadId"]
+    assert classify_upload(storage.client(), uid, bank)
+    assert _stored(uid) and _stored(uid) == _rebuilt(uid)
+
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    res = client.post("/transactions/bulk-reclassify", json={"account": "4010 - Service Income", "uids": [r["id"] for r in rows[:30]]})
+    assert res.status_code == 200, res.text
+    res = client.post(f"/transactions/{rows[40]['id']}/reclassify", json={"account": "6220 - Meals & Entertainment"})
+    assert res.status_code == 200, res.text
+    _upload(client, app, monkeypatch, 50, "card", upload_id=card)
+    assert _stored(uid) == _rebuilt(uid)
+
+    monkeypatch.setattr(plaid, "_plaid_client", lambda: _StubPlaid(60))
+    storage.client().collection("users").document(uid).collection("plaid_items").document("item1").set({"access_token": "access-sandbox"})
+    assert client.post("/plaid/sync").status_code == 200
+    assert client.post("/delete-upload", json={"uploadId": bank}).status_code == 200
+    assert _stored(uid) == _rebuilt(uid)
+
+    assert client.post("/plaid/clear-all-linked-transactions").status_code == 200
+    assert client.post("/delete-all-uploads").status_code == 200
+    assert _stored(uid) == {}
+
+def test_summary_reads_one_query(client, app, monkeypatch, uid, store):
+    _upload(client, app, monkeypatch, 90)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    client.post("/transactions/bulk-reclassify", json={"account": "4010 - Service Income", "uids": [r["id"] for r in rows if r["amount"] < 0]})
+    store.stats.reset()
+    res = client.get("/reports/summary?from=2024-03&to=2024-03")
+    assert res.status_code == 200, res.text
+    assert store.stats.snapshot()["byKind"].get("query") == 1
+    body = res.json()
+    income = -sum(r["amount"] for r in rows if r["amount"] < 0)
+    assert body["totals"]["income"] == round(income, 2)
+    assert body["count"] == 90
+    assert client.get("/reports/summary?from=2024-03&to=2024-03", headers={"If-None-Match": res.headers["ETag"]}).status_code == 304
+    assert client.get("/reports/summary?from=2024-13").status_code == 400
+
+def test_summary_etag_changes_with_chart(client, app, monkeypatch, uid):
+    import storage
+    from utils.chart_of_accounts import invalidate_user_chart
+    _upload(client, app, monkeypatch, 20)
+    first = client.get("/reports/summary")
+    assert client.get("/reports/summary", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    settings = storage.client().collection("users").document(uid).collection("settings")
+    settings.document("chartOfAccounts").set({"accounts": ["1000 - Checking Account", "4010 - Service Income"]})
+    invalidate_user_chart(uid)
+    res = client.get("/reports/summary", headers={"If-None-Match": first.headers["ETag"]})
+    assert res.status_code == 200 and res.headers["ETag"] != first.headers["ETag"]
@@ -0,0 +1,69 @@
+"""Chunk retries must never apply an Increment twice."""
+import asyncio
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+
+from storage import AsyncMemoryClient, MemoryClient
+
+class _LandsThenFails:
+    """Client whose first batch commit lands, then raises ``error`` as if the response was lost."""
+
+    def __init__(self, client, error):
+        self._client = client
+        self._error = error
+        self.commits = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def batch(self):
+        outer, batch = self, self._client.batch()
+        commit = batch.commit
+
+        def _commit(**kw):
+            outer.commits += 1
+            res = commit(**kw)
+            if outer.commits == 1:
+                raise outer._error
+            return res
+
+        async def _commit_async(**kw):
+            outer.commits += 1
+            res = await commit(**kw)
+            if outer.commits == 1:
+                raise outer._error
+            return res
+
+        batch.commit = _commit_async if asyncio.iscoroutinefunction(commit) else _commit
+        return batch
+
+def _chunk(db, increment=True):
+    ref = db.collection("users").document("u").collection("aggregates").document("202403")
+    return [("set", ref, {"cells": {"c": {"cents": firestore.Increment(100) if increment else 100}}}, True)]
+
+def _cents(db):
+    return db.collection("users").document("u").collection("aggregates").document("202403").get().to_dict()["cells"]["c"]["cents"]
+
+def test_increment_chunk_not_retried_after_unknown_outcome(store, monkeypatch):
+    import utils.bulk_writes as bw
+    monkeypatch.setattr(bw, "backoff_delay", lambda attempt: 0)
+    db = _LandsThenFails(MemoryClient(store), gexc.DeadlineExceeded("lost"))
+    res = bw.commit_chunks(db, [_chunk(db)])
+    assert res.failed == [0] and db.commits == 1 and _cents(db) == 100
+
+    db = _LandsThenFails(MemoryClient(store), gexc.DeadlineExceeded("lost"))
+    assert bw.commit_chunks(db, [_chunk(db, increment=False)]).ok and db.commits == 2
+
+def test_increment_chunk_retried_when_not_applied(store, monkeypatch):
+    import utils.bulk_writes as bw
+    monkeypatch.setattr(bw, "backoff_delay", lambda attempt: 0)
+    db = _LandsThenFails(MemoryClient(store), gexc.Aborted("contention"))
+    assert bw.commit_chunks(db, [_chunk(db)]).ok and db.commits == 2
+
+def test_async_increment_chunk_not_retried_after_unknown_outcome(store, monkeypatch):
+    import utils.async_store as async_store
+    monkeypatch.setattr(async_store, "backoff_delay", lambda attempt: 0)
+    adb = _LandsThenFails(AsyncMemoryClient(store), gexc.InternalServerError("lost"))
+    res = asyncio.run(async_store.commit_chunks_async(adb, [_chunk(adb)]))
+    assert res.failed == [0] and adb.commits == 1
+    assert _cents(MemoryClient(store)) == 100
@@ -0,0 +1,96 @@
+"""Background classification: the lease keeps one worker per upload, failures mark the upload."""
+from datetime import datetime, timedelta, timezone
+
+from test_rpc_budgets import _upload
+
+def _classifying(uid, upload_id, **fields):
+    import storage
+    upref = storage.client().collection("users").document(uid).collection("uploads").document(upload_id)
+    upref.update({"status": "classifying", **fields})
+    return upref
+
+def test_run_classifies_and_releases_lease(client, app, monkeypatch, uid):
+    import storage
+    from utils.classification_pipeline import ClassificationPipeline
+    upref = _classifying(uid, _upload(client, app, monkeypatch, 20)["uploadId"])
+    ClassificationPipeline(workers=1)._run(storage.client(), uid, upref.id)
+    up = upref.get().to_dict()
+    assert up["status"] == "ready" and up["classifiedCount"] == 20
+    assert "classifyOwner" not in up and "classifyLeaseUntil" not in up
+
+def test_run_failure_marks_upload_error(client, app, monkeypatch, uid):
+    import storage
+    import utils.classification_pipeline as cp
+
+    def _boom(*a, **kw):
+        raise RuntimeError("model unavailable")
+
+    upref = _classifying(uid, _upload(client, app, monkeypatch, 5)["uploadId"])
+    monkeypatch.setattr(cp, "classify_upload", _boom)
+    pipe = cp.ClassificationPipeline(workers=1)
+    pipe._run(storage.client(), uid, upref.id)
+    up = upref.get().to_dict()
+    assert up["status"] == "error" and "model unavailable" in up["classifyError"]
+    assert "classifyOwner" not in up
+    assert not pipe._active
+
+def test_lease_refuses_second_owner_until_expired(client, app, monkeypatch, uid):
+    import storage
+    from utils.classification_pipeline import claim_upload
+    db = storage.client()
+    upref = _classifying(uid, _upload(client, app, monkeypatch, 5)["uploadId"])
+    assert claim_upload(db, uid, upref.id, "a")
+    assert claim_upload(db, uid, upref.id, "a")
+    assert not claim_upload(db, uid, upref.id, "b")
+    upref.update({"classifyLeaseUntil": datetime.now(timezone.utc) - timedelta(seconds=1)})
+    assert claim_upload(db, uid, upref.id, "b")
+    assert upref.get().to_dict()["classifyOwner"] == "b"
+
+def test_resume_pending_submits_classifying_uploads(client, app, monkeypatch, uid):
+    import storage
+    from google.api_core import exceptions as gexc
+    from utils.classification_pipeline import ClassificationPipeline
+    pending = _classifying(uid, _upload(client, app, monkeypatch, 5)["uploadId"])
+    _upload(client, app, monkeypatch, 5)
+    pipe = ClassificationPipeline(workers=1)
+    submitted = []
+    monkeypatch.setattr(pipe, "submit", lambda db, u, upload_id: submitted.append((u, upload_id)) or True)
+    db = storage.client()
+    assert pipe.resume_pending(db) == 1 and submitted == [(uid, pending.id)]
+
+    def _no_index(collection_id):
+        raise gexc.FailedPrecondition("The query requires an index")
+
+    monkeypatch.setattr(db, "collection_group", _no_index)
+    assert pipe.resume_pending(db) == 0
+
+def test_replace_during_run_hands_over_to_new_run(client, app, monkeypatch, uid):
+    import storage
+    import utils.classification_pipeline as cp
+    from test_rpc_budgets import _statement
+    db = storage.client()
+    upref = _classifying(uid, _upload(client, app, monkeypatch, 3 * cp.CLASSIFY_BATCH_SIZE)["uploadId"])
+    submitted = []
+    monkeypatch.setattr(app.classification_pipeline, "submit", lambda db, u, upload_id: submitted.append(upload_id) or True)
+    record = cp.record_learning_batch
+
+    def _replace_after_first_batch(db, learning):
+        record(db, learning)
+        if not submitted:
+            monkeypatch.setattr(app, "extract_transactions_from_bytes", lambda pdf_bytes: _statement(70, "bank"))
+            res = client.post(f"/replace-upload?uploadId={upref.id}", files={"file": ("statement.pdf", b"%PDF-1.4")})
+            assert res.status_code == 200, res.text
+
+    monkeypatch.setattr(cp, "record_learning_batch", _replace_after_first_batch)
+    old = cp.ClassificationPipeline(workers=1)
+    old._run(db, uid, upref.id)
+    up = upref.get().to_dict()
+    # the old run stopped quietly: no "ready", no "error", lease left free for the new run
+    assert submitted == [upref.id]
+    assert up["status"] == "classifying" and up["classifiedCount"] == 0 and "classifyOwner" not in up
+
+    cp.ClassificationPipeline(workers=1)._run(db, uid, upref.id)
+    up = upref.get().to_dict()
+    assert up["status"] == "ready" and up["classifiedCount"] == 70
+    rows = [s.to_dict() for s in db.collection("users").document(uid).collection("transactions").where("uploadId", "==", upref.id).stream()]
+    assert len(rows) == 70 and all(r.get("classificationSource") for r in rows)
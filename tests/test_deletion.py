@@ -0,0 +1,23 @@
+"""Deleting a user's transactions writes tombstones and takes the rows out of the aggregates."""
+from test_aggregates import _rebuilt, _stored
+from test_rpc_budgets import _upload
+
+def test_delete_snapshots_tombstones_and_decrements(client, app, monkeypatch, uid):
+    import storage
+    from utils.change_log import TOMBSTONES
+    from utils.deletion import ROW_FIELDS, delete_snapshots
+    _upload(client, app, monkeypatch, 40)
+    db = storage.client()
+    uref = db.collection("users").document(uid)
+    before = _stored(uid)
+    snaps = list(uref.collection("transactions").select(list(ROW_FIELDS)).stream())[:15]
+    # small chunks so the tombstones and decrements span several commits
+    res = delete_snapshots(db, snaps + snaps[:3], uid=uid, chunk=8)
+    assert res.ok and res.deleted == 15
+    gone = {s.id for s in snaps}
+    assert gone.isdisjoint(s.id for s in uref.collection("transactions").stream())
+    assert gone <= {s.id for s in uref.collection(TOMBSTONES).stream()}
+    after = _stored(uid)
+    assert after == _rebuilt(uid) and after != before
+    removed = sum(c["count"] for cells in before.values() for c in cells.values()) - sum(c["count"] for cells in after.values() for c in cells.values())
+    assert removed == 15
@@ -0,0 +1,30 @@
+"""Embedding responses that are not JSON fail as EmbeddingError; the vector cache stays bounded."""
+import asyncio
+import httpx
+import pytest
+
+from utils.embeddings import EmbeddingCache, EmbeddingError, EmbeddingService, content_key
+
+def _service(handler):
+    svc = EmbeddingService(cache=EmbeddingCache(":memory:"))
+    svc._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    svc._sem = asyncio.Semaphore(1)
+    return svc
+
+def test_non_json_response_is_embedding_error():
+    svc = _service(lambda req: httpx.Response(200, text="<html>gateway</html>"))
+    with pytest.raises(EmbeddingError):
+        asyncio.run(svc.embed("sk-test", ["coffee"]))
+
+def test_ai_route_maps_bad_response_to_502(client, monkeypatch):
+    import routes.ai as ai
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(ai, "embedding_service", _service(lambda req: httpx.Response(200, text="not json")))
+    assert client.post("/ai/embedding", json={"text": "coffee"}).status_code == 502
+
+def test_cache_evicts_oldest_rows():
+    cache = EmbeddingCache(":memory:", max_rows=3)
+    for i in range(5):
+        cache.put_many("m", [(content_key("m", str(i)), [float(i)])])
+    keys = [content_key("m", str(i)) for i in range(5)]
+    assert sorted(cache.get_many(keys)) == sorted(keys[2:])
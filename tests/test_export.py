@@ -0,0 +1,34 @@
+"""Streaming exports: CSV and Parquet straight from the keyset scan, with filters."""
+import csv, io
+import pandas as pd
+
+from test_rpc_budgets import _upload
+
+def test_export_transactions_csv_and_parquet(client, app, monkeypatch, uid, store):
+    import routes.export as export
+    monkeypatch.setattr(export, "EXPORT_PAGE_SIZE", 25)
+    _upload(client, app, monkeypatch, 90)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    res = client.get("/export/transactions?start=2024-03-05&end=2024-03-20")
+    assert res.status_code == 200, res.text
+    assert res.headers["content-disposition"] == 'attachment; filename="transactions-20240305-20240320.csv"'
+    assert res.content.startswith(b"\xef\xbb\xbf")
+    got = list(csv.DictReader(io.StringIO(res.content.decode("utf-8-sig"))))
+    want = [r for r in rows if "20240305" <= r["dateKey"] <= "20240320"]
+    assert sorted(r["id"] for r in got) == sorted(r["id"] for r in want)
+
+    client.post("/transactions/bulk-reclassify", json={"account": "Meals", "uids": [r["id"] for r in rows[:7]]})
+    df = pd.read_parquet(io.BytesIO(client.get("/export/transactions?format=parquet&account=Meals").content))
+    assert sorted(df["id"]) == sorted(r["id"] for r in rows[:7])
+    assert client.get("/export/transactions?format=xlsx").status_code == 400
+
+def test_export_journal_balances(client, app, monkeypatch, uid, store):
+    import routes.export as export
+    monkeypatch.setattr(export, "EXPORT_PAGE_SIZE", 25)
+    _upload(client, app, monkeypatch, 60)
+    df = pd.read_parquet(io.BytesIO(client.get("/export/journal?format=parquet").content))
+    assert len(df) == 120 and round(df["debit"].sum(), 2) == round(df["credit"].sum(), 2)
+    got = list(csv.DictReader(io.StringIO(client.get("/export/journal?account=Checking").content.decode("utf-8-sig"))))
+    assert len(got) == 60 and {r["account"] for r in got} == {"Checking"}
+    empty = pd.read_parquet(io.BytesIO(client.get("/export/journal?format=parquet&start=2030-01-01").content))
+    assert empty.empty and "debit" in empty.columns
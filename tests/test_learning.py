@@ -0,0 +1,75 @@
+"""A failed learning flush keeps its counts for the next flush, without double counting."""
+from google.api_core import exceptions as gexc
+
+from storage import MemoryClient
+
+class _FailingCommits:
+    """Client whose next ``failures`` batch commits raise ``error``; ``lands`` applies them first."""
+
+    def __init__(self, client, error, failures=1, lands=False):
+        self._client = client
+        self._error = error
+        self.failures = failures
+        self._lands = lands
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def batch(self):
+        outer, batch = self, self._client.batch()
+        commit = batch.commit
+
+        def _commit(**kw):
+            if outer.failures <= 0:
+                return commit(**kw)
+            outer.failures -= 1
+            if outer._lands:
+                commit(**kw)
+            raise outer._error
+
+        batch.commit = _commit
+        return batch
+
+def _learning(vendor="kwik mart", account="Meals", n=2):
+    from utils.classify_transaction import LearningBatch
+    lb = LearningBatch()
+    lb.add(vendor, account, "u1", n)
+    return lb
+
+def _total(client, vendor="kwik mart"):
+    snap = client.collection("vendor_memory_agg").document(vendor).get()
+    return snap.to_dict()["total"] if snap.exists else 0
+
+def test_flush_requeues_after_failed_commit(store):
+    from utils.classify_transaction import _LearningBuffer
+    client = MemoryClient(store)
+    buf = _LearningBuffer()
+    buf.add(_FailingCommits(client, gexc.ServiceUnavailable("down")), _learning())
+    buf.flush()
+    assert _total(client) == 0
+    assert len(buf._pending) == 1
+    buf.flush()
+    assert _total(client) == 2
+    assert not len(buf._pending)
+
+def test_unknown_outcome_chunk_is_not_resent(store):
+    from utils.classify_transaction import _LearningBuffer
+    client = MemoryClient(store)
+    buf = _LearningBuffer()
+    buf.add(_FailingCommits(client, gexc.DeadlineExceeded("lost"), lands=True), _learning())
+    buf.flush()
+    buf.flush()
+    assert _total(client) == 2
+    assert not len(buf._pending)
+
+def test_flush_gives_up_after_retry_cap(store, monkeypatch):
+    import utils.classify_transaction as ct
+    monkeypatch.setattr(ct, "LEARNING_MAX_RETRIES", 2)
+    client = MemoryClient(store)
+    buf = ct._LearningBuffer()
+    buf.add(_FailingCommits(client, gexc.ServiceUnavailable("down"), failures=10), _learning())
+    for _ in range(3):
+        buf.flush()
+    assert not len(buf._pending)
+    assert buf._timer is None
+    assert _total(client) == 0
@@ -0,0 +1,54 @@
+"""Server-side ledger: lines match /journal/entries, balances tie out, results cache per data version."""
+from test_rpc_budgets import _upload
+from utils.chart_of_accounts import UNCATEGORIZED
+
+def test_ledger_matches_entries_and_balances(client, app, monkeypatch, uid, store):
+    _upload(client, app, monkeypatch, 60)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    posted = client.post("/journal/entries", json={"transactions": rows}).json()["entries"]
+
+    res = client.get("/journal/ledger?limit=5000")
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["total"] == len(posted) and body["nextCursor"] is None
+    # unclassified rows post to the chart's uncategorized account, as in the aggregates
+    key = lambda l: (l["txnId"], l["type"], UNCATEGORIZED if l["account"] == "Uncategorized" else l["account"], round(l["amount"], 2))
+    assert sorted(map(key, body["lines"])) == sorted(map(key, posted))
+
+    for acct in {l["account"] for l in body["lines"]}:
+        lines = [l for l in body["lines"] if l["account"] == acct]
+        assert lines[-1]["balance"] == round(sum(l["debit"] - l["credit"] for l in lines), 2)
+
+    tb = client.get("/journal/trial-balance").json()
+    assert tb["balanced"] and tb["totalDebit"] == tb["totalCredit"] > 0
+
+    page = client.get("/journal/ledger?limit=25&cursor=25").json()
+    assert page["lines"] == body["lines"][25:50] and page["nextCursor"] == 50
+    streamed = client.get("/journal/ledger?stream=ndjson")
+    assert len(streamed.text.splitlines()) == len(posted)
+
+def test_ledger_cached_per_version(client, app, monkeypatch, uid, store):
+    _upload(client, app, monkeypatch, 30)
+    first = client.get("/journal/trial-balance")
+    store.stats.reset()
+    assert client.get("/journal/trial-balance").json() == first.json()
+    assert store.stats.snapshot()["byKind"].get("query", 0) == 0
+    assert client.get("/journal/trial-balance", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    client.post("/transactions/bulk-reclassify", json={"account": "4010 - Service Income", "uids": [rows[0]["id"]]})
+    accounts = {a["account"] for a in client.get("/journal/trial-balance").json()["accounts"]}
+    assert "4010 - Service Income" in accounts
+
+def test_ledger_recomputed_after_chart_edit(client, app, monkeypatch, uid, store):
+    import storage
+    from utils.chart_of_accounts import invalidate_user_chart
+    _upload(client, app, monkeypatch, 30)
+    first = client.get("/journal/trial-balance")
+    settings = storage.client().collection("users").document(uid).collection("settings")
+    settings.document("chartOfAccounts").set({"accounts": ["1000 - Checking Account", "5000 - Office Supplies", UNCATEGORIZED]})
+    invalidate_user_chart(uid)
+    store.stats.reset()
+    res = client.get("/journal/trial-balance", headers={"If-None-Match": first.headers["etag"]})
+    assert res.status_code == 200 and res.headers["etag"] != first.headers["etag"]
+    assert store.stats.snapshot()["byKind"].get("query", 0) > 0
@@ -0,0 +1,29 @@
+"""Queries that need an undeployed composite index answer 503, not an unhandled 500."""
+from google.api_core import exceptions as gexc
+
+def _failing(*a, **kw):
+    raise gexc.FailedPrecondition("The query requires an index.")
+
+def _failing_iter(*a, **kw):
+    yield from ()
+    raise gexc.FailedPrecondition("The query requires an index.")
+
+def test_transactions_listing_maps_missing_index(client, app, monkeypatch):
+    monkeypatch.setattr(app, "page_transactions_async", lambda *a, **kw: _failing())
+    res = client.get("/transactions?source=Checking&start=2024-01-01")
+    assert res.status_code == 503 and "index" in res.json()["detail"]
+    monkeypatch.setattr(app, "iter_transactions", _failing_iter)
+    res = client.get("/transactions?source=Checking&stream=ndjson")
+    assert res.status_code == 503
+
+def test_exports_map_missing_index(client, monkeypatch):
+    import routes.export as export
+    monkeypatch.setattr(export, "iter_transactions", _failing_iter)
+    for path in ("/export/transactions?account=Meals", "/export/journal?format=parquet&source=Checking"):
+        res = client.get(path)
+        assert res.status_code == 503, path
+
+def test_download_headers_are_exposed_cross_origin(client):
+    res = client.get("/export/transactions", headers={"Origin": "https://app.vercel.app"})
+    exposed = res.headers.get("access-control-expose-headers", "")
+    assert "Content-Disposition" in exposed
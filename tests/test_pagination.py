@@ -0,0 +1,41 @@
+"""Keyset pages over (dateKey, doc id) return every row once, whatever the projection."""
+import pytest
+
+from storage import MemoryClient
+from utils.pagination import decode_cursor, encode_cursor, iter_transactions, page_transactions
+
+@pytest.fixture
+def tcol(store, uid):
+    tcol = MemoryClient(store).collection("users").document(uid).collection("transactions")
+    # many rows per dateKey, so page boundaries fall inside a day and the doc id decides
+    for i in range(23):
+        tcol.document(f"t{i:02d}").set({"dateKey": f"2024030{1 + i % 3}", "amount": float(i), "source": "Bank"})
+    return tcol
+
+def _expected(tcol):
+    return [s.id for s in sorted(tcol.stream(), key=lambda s: (s.to_dict()["dateKey"], s.id))]
+
+def test_pages_walk_ties_without_gaps_or_repeats(tcol):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = page_transactions(tcol, limit=4, cursor=cursor, fields=["amount"])
+        assert all(set(r) == {"id", "amount", "dateKey"} for r in rows)
+        seen += [r["id"] for r in rows]
+        if cursor is None:
+            break
+    assert seen == _expected(tcol)
+
+def test_iter_matches_pages_and_resumes_from_cursor(tcol):
+    ids = [s.id for s in iter_transactions(tcol, page_size=5, fields=["amount"])]
+    assert ids == _expected(tcol)
+    first = tcol.document(ids[6]).get().to_dict()
+    rest = [s.id for s in iter_transactions(tcol, page_size=5, cursor=encode_cursor(first["dateKey"], ids[6]))]
+    assert rest == ids[7:]
+
+@pytest.mark.parametrize("token", ["", "!!!", "bm90IGpzb24", encode_cursor("20240301", "x")[:-3]])
+def test_malformed_cursor(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+def test_malformed_cursor_is_400(client):
+    assert client.get("/transactions?cursor=!!!").status_code == 400
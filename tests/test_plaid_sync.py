@@ -0,0 +1,43 @@
+"""A sync that cannot commit a page says so instead of reporting success."""
+import pytest
+
+from test_rpc_budgets import _StubPlaid
+
+def _failing_pages(monkeypatch, fail_from):
+    import routes.plaid as plaid
+    from utils.bulk_writes import BulkWriteResult
+    commit = plaid.commit_chunks_async
+    calls = {"n": 0}
+
+    async def _commit(adb, chunks, **kw):
+        calls["n"] += 1
+        if calls["n"] >= fail_from:
+            res = BulkWriteResult(len(chunks))
+            res.errors[0] = "ServiceUnavailable: down"
+            return res
+        return await commit(adb, chunks, **kw)
+
+    monkeypatch.setattr(plaid, "commit_chunks_async", _commit)
+
+@pytest.fixture
+def item(client, monkeypatch, uid):
+    import storage
+    import routes.plaid as plaid
+    monkeypatch.setattr(plaid, "_plaid_client", lambda: _StubPlaid(40))
+    ref = storage.client().collection("users").document(uid).collection("plaid_items").document("item1")
+    ref.set({"access_token": "access-sandbox"})
+    return ref
+
+def test_sync_reports_partial_page_failure(client, monkeypatch, item):
+    _failing_pages(monkeypatch, 2)
+    res = client.post("/plaid/sync")
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["partial"] and body["failed"] == [{"itemId": "item1", "page": 2, "committedOps": 0}]
+    assert body["synced"] == 20
+    # the cursor stays on the last committed page so the next sync replays the failed one
+    assert item.get().to_dict()["cursor"] == "c1"
+
+def test_sync_with_nothing_committed_is_502(client, monkeypatch, item):
+    _failing_pages(monkeypatch, 1)
+    assert client.post("/plaid/sync").status_code == 502
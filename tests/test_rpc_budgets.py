@@ -0,0 +1,142 @@
+"""Firestore round-trip budgets for the write-heavy paths.
+
+Each operation runs at a small and a large row count. Point RPCs (single
+gets, single writes, queries) must stay flat as rows grow; batched RPCs may
+only grow with the get_all/commit chunks the billed documents need. An
+N+1 loop shows up as point RPCs scaling with the row count.
+"""
+from typing import Any, Dict, List, Tuple
+import pytest
+
+SIZES = [40, 600]
+
+def _statement(n: int, source_type: str, account: str = "Checking") -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    rows = []
+    for i in range(n):
+        rows.append({
+            "date": f"03/{1 + i % 28:02d}/2024",
+            "memo": f"VENDOR {i % 40} PURCHASE",
+            "amount": (-1 if i % 2 else 1) * (10 + i),
+        })
+    return rows, {"source_account": account, "source_type": source_type}
+
+def _upload(client: Any, app: Any, monkeypatch: pytest.MonkeyPatch, n: int, source_type: str = "bank", upload_id: str = "") -> Dict[str, Any]:
+    monkeypatch.setattr(app, "extract_transactions_from_bytes", lambda pdf_bytes: _statement(n, source_type))
+    url = f"/replace-upload?uploadId={upload_id}&autoClassify=false" if upload_id else "/parse-and-persist?autoClassify=false"
+    res = client.post(url, files={"file": ("statement.pdf", b"%PDF-1.4")})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+@pytest.mark.parametrize("n", SIZES)
+def test_parse_and_persist(client, app, meter, monkeypatch, n):
+    _upload(client, app, monkeypatch, n // 2, "card")
+    with meter("parse-and-persist", n) as m:
+        _upload(client, app, monkeypatch, n)
+    # reads per row: ~1 pair bucket (dollar x month), +0.36 where the 5-day window
+    # crosses a month; the staged rows are not read back. writes per row: the row,
+    # +0.5 for pair ids and index entries
+    m.check(point_rpcs=6, reads_per_row=1.5, writes_per_row=1.75, batched_rpcs=3)
+
+@pytest.mark.parametrize("n", SIZES)
+def test_replace_upload(client, app, meter, monkeypatch, n):
+    upload_id = _upload(client, app, monkeypatch, n)["uploadId"]
+    with meter("replace-upload", n) as m:
+        _upload(client, app, monkeypatch, n, upload_id=upload_id)
+    # reads per row: 1 key of the old row to delete, plus parse-and-persist's ~1.36.
+    # writes per row: delete, tombstone and unindex of the old row, plus parse-and-persist's ~1.5
+    m.check(point_rpcs=6, reads_per_row=2.5, writes_per_row=4.75, batched_rpcs=6)
+
+@pytest.mark.parametrize("n", SIZES)
+def test_classify_upload(client, app, meter, monkeypatch, n, uid, store):
+    import storage
+    from utils.classification_pipeline import CLASSIFY_BATCH_SIZE, classify_upload
+    upload_id = _upload(client, app, monkeypatch, n)["uploadId"]
+    with meter("classify-upload", n) as m:
+        assert classify_upload(storage.client(), uid, upload_id)
+    # per classify batch: one keyset query plus the transactional read of the upload
+    # that checks the run is still current; anything beyond that is per-row.
+    # reads per row: 1 row from the keyset pages, ~0.04 vendor memory per distinct vendor
+    # (40 here). writes per row: the row update, plus one aggregate doc per batch
+    batches = -(-n // CLASSIFY_BATCH_SIZE) + 1
+    m.check(point_rpcs=6 + 2 * batches, reads_per_row=1.25, writes_per_row=1.2, batched_rpcs=2 * batches)
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bulk_reclassify(client, app, meter, monkeypatch, n):
+    _upload(client, app, monkeypatch, n)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    half = rows[: n // 2]
+    fps = [{"date": r["date"], "memo": r["memo"], "amount": r["amount"]} for r in rows[n // 2:]]
+    with meter("bulk-reclassify", n) as m:
+        res = client.post("/transactions/bulk-reclassify", json={"account": "Meals", "uids": [r["id"] for r in half], "fingerprints": fps})
+    assert res.status_code == 200, res.text
+    assert res.json()["updated"] == n
+    in_queries = -(-len(fps) // 30)
+    # reads per row: 1, by id or by fingerprint query. writes per row: the row,
+    # plus the aggregate docs of the touched months
+    m.check(point_rpcs=2 + in_queries, reads_per_row=1.1, writes_per_row=1.1, batched_rpcs=1)
+
+@pytest.mark.parametrize("n", SIZES)
+def test_vendors_train_bulk(client, meter, n):
+    names = [f"{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i // 676 % 26)}" for i in range(n)]
+    pairs = [{"memo": f"KWIK MART {name}", "account": "Meals"} for name in names]
+    with meter("vendors/train-bulk", n) as m:
+        res = client.post("/vendors/train-bulk", json={"pairs": pairs})
+    assert res.status_code == 200, res.text
+    # per pair: read and write its vendor memory doc
+    m.check(point_rpcs=0, reads_per_row=1.1, writes_per_row=1.1)
+
+class _Resp:
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self._data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._data
+
+class _StubPlaid:
+    """Plaid client serving ``n`` added transactions over two sync pages, then edits and removals."""
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.calls = 0
+
+    def accounts_get(self, req: Any) -> _Resp:
+        return _Resp({"accounts": [
+            {"account_id": "chk", "name": "Checking", "mask": "0001", "type": "depository"},
+            {"account_id": "cc", "name": "Card", "mask": "0002", "type": "credit"},
+        ]})
+
+    def _tx(self, i: int) -> Dict[str, Any]:
+        return {
+            "transaction_id": f"t{i}",
+            "account_id": "cc" if i % 3 == 0 else "chk",
+            "name": f"VENDOR {i % 40} PURCHASE",
+            "amount": (-1 if i % 2 else 1) * (10 + i),
+            "date": f"2024-03-{1 + i % 28:02d}",
+        }
+
+    def transactions_sync(self, req: Any) -> _Resp:
+        self.calls += 1
+        half = self.n // 2
+        if self.calls == 1:
+            return _Resp({"added": [self._tx(i) for i in range(half)], "has_more": True, "next_cursor": "c1"})
+        modified = [self._tx(i) for i in range(0, half, 5)]
+        removed = [{"transaction_id": f"t{i}"} for i in range(1, half, 7)]
+        return _Resp({"added": [self._tx(i) for i in range(half, self.n)], "modified": modified, "removed": removed, "has_more": False, "next_cursor": "c2"})
+
+@pytest.mark.parametrize("n", SIZES)
+def test_plaid_sync(client, meter, monkeypatch, n, uid):
+    import storage
+    import routes.plaid as plaid
+    stub = _StubPlaid(n)
+    monkeypatch.setattr(plaid, "_plaid_client", lambda: stub)
+    storage.client().collection("users").document(uid).collection("plaid_items").document("item1").set({"access_token": "access-sandbox", "institution": "Bank"})
+    with meter("plaid/sync", n) as m:
+        res = client.post("/plaid/sync")
+    assert res.status_code == 200, res.text
+    assert res.json()["synced"] == n
+    # point: items, chart, cursor, bank window per page; batched: memory prefetch,
+    # pair buckets, row chunk, pair sets and removals per page, then learning and version.
+    # reads per row: 1.1 stored rows (added + modified), ~1.5 pair buckets, 0.5 for the
+    # first sync's index rebuild scan, 0.33 bank window of card outflows, 0.07 removals.
+    # writes per row: 1.1 rows, ~1 pair ids and index entries
+    m.check(point_rpcs=8, reads_per_row=4, writes_per_row=2.5, batched_rpcs=16)
@@ -0,0 +1,27 @@
+"""Memo search: served from the per-user index, caught up from the change feed after writes."""
+from test_rpc_budgets import _upload
+
+def test_search_prefix_amount_and_freshness(client, app, monkeypatch, uid, store):
+    import utils.change_log, utils.search_index
+    monkeypatch.setattr(utils.change_log, "CHANGES_SKEW_SECONDS", 0)
+    monkeypatch.setattr(utils.search_index, "CHANGES_SKEW_SECONDS", 0)
+    _upload(client, app, monkeypatch, 120)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+
+    res = client.get("/transactions/search?q=vendor 7 purch")
+    assert res.status_code == 200, res.text
+    want = {r["id"] for r in rows if r["memo"] == "VENDOR 7 PURCHASE"}
+    assert {r["id"] for r in res.json()["transactions"]} == want and res.json()["total"] == len(want)
+
+    store.stats.reset()
+    res = client.get("/transactions/search?q=vend&min=20&max=30.5&limit=500").json()
+    assert {r["id"] for r in res["transactions"]} == {r["id"] for r in rows if 20 <= abs(r["amount"]) <= 30.5}
+    assert store.stats.snapshot()["byKind"].get("query", 0) == 0
+
+    client.post("/transactions/bulk-reclassify", json={"account": "Meals", "uids": [r["id"] for r in rows[:5]]})
+    store.stats.reset()
+    res = client.get("/transactions/search?q=meals").json()
+    assert {r["id"] for r in res["transactions"]} == {r["id"] for r in rows[:5]}
+    # caught up from the change feed (upserts + tombstones), not rescanned
+    assert store.stats.snapshot()["reads"] < 20
+    assert client.get("/transactions/search").status_code == 400
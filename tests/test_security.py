@@ -0,0 +1,56 @@
+"""Verified ID tokens are cached by token hash until 30s before exp; rejected tokens never are."""
+import hashlib
+import pytest
+from fastapi import HTTPException
+
+@pytest.fixture
+def verifier(monkeypatch):
+    import routes.security as security
+    monkeypatch.setattr(security, "_TOKENS", security._TokenCache(16))
+    clock = {"now": 1_000_000.0}
+    monkeypatch.setattr(security.time, "time", lambda: clock["now"])
+    calls = []
+    tokens = {}
+
+    def _verify(token, check_revoked=False):
+        calls.append(token)
+        if token not in tokens:
+            raise ValueError("revoked")
+        return dict(tokens[token])
+
+    monkeypatch.setattr(security.firebase_auth, "verify_id_token", _verify)
+    return security, clock, calls, tokens
+
+def test_cached_until_exp_minus_skew(verifier):
+    security, clock, calls, tokens = verifier
+    tokens["t1"] = {"uid": "u1", "exp": clock["now"] + 300}
+    assert security.verify_bearer("Bearer t1")["uid"] == "u1"
+    assert security.verify_bearer("Bearer t1")["uid"] == "u1"
+    assert calls == ["t1"]
+    assert security._TOKENS.get(hashlib.sha256(b"t1").hexdigest())["uid"] == "u1"
+    clock["now"] += 300 - security._TOKEN_EXP_SKEW - 1
+    security.verify_bearer("Bearer t1")
+    assert calls == ["t1"]
+    clock["now"] += 1
+    security.verify_bearer("Bearer t1")
+    assert calls == ["t1", "t1"]
+
+def test_keyed_by_token_not_uid(verifier):
+    security, clock, calls, tokens = verifier
+    tokens["a"] = {"uid": "u1", "exp": clock["now"] + 300, "email": "a@example.com"}
+    tokens["b"] = {"uid": "u1", "exp": clock["now"] + 300, "email": "b@example.com"}
+    assert security.verify_bearer("Bearer a")["email"] == "a@example.com"
+    assert security.verify_bearer("Bearer b")["email"] == "b@example.com"
+    assert calls == ["a", "b"]
+
+def test_rejected_and_near_expiry_tokens_are_not_cached(verifier):
+    security, clock, calls, tokens = verifier
+    for _ in range(2):
+        with pytest.raises(HTTPException) as e:
+            security.verify_bearer("Bearer revoked")
+        assert e.value.status_code == 401
+    assert calls == ["revoked", "revoked"]
+    tokens["late"] = {"uid": "u1", "exp": clock["now"] + security._TOKEN_EXP_SKEW}
+    security.verify_bearer("Bearer late")
+    security.verify_bearer("Bearer late")
+    assert calls[-2:] == ["late", "late"]
@@ -0,0 +1,68 @@
+"""Parquet snapshot: full build on first read, change-feed patches after, one compact download."""
+import io
+import pandas as pd
+
+from test_rpc_budgets import _upload
+
+def _load(res):
+    return pd.read_parquet(io.BytesIO(res.content))
+
+def test_snapshot_builds_and_patches(client, app, monkeypatch, uid, store):
+    import storage
+    import utils.change_log, utils.snapshot
+    from utils.snapshot import build_snapshot
+    # writes in these tests land well inside the usual in-flight skew
+    monkeypatch.setattr(utils.change_log, "CHANGES_SKEW_SECONDS", 0)
+    monkeypatch.setattr(utils.snapshot, "CHANGES_SKEW_SECONDS", 0)
+    _upload(client, app, monkeypatch, 80)
+    res = client.get("/transactions/snapshot")
+    assert res.status_code == 200, res.text
+    assert res.headers["content-type"].startswith("application/vnd.apache.parquet")
+    df = _load(res)
+    rows = client.get("/transactions?limit=5000").json()["transactions"]
+    assert sorted(df["id"]) == sorted(r["id"] for r in rows)
+    assert round(df["amount"].sum(), 2) == round(sum(r["amount"] for r in rows), 2)
+    assert client.get("/transactions/snapshot", headers={"If-None-Match": res.headers["etag"]}).status_code == 304
+
+    store.stats.reset()
+    assert build_snapshot(storage.client(), uid)["mode"] == "unchanged"
+    assert store.stats.snapshot()["byKind"].get("query", 0) == 2
+
+    client.post("/transactions/bulk-reclassify", json={"account": "Meals", "uids": [r["id"] for r in rows[:10]]})
+    bank = _upload(client, app, monkeypatch, 20, "card")["uploadId"]
+    assert client.post("/delete-upload", json={"uploadId": bank}).status_code == 200
+    store.stats.reset()
+    res = build_snapshot(storage.client(), uid)
+    assert res["mode"] == "incremental" and res["written"] and res["rows"] == 80
+    assert store.stats.snapshot()["reads"] < 80
+
+    df = _load(client.get("/transactions/snapshot")).set_index("id")
+    assert (df.loc[[r["id"] for r in rows[:10]], "account"] == "Meals").all()
+    full = build_snapshot(storage.client(), uid, full=True, dry_run=True)
+    assert full["rows"] == len(df)
+
+def test_concurrent_first_builds_leave_no_orphan_parts(client, app, monkeypatch, uid, store):
+    import threading
+    import storage
+    from utils.snapshot import PARTS, _manifest_ref, build_snapshot
+    _upload(client, app, monkeypatch, 30)
+    db = storage.client()
+    start = threading.Barrier(4)
+
+    def first_build():
+        start.wait()
+        build_snapshot(db, uid)
+
+    threads = [threading.Thread(target=first_build) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    manifest = _manifest_ref(db.collection("users").document(uid)).get().to_dict()
+    parts = [s.id for s in _manifest_ref(db.collection("users").document(uid)).collection(PARTS).stream()]
+    assert parts == [f"{manifest['generation']}-{i}" for i in range(manifest["parts"])]
+
+def test_snapshot_headers_are_exposed_cross_origin(client):
+    res = client.get("/transactions/snapshot", headers={"Origin": "https://app.vercel.app"})
+    exposed = res.headers.get("access-control-expose-headers", "")
+    assert "X-Changes-Token" in exposed and "X-Snapshot-Rows" in exposed
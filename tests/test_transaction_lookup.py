@@ -0,0 +1,60 @@
+"""Transaction ids resolve by doc id, clientUid, slug, and via the per-user cache."""
+import pytest
+
+from storage import MemoryClient
+from utils.fingerprints import lookup_fields, parse_slug
+
+@pytest.fixture
+def tcol(store, uid):
+    import utils.transaction_lookup as tl
+    tl._CACHE.discard(uid)
+    return MemoryClient(store).collection("users").document(uid).collection("transactions")
+
+def _row(tcol, doc_id, date, date_key, memo, amount, migrated=True):
+    rec = {"date": date, "dateKey": date_key, "memo": memo, "amount": amount}
+    if migrated:
+        rec.update(lookup_fields(rec))
+    tcol.document(doc_id).set(rec)
+    return rec
+
+def _find(store, uid, tid):
+    from utils.transaction_lookup import find_transaction
+    ref, rec = find_transaction(MemoryClient(store), uid, tid)
+    return ref.id if ref is not None else None
+
+@pytest.mark.parametrize("slug, key", [
+    ("03/05/2024-ACME, INC-(1,234.56)", ("20240305", 123456)),
+    ("03/05/2024-REFUND (PARTIAL)--42.5", ("20240305", 4250)),
+    ("03%2F05%2F2024-COFFEE-7", ("20240305", 700)),
+    ("2024-03-05-COFFEE-7", None),
+])
+def test_parse_slug(slug, key):
+    assert parse_slug(slug) == key
+
+def test_doc_id_and_client_uid(store, uid, tcol):
+    _row(tcol, "d1", "2024-03-05", "20240305", "COFFEE SHOP", -7.25)
+    assert _find(store, uid, "d1") == "d1"
+    assert _find(store, uid, "2024-03-05-COFFEE SHOP--7.25") == "d1"
+    assert _find(store, uid, "2024-03-05-COFFEE SHOP--9.0") is None
+
+def test_unmigrated_row_found_by_client_uid(store, uid, tcol):
+    _row(tcol, "old", "2024-03-05", "20240305", "LEGACY VENDOR", 12.0, migrated=False)
+    assert _find(store, uid, "2024-03-05-LEGACY VENDOR-12.0") == "old"
+
+def test_slug_with_commas_parentheses_and_sign(store, uid, tcol):
+    _row(tcol, "big", "03/05/2024", "20240305", "ACME, INC", -1234.56)
+    _row(tcol, "small", "03/05/2024", "20240305", "REFUND (PARTIAL)", -42.5)
+    assert _find(store, uid, "03/05/2024-ACME, INC-(1,234.56)") == "big"
+    assert _find(store, uid, "03/05/2024-REFUND (PARTIAL)-(42.50)") == "small"
+
+def test_cache_hit_then_deleted_doc(store, uid, tcol):
+    _row(tcol, "d1", "2024-03-05", "20240305", "COFFEE SHOP", -7.25)
+    tid = "2024-03-05-COFFEE SHOP--7.25"
+    assert _find(store, uid, tid) == "d1"
+    store.stats.reset()
+    assert _find(store, uid, tid) == "d1"
+    assert store.stats.snapshot()["byKind"] == {"get": 1}
+    tcol.document("d1").delete()
+    assert _find(store, uid, tid) is None
+    _row(tcol, "d2", "2024-03-05", "20240305", "COFFEE SHOP", -7.25)
+    assert _find(store, uid, tid) == "d2"
@@ -0,0 +1,81 @@
+"""Pairing reads dollar buckets, not the rows it was handed; failed rows queue (capped) for the next batch."""
+from storage import MemoryClient
+
+def _rows(db, uid, rows):
+    tcol = db.collection("users").document(uid).collection("transactions")
+    for doc_id, rec in rows.items():
+        tcol.document(doc_id).set(rec)
+
+def test_failed_pairing_is_retried_by_next_batch(store, uid, monkeypatch):
+    import utils.transfer_pairing as tp
+    db = MemoryClient(store)
+    _rows(db, uid, {
+        "pay": {"date": "2024-03-04", "dateKey": "20240304", "amount": 250.0, "sourceType": "bank"},
+        "card": {"date": "2024-03-05", "dateKey": "20240305", "amount": -250.0, "sourceType": "card"},
+    })
+    commit_sets = tp._commit_sets
+
+    def _fail(*a, **kw):
+        raise RuntimeError("commit lost")
+
+    monkeypatch.setattr(tp, "_commit_sets", _fail)
+    assert tp.pair_or_defer(db, uid, ["pay", "card"]) == {}
+    meta = db.collection("users").document(uid).collection(tp.PAIR_INDEX).document("_meta").get().to_dict()
+    assert sorted(meta[tp.PAIR_PENDING]) == ["card", "pay"]
+
+    monkeypatch.setattr(tp, "_commit_sets", commit_sets)
+    _rows(db, uid, {"other": {"date": "2024-06-01", "dateKey": "20240601", "amount": 9.0, "sourceType": "bank"}})
+    result = tp.pair_or_defer(db, uid, ["other"])
+    assert result["pay"] == result["card"]
+    tcol = db.collection("users").document(uid).collection("transactions")
+    assert tcol.document("card").get().to_dict()["pairId"] == result["pay"]
+    meta = db.collection("users").document(uid).collection(tp.PAIR_INDEX).document("_meta").get().to_dict()
+    assert meta[tp.PAIR_PENDING] == []
+    assert meta["built"] is True
+
+def _meta(db, uid):
+    import utils.transfer_pairing as tp
+    return db.collection("users").document(uid).collection(tp.PAIR_INDEX).document("_meta").get().to_dict() or {}
+
+def test_staged_rows_pair_across_dollar_boundary_in_one_read(store, uid):
+    import utils.transfer_pairing as tp
+    db = MemoryClient(store)
+    rows = {
+        "pay": {"date": "2024-03-14", "dateKey": "20240314", "amount": 250.0, "sourceType": "bank"},
+        "card": {"date": "2024-03-15", "dateKey": "20240315", "amount": -249.99, "sourceType": "card"},
+    }
+    _rows(db, uid, rows)
+    tp.rebuild_pair_index(db, uid)
+    store.stats.reset()
+    result = tp.pair_batch(db, uid, list(rows), rows)
+    assert result["pay"] == result["card"]
+    # meta plus the 249 and 250 dollar buckets of March, in one multi-get; the rows are not read back
+    assert store.stats.snapshot()["byKind"]["get_all"] == 1 and store.stats.snapshot()["reads"] == 3
+
+def test_index_with_old_bucket_scheme_is_rebuilt(store, uid):
+    import utils.transfer_pairing as tp
+    db = MemoryClient(store)
+    _rows(db, uid, {"pay": {"date": "2024-03-14", "dateKey": "20240314", "amount": 250.0, "sourceType": "bank"}})
+    icol = db.collection("users").document(uid).collection(tp.PAIR_INDEX)
+    icol.document("_meta").set({"built": True})
+    icol.document("25000_202403").set({"entries": {"pay": {}}})
+    _rows(db, uid, {"card": {"date": "2024-03-15", "dateKey": "20240315", "amount": -250.0, "sourceType": "card"}})
+    assert tp.pair_batch(db, uid, ["card"])["card"]
+    assert _meta(db, uid)["scheme"] == tp._INDEX_SCHEME
+    assert not icol.document("25000_202403").get().exists
+
+def test_pending_queue_is_capped(store, uid, monkeypatch):
+    import utils.transfer_pairing as tp
+    db = MemoryClient(store)
+
+    def _fail(*a, **kw):
+        raise RuntimeError("unavailable")
+
+    monkeypatch.setattr(tp, "pair_batch", _fail)
+    monkeypatch.setattr(tp, "PAIR_PENDING_MAX", 3)
+    tp.pair_or_defer(db, uid, ["a", "b"])
+    assert _meta(db, uid)[tp.PAIR_PENDING] == ["a", "b"]
+    tp.pair_or_defer(db, uid, ["b", "c", "d"])
+    # overflow keeps the oldest ids and leaves the rest to a full rebuild
+    meta = _meta(db, uid)
+    assert meta[tp.PAIR_PENDING] == ["a", "b", "c"] and meta["built"] is False
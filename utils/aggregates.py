@@ -0,0 +1,184 @@
+from typing import Any, Dict, Iterable, List, Optional
+import hashlib
+from google.cloud import firestore
+
+from utils.bulk_writes import BULK_CHUNK, BULK_WORKERS, BulkWriteResult, BulkWrites, Op, commit_chunks
+from utils.chart_of_accounts import UNCATEGORIZED
+
+AGGREGATES = "aggregates"
+# Fields a row's aggregate cell is derived from; projections that feed a delta must include them.
+AGGREGATE_FIELDS = ("account", "amount", "dateKey", "sourceType")
+UNDATED = "undated"
+
+def month_of(date_key: Any) -> str:
+    s = str(date_key or "")
+    return s[:6] if len(s) >= 6 and s[:6].isdigit() else UNDATED
+
+def _cents(amount: Any) -> int:
+    try:
+        return int(round(float(amount or 0.0) * 100))
+    except Exception:
+        return 0
+
+def cell_id(account: str, source_type: str) -> str:
+    return hashlib.sha1(f"{account}\x1f{source_type}".encode("utf-8")).hexdigest()[:16]
+
+class AggregateDelta:
+    """Pending changes to a user's monthly aggregate docs, keyed month -> account x sourceType."""
+
+    def __init__(self) -> None:
+        self.months: Dict[str, Dict[str, List[Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.months)
+
+    def add(self, rec: Optional[Dict[str, Any]], sign: int = 1) -> None:
+        if not rec:
+            return
+        account = str(rec.get("account") or "") or UNCATEGORIZED
+        source_type = str(rec.get("sourceType") or "bank")
+        cell = self.months.setdefault(month_of(rec.get("dateKey")), {}).setdefault(cell_id(account, source_type), [account, source_type, 0, 0])
+        cell[2] += sign * _cents(rec.get("amount"))
+        cell[3] += sign
+
+    def move(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        self.add(old, -1)
+        self.add(new, 1)
+
+    def ops(self, uref: Any) -> List[Op]:
+        out: List[Op] = []
+        for month, cells in self.months.items():
+            changed = {
+                cid: {"account": a, "sourceType": st, "cents": firestore.Increment(cents), "count": firestore.Increment(n)}
+                for cid, (a, st, cents, n) in cells.items() if cents or n
+            }
+            if changed:
+                out.append(("set", uref.collection(AGGREGATES).document(month), {"month": month, "cells": changed, "updatedAt": firestore.SERVER_TIMESTAMP}, True))
+        return out
+
+    def stage(self, batch: Any, uref: Any) -> None:
+        for _, ref, data, merge in self.ops(uref):
+            batch.set(ref, data, merge=merge)
+
+def _after(kind: str, old: Optional[Dict[str, Any]], data: Optional[Dict[str, Any]], merge: bool) -> Optional[Dict[str, Any]]:
+    if kind == "delete":
+        return None
+    if kind == "update" or merge:
+        return {**(old or {}), **(data or {})}
+    return dict(data or {})
+
+class AggregatedWrites(BulkWrites):
+    """BulkWrites for a user's transactions whose chunks carry their own aggregate increments.
+
+    Pass ``old`` (the row as stored, at least AGGREGATE_FIELDS; None for new
+    rows) with each op. A chunk commits its rows and the matching increments
+    atomically, so a failed chunk leaves the aggregates consistent.
+    ``commit()`` reports row ops only in ``committed_ops``.
+    """
+
+    def __init__(self, db: Any, uref: Any, chunk: int = BULK_CHUNK) -> None:
+        super().__init__(db, chunk)
+        self._uref = uref
+        self._before: List[Optional[Dict[str, Any]]] = []
+        self.chunk_rows: List[int] = []
+
+    def set(self, ref: Any, data: Dict[str, Any], merge: bool = False, old: Optional[Dict[str, Any]] = None) -> None:
+        super().set(ref, data, merge)
+        self._before.append(old)
+
+    def update(self, ref: Any, data: Dict[str, Any], old: Optional[Dict[str, Any]] = None) -> None:
+        super().update(ref, data)
+        self._before.append(old)
+
+    def delete(self, ref: Any, old: Optional[Dict[str, Any]] = None) -> None:
+        super().delete(ref)
+        self._before.append(old)
+
+    def take_chunks(self) -> List[List[Op]]:
+        ops, self._ops = self._ops, []
+        before, self._before = self._before, []
+        chunks: List[List[Op]] = []
+        self.chunk_rows = []
+        rows: List[Op] = []
+        delta = AggregateDelta()
+        for op, old in zip(ops, before):
+            new = _after(op[0], old, op[2], op[3])
+            months = set(delta.months) | {month_of(r.get("dateKey")) for r in (old, new) if r}
+            if rows and len(rows) + len(months) >= self._chunk:
+                chunks.append(rows + delta.ops(self._uref))
+                self.chunk_rows.append(len(rows))
+                rows, delta = [], AggregateDelta()
+            rows.append(op)
+            delta.move(old, new)
+        if rows:
+            chunks.append(rows + delta.ops(self._uref))
+            self.chunk_rows.append(len(rows))
+        return chunks
+
+    def commit(self, workers: int = BULK_WORKERS) -> BulkWriteResult:
+        res = commit_chunks(self._db, self.take_chunks(), workers=workers)
+        res.committed_ops = sum(n for i, n in enumerate(self.chunk_rows) if i not in res.errors)
+        return res
+
+def rebuild_docs(rows: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Absolute aggregate docs (no transforms) for a full set of rows."""
+    delta = AggregateDelta()
+    for rec in rows:
+        delta.add(rec)
+    return {
+        month: {"month": month, "cells": {cid: {"account": a, "sourceType": st, "cents": cents, "count": n} for cid, (a, st, cents, n) in cells.items() if n}}
+        for month, cells in delta.months.items()
+    }
+
+def _section(kind: str) -> str:
+    return {"Income": "income", "COGS": "cogs", "Asset": "assets", "Liability": "liabilities", "Equity": "equity"}.get(kind, "expenses")
+
+def summarize(docs: Iterable[Dict[str, Any]], chart: Any, start: str = "", end: str = "") -> Dict[str, Any]:
+    """P&L for months in [start, end] and balances as of ``end`` from aggregate docs.
+
+    Signs follow the journal: a row debits its account by ``amount`` and
+    credits its source, so income shows as a negative debit and is flipped.
+    """
+    pnl: Dict[str, Dict[str, float]] = {"income": {}, "cogs": {}, "expenses": {}}
+    balances: Dict[str, Dict[str, float]] = {"assets": {}, "liabilities": {}, "equity": {}}
+    by_source: Dict[str, float] = {}
+    months: Dict[str, Dict[str, Any]] = {}
+    rows = 0
+    for doc in docs:
+        month = str(doc.get("month") or "")
+        if end and month > end and month != UNDATED:
+            continue
+        in_range = month == UNDATED or not start or month >= start
+        for cell in (doc.get("cells") or {}).values():
+            account = str(cell.get("account") or UNCATEGORIZED)
+            source_type = str(cell.get("sourceType") or "bank")
+            amount = int(cell.get("cents") or 0) / 100.0
+            n = int(cell.get("count") or 0)
+            section = _section(chart.type_of(account))
+            by_source[source_type] = by_source.get(source_type, 0.0) - amount
+            if section in balances:
+                balances[section][account] = balances[section].get(account, 0.0) + amount
+                continue
+            if not in_range:
+                continue
+            rows += n
+            value = -amount if section == "income" else amount
+            pnl[section][account] = pnl[section].get(account, 0.0) + value
+            m = months.setdefault(month, {"month": month, "income": 0.0, "cogs": 0.0, "expenses": 0.0, "count": 0})
+            m[section] += value
+            m["count"] += n
+    totals = {k: round(sum(v.values()), 2) for k, v in pnl.items()}
+    totals["grossProfit"] = round(totals["income"] - totals["cogs"], 2)
+    totals["netIncome"] = round(totals["grossProfit"] - totals["expenses"], 2)
+    for m in months.values():
+        for k in ("income", "cogs", "expenses"):
+            m[k] = round(m[k], 2)
+        m["netIncome"] = round(m["income"] - m["cogs"] - m["expenses"], 2)
+    return {
+        "pnl": {k: {a: round(v, 2) for a, v in sorted(sec.items())} for k, sec in pnl.items()},
+        "totals": totals,
+        "months": [months[k] for k in sorted(months)],
+        "balances": {k: {a: round(v, 2) for a, v in sorted(sec.items())} for k, sec in balances.items()},
+        "bySourceType": {k: round(v, 2) for k, v in sorted(by_source.items())},
+        "count": rows,
+    }
@@ -0,0 +1,44 @@
+from typing import Any, List, Sequence
+import asyncio
+import storage
+
+from utils.bulk_writes import BULK_RETRIES, BULK_WORKERS, RETRYABLE_ERRORS, BulkWriteResult, Op, apply_op, backoff_delay, should_retry
+
+def async_db() -> Any:
+    """The app's shared ``firestore.AsyncClient``, or the in-memory one when STORAGE_BACKEND is local."""
+    return storage.async_client()
+
+async def stream_all(query: Any) -> List[Any]:
+    return [snap async for snap in query.stream()]
+
+async def get_all(adb: Any, refs: Sequence[Any], **kw: Any) -> List[Any]:
+    return [snap async for snap in adb.get_all(list(refs), **kw)] if refs else []
+
+async def _commit_chunk(adb: Any, ops: Sequence[Op], sem: asyncio.Semaphore, retries: int) -> None:
+    attempt = 0
+    while True:
+        batch = adb.batch()
+        for op in ops:
+            apply_op(batch, op)
+        try:
+            async with sem:
+                await batch.commit()
+            return
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > retries or not should_retry(ops, e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+async def commit_chunks_async(adb: Any, chunks: Sequence[Sequence[Op]], workers: int = BULK_WORKERS, retries: int = BULK_RETRIES) -> BulkWriteResult:
+    """Async form of bulk_writes.commit_chunks: each chunk is one batch, ``workers`` in flight."""
+    chunks = [c for c in chunks if c]
+    result = BulkWriteResult(len(chunks))
+    sem = asyncio.Semaphore(max(1, workers))
+    outcomes = await asyncio.gather(*(_commit_chunk(adb, c, sem, retries) for c in chunks), return_exceptions=True)
+    for i, (chunk, err) in enumerate(zip(chunks, outcomes)):
+        if isinstance(err, BaseException):
+            result.errors[i] = f"{type(err).__name__}: {err}"[:300]
+        else:
+            result.committed_ops += len(chunk)
+    return result
@@ -0,0 +1,170 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import os, random, threading, time
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+
+BULK_CHUNK = 450
+BULK_WORKERS = int(os.environ.get("BULK_WRITE_WORKERS", "8") or 8)
+BULK_RETRIES = int(os.environ.get("BULK_WRITE_RETRIES", "5") or 5)
+_BACKOFF_BASE = 0.25
+_BACKOFF_CAP = 8.0
+RETRYABLE_ERRORS = (gexc.Aborted, gexc.DeadlineExceeded, gexc.ResourceExhausted, gexc.ServiceUnavailable, gexc.InternalServerError)
+# The commit may have landed before these were raised; re-sending is only safe for idempotent chunks.
+UNKNOWN_OUTCOME_ERRORS = (gexc.DeadlineExceeded, gexc.InternalServerError)
+
+# An op is (kind, ref, data, merge) with kind in "set", "update", "delete".
+Op = Tuple[str, Any, Optional[Dict[str, Any]], bool]
+
+class BulkWriteResult:
+    def __init__(self, chunks: int) -> None:
+        self.chunks = chunks
+        self.committed_ops = 0
+        self.errors: Dict[int, str] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def failed(self) -> List[int]:
+        return sorted(self.errors)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "committedOps": self.committed_ops,
+            "failedChunks": [{"chunk": i, "error": self.errors[i]} for i in self.failed],
+        }
+
+class _Throttle:
+    """Caps in-flight commits; halves the cap on contention and regrows it on success."""
+
+    def __init__(self, limit: int) -> None:
+        self._max = max(1, limit)
+        self._limit = self._max
+        self._active = 0
+        self._cv = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cv:
+            while self._active >= self._limit:
+                self._cv.wait()
+            self._active += 1
+
+    def release(self, ok: bool) -> None:
+        with self._cv:
+            self._active -= 1
+            self._limit = min(self._max, self._limit + 1) if ok else max(1, self._limit // 2)
+            self._cv.notify_all()
+
+def backoff_delay(attempt: int) -> float:
+    return min(_BACKOFF_CAP, _BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+def apply_op(batch: Any, op: Op) -> None:
+    kind, ref, data, merge = op
+    if kind == "delete":
+        batch.delete(ref)
+    elif kind == "update":
+        batch.update(ref, data)
+    else:
+        batch.set(ref, data, merge=merge)
+
+def _has_increment(value: Any) -> bool:
+    if isinstance(value, firestore.Increment):
+        return True
+    if isinstance(value, dict):
+        return any(_has_increment(v) for v in value.values())
+    return False
+
+def should_retry(ops: Sequence[Op], error: Exception) -> bool:
+    """Whether a chunk that failed with a RETRYABLE_ERRORS error may be sent again.
+
+    A chunk carrying Increment transforms (aggregate cells, vendor counts) is
+    not re-sent after an outcome-unknown error: if the first commit landed, a
+    second one would count it twice. It is reported failed instead; the chunk
+    was atomic, so rows and their increments either both landed or neither did.
+    """
+    if isinstance(error, UNKNOWN_OUTCOME_ERRORS):
+        return not any(_has_increment(op[2]) for op in ops if op[2])
+    return True
+
+def _commit_chunk(db: Any, ops: Sequence[Op], throttle: _Throttle, retries: int) -> None:
+    attempt = 0
+    while True:
+        batch = db.batch()
+        for op in ops:
+            apply_op(batch, op)
+        throttle.acquire()
+        try:
+            batch.commit()
+        except RETRYABLE_ERRORS as e:
+            throttle.release(False)
+            attempt += 1
+            if attempt > retries or not should_retry(ops, e):
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        except Exception:
+            throttle.release(False)
+            raise
+        throttle.release(True)
+        return
+
+def commit_chunks(db: Any, chunks: Sequence[Sequence[Op]], workers: int = BULK_WORKERS, retries: int = BULK_RETRIES) -> BulkWriteResult:
+    """Commit each chunk as one batch, several at a time.
+
+    Chunks are atomic on their own but independent of each other; the result
+    says which ones failed after retries. Chunks with Increment transforms are
+    not retried on outcome-unknown errors (see should_retry).
+    """
+    chunks = [c for c in chunks if c]
+    result = BulkWriteResult(len(chunks))
+    if not chunks:
+        return result
+    throttle = _Throttle(workers)
+    lock = threading.Lock()
+
+    def _run(i: int) -> None:
+        try:
+            _commit_chunk(db, chunks[i], throttle, retries)
+        except Exception as e:
+            with lock:
+                result.errors[i] = f"{type(e).__name__}: {e}"[:300]
+            return
+        with lock:
+            result.committed_ops += len(chunks[i])
+
+    if len(chunks) == 1:
+        _run(0)
+        return result
+    with ThreadPoolExecutor(max_workers=min(max(1, workers), len(chunks)), thread_name_prefix="bulk-write") as pool:
+        list(pool.map(_run, range(len(chunks))))
+    return result
+
+class BulkWrites:
+    """Batch-compatible collector (set/update/delete) that commits in parallel chunks."""
+
+    def __init__(self, db: Any, chunk: int = BULK_CHUNK) -> None:
+        self._db = db
+        self._chunk = max(1, min(chunk, 500))
+        self._ops: List[Op] = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def set(self, ref: Any, data: Dict[str, Any], merge: bool = False) -> None:
+        self._ops.append(("set", ref, data, merge))
+
+    def update(self, ref: Any, data: Dict[str, Any]) -> None:
+        self._ops.append(("update", ref, data, False))
+
+    def delete(self, ref: Any) -> None:
+        self._ops.append(("delete", ref, None, False))
+
+    def take_chunks(self) -> List[List[Op]]:
+        ops, self._ops = self._ops, []
+        return [ops[i:i + self._chunk] for i in range(0, len(ops), self._chunk)]
+
+    def commit(self, workers: int = BULK_WORKERS) -> BulkWriteResult:
+        return commit_chunks(self._db, self.take_chunks(), workers=workers)
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime, timedelta, timezone
+import base64
+from google.cloud import firestore
+
+TOMBSTONES = "tombstones"
+TOMBSTONE_RETENTION_DAYS = 90
+CHANGES_SKEW_SECONDS = 5
+MAX_CHANGES = 5000
+
+def _expire_at() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+def tombstone_data() -> Dict[str, Any]:
+    return {"deletedAt": firestore.SERVER_TIMESTAMP, "expireAt": _expire_at()}
+
+def stage_tombstones(batch: Any, uref: Any, doc_ids: Iterable[str]) -> int:
+    """Record deletions of users/{uid}/transactions docs in the same batch as the deletes."""
+    tcol = uref.collection(TOMBSTONES)
+    n = 0
+    for doc_id in doc_ids:
+        batch.set(tcol.document(doc_id), tombstone_data())
+        n += 1
+    return n
+
+def encode_token(at: datetime) -> str:
+    return base64.urlsafe_b64encode(at.astimezone(timezone.utc).isoformat().encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_token(token: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+        at = datetime.fromisoformat(raw)
+    except Exception:
+        raise ValueError("invalid token")
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+def changes_since(db: firestore.Client, uid: str, since: Optional[datetime], limit: int = MAX_CHANGES) -> Dict[str, Any]:
+    """Transactions upserted and deleted after ``since``.
+
+    The returned token trails the request start by CHANGES_SKEW_SECONDS so
+    writes still in flight are picked up next time; clients apply changes
+    idempotently. ``reset`` asks the client to reload from scratch.
+    """
+    now = datetime.now(timezone.utc)
+    token = encode_token(now - timedelta(seconds=CHANGES_SKEW_SECONDS))
+    if since is None or since < now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        return {"reset": True, "token": token, "upserts": [], "deleted": []}
+    uref = db.collection("users").document(uid)
+    upserts: List[Dict[str, Any]] = []
+    for s in uref.collection("transactions").where("updatedAt", ">", since).order_by("updatedAt").limit(limit + 1).stream():
+        rec = s.to_dict() or {}
+        rec["id"] = s.id
+        upserts.append(rec)
+    if len(upserts) > limit:
+        return {"reset": True, "token": token, "upserts": [], "deleted": []}
+    live = {r["id"] for r in upserts}
+    deleted: List[str] = []
+    for s in uref.collection(TOMBSTONES).where("deletedAt", ">", since).order_by("deletedAt").select([]).limit(limit + 1).stream():
+        if s.id not in live:
+            deleted.append(s.id)
+    if len(deleted) > limit:
+        return {"reset": True, "token": token, "upserts": [], "deleted": []}
+    return {"reset": False, "token": token, "upserts": upserts, "deleted": deleted}
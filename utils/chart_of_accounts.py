@@ -0,0 +1,210 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from functools import lru_cache
+import hashlib, os, json, time, threading
+
+DEFAULT_ACCOUNTS: List[str] = [
+    "1000 - Checking Account","1010 - Savings Account","1020 - Petty Cash",
+    "1030 - Accounts Receivable","1050 - Inventory","1060 - Fixed Assets",
+    "1070 - Accumulated Depreciation","2000 - Accounts Payable","2010 - Credit Card Payables",
+    "2040 - Loan Payable","2020 - Payroll Liabilities","2030 - Sales Tax Payable",
+    "3000 - Contributions","3010 - Draws","3020 - Retained Earnings",
+    "4000 - Product Sales","4010 - Service Income","4020 - Subscription Revenue",
+    "4030 - Consulting Income","4040 - Other Revenue","4090 - Refunds and Discounts",
+    "5000 - Inventory Purchases","5010 - Subcontracted Labor","5020 - Packaging & Shipping Supplies",
+    "5030 - Merchant Fees",
+    "6000 - Salaries and Wages","6010 - Payroll Taxes","6020 - Employee Benefits",
+    "6030 - Independent Contractors","6040 - Bonuses & Commissions","6050 - Workers Compensation Insurance",
+    "6060 - Recruiting & Hiring","6100 - Rent or Lease Expense","6110 - Utilities","6120 - Insurance",
+    "6130 - Repairs & Maintenance","6140 - Office Supplies","6150 - Telephone & Internet",
+    "6200 - Advertising & Promotion","6210 - Social Media & Digital Ads",
+    "6220 - Meals & Entertainment","6230 - Client Gifts",
+    "6300 - Software Subscriptions","6310 - Bank Fees","6320 - Dues & Licenses","6330 - Postage & Delivery",
+    "6340 - Interest Expense",
+    "6400 - Legal Fees","6410 - Accounting & Bookkeeping","6420 - Consulting Fees","6430 - Tax Prep & Advisory",
+    "6500 - Travel - Airfare","6510 - Travel - Lodging","6520 - Travel - Meals","6530 - Travel - Other (Taxis, Parking)",
+    "8000 - State Income Tax","8010 - Franchise Tax","8020 - Local Business Taxes","8030 - Estimated Tax Payments",
+    "7090 - Uncategorized Expense",
+]
+
+DEFAULT_GROUPS: Dict[str, List[str]] = {
+    "Cash": ["1000 - Checking Account","1010 - Savings Account","1020 - Petty Cash"],
+    "Accounts Receivable": ["1030 - Accounts Receivable"],
+    "Prepaid Expenses": ["1040 - Prepaid Expenses"],
+    "Fixed Assets": ["1060 - Fixed Assets","1070 - Accumulated Depreciation"],
+    "Other Asset": ["1050 - Inventory"],
+    "Accounts Payable": ["2000 - Accounts Payable"],
+    "Credit Cards": ["2010 - Credit Card Payables"],
+    "Loans": ["2040 - Loan Payable"],
+    "Other Liabilities": ["2020 - Payroll Liabilities","2030 - Sales Tax Payable"],
+    "Contributions": ["3000 - Contributions"],
+    "Draws": ["3010 - Draws"],
+    "Retained Earnings": ["3020 - Retained Earnings"],
+    "Revenue": ["4000 - Product Sales","4010 - Service Income","4020 - Subscription Revenue","4030 - Consulting Income","4040 - Other Revenue","4090 - Refunds and Discounts"],
+    "COGS": ["5000 - Inventory Purchases","5010 - Subcontracted Labor","5020 - Packaging & Shipping Supplies","5030 - Merchant Fees"],
+    "Operating Expenses": ["6000 - Salaries and Wages","6010 - Payroll Taxes","6020 - Employee Benefits","6030 - Independent Contractors","6040 - Bonuses & Commissions","6050 - Workers Compensation Insurance","6060 - Recruiting & Hiring"],
+    "Facilities & Overhead": ["6100 - Rent or Lease Expense","6110 - Utilities","6120 - Insurance","6130 - Repairs & Maintenance","6140 - Office Supplies","6150 - Telephone & Internet"],
+    "Marketing & Sales": ["6200 - Advertising & Promotion","6210 - Social Media & Digital Ads"],
+    "Meals & Entertainment": ["6220 - Meals & Entertainment"],
+    "Gifts": ["6230 - Client Gifts"],
+    "General & Admin": ["6300 - Software Subscriptions","6310 - Bank Fees","6320 - Dues & Licenses","6330 - Postage & Delivery","6340 - Interest Expense"],
+    "Professional Services": ["6400 - Legal Fees","6410 - Accounting & Bookkeeping","6420 - Consulting Fees","6430 - Tax Prep & Advisory"],
+    "Travel": ["6500 - Travel - Airfare","6510 - Travel - Lodging","6520 - Travel - Meals","6530 - Travel - Other (Taxis, Parking)"],
+    "Taxes": ["8000 - State Income Tax","8010 - Franchise Tax","8020 - Local Business Taxes","8030 - Estimated Tax Payments"],
+    "Uncategorized": ["7090 - Uncategorized Expense"],
+}
+
+UNCATEGORIZED = "7090 - Uncategorized Expense"
+USER_CHART_TTL_SECONDS = 300.0
+USER_CHART_MAX_ENTRIES = 2048
+_RESOLVE_CACHE_MAX = 4096
+
+def account_type(account: str) -> str:
+    s = (account or "").strip()
+    code = ""
+    for ch in s:
+        if ch.isdigit(): code += ch
+        else: break
+    if code:
+        d = code[0]
+        if d == "1": return "Asset"
+        if d == "2": return "Liability"
+        if d == "3": return "Equity"
+        if d == "4": return "Income"
+        if d == "5": return "COGS"
+        if d in ("6","7","8","9"): return "Expense"
+    if any(ch.isdigit() for ch in s[-6:]):
+        return "Liability"
+    return "Expense"
+
+class ChartOfAccounts:
+    """Compiled chart: exact label map, token inverted index and account types."""
+
+    def __init__(self, labels: Sequence[str], groups: Optional[Dict[str, List[str]]] = None) -> None:
+        seen = set()
+        self.labels: List[str] = []
+        for label in labels:
+            label = str(label or "")
+            if label and label not in seen:
+                seen.add(label)
+                self.labels.append(label)
+        self.groups: Dict[str, List[str]] = dict(groups if groups is not None else DEFAULT_GROUPS)
+        self._lowers = [a.lower() for a in self.labels]
+        self.exact: Dict[str, str] = {}
+        for label, low in zip(self.labels, self._lowers):
+            self.exact[low] = label
+        self.token_index: Dict[str, List[int]] = {}
+        for i, low in enumerate(self._lowers):
+            for tok in set(t for t in low.split(" ") if t):
+                self.token_index.setdefault(tok, []).append(i)
+        self.types: Dict[str, str] = {a: account_type(a) for a in self.labels}
+        self.fallback = next((a for a, low in zip(self.labels, self._lowers) if "uncategorized" in low), self.labels[0] if self.labels else UNCATEGORIZED)
+        self._resolved: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # identifies the chart's contents, for caches and ETags derived from it
+        self.fingerprint = hashlib.sha1(json.dumps([self.labels, self.groups], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def type_of(self, account: str) -> str:
+        return self.types.get(account) or account_type(account)
+
+    def resolve(self, chosen: str) -> str:
+        if not chosen:
+            return self.fallback
+        if not self.labels:
+            return chosen
+        c = chosen.strip().lower()
+        hit = self.exact.get(c)
+        if hit:
+            return hit
+        hit = self._resolved.get(c)
+        if hit:
+            return hit
+        hit = self._resolve_fuzzy(c)
+        with self._lock:
+            if len(self._resolved) >= _RESOLVE_CACHE_MAX:
+                self._resolved.clear()
+            self._resolved[c] = hit
+        return hit
+
+    def _resolve_fuzzy(self, c: str) -> str:
+        for label, low in zip(self.labels, self._lowers):
+            if c in low or low in c:
+                return label
+        hits: Dict[int, int] = {}
+        for tok in (t for t in c.split(" ") if t):
+            for i in self.token_index.get(tok, ()):
+                hits[i] = hits.get(i, 0) + 1
+        if not hits:
+            return self.labels[0]
+        best = min(hits.items(), key=lambda kv: (-kv[1], kv[0]))[0]
+        return self.labels[best]
+
+    @staticmethod
+    def coerce(allowed: Any) -> Optional["ChartOfAccounts"]:
+        if isinstance(allowed, ChartOfAccounts):
+            return allowed if allowed.labels else None
+        if not allowed:
+            return None
+        return _compiled(tuple(str(a) for a in allowed))
+
+@lru_cache(maxsize=64)
+def _compiled(labels: Tuple[str, ...]) -> ChartOfAccounts:
+    return ChartOfAccounts(labels)
+
+def _env_accounts() -> List[str]:
+    raw = os.environ.get("ALLOWED_ACCOUNTS_JSON", "").strip()
+    if raw:
+        try:
+            arr = json.loads(raw)
+            if isinstance(arr, list):
+                return [str(x) for x in arr if x]
+        except Exception:
+            pass
+    return list(DEFAULT_ACCOUNTS)
+
+@lru_cache(maxsize=1)
+def default_chart() -> ChartOfAccounts:
+    return ChartOfAccounts(_env_accounts())
+
+_user_charts: Dict[str, Tuple[float, ChartOfAccounts]] = {}
+_user_charts_lock = threading.Lock()
+
+def _load_user_chart(db: Any, uid: str) -> ChartOfAccounts:
+    try:
+        snap = db.collection("users").document(uid).collection("settings").document("chartOfAccounts").get()
+        data = (snap.to_dict() or {}) if snap.exists else {}
+    except Exception:
+        data = {}
+    accounts = [str(x) for x in (data.get("accounts") or []) if x]
+    if not accounts:
+        return default_chart()
+    groups = data.get("groups")
+    if not isinstance(groups, dict):
+        groups = {}
+        for label in accounts:
+            groups.setdefault(account_type(label), []).append(label)
+    return ChartOfAccounts(accounts, {str(k): [str(x) for x in (v or [])] for k, v in groups.items()})
+
+def chart_for_user(db: Any, uid: Optional[str]) -> ChartOfAccounts:
+    if db is None or not uid:
+        return default_chart()
+    now = time.monotonic()
+    hit = _user_charts.get(uid)
+    if hit and hit[0] > now:
+        return hit[1]
+    chart = _load_user_chart(db, uid)
+    with _user_charts_lock:
+        if len(_user_charts) >= USER_CHART_MAX_ENTRIES:
+            for k in [k for k, v in _user_charts.items() if v[0] <= now] or list(_user_charts)[: USER_CHART_MAX_ENTRIES // 4]:
+                _user_charts.pop(k, None)
+        _user_charts[uid] = (now + USER_CHART_TTL_SECONDS, chart)
+    return chart
+
+def invalidate_user_chart(uid: str) -> None:
+    with _user_charts_lock:
+        _user_charts.pop(uid, None)
@@ -0,0 +1,245 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+import logging, os, socket, threading, uuid
+
+from utils.clean_vendor_name import clean_vendor_name
+from utils.classify_transaction import finalize_classification, prefetch_vendor_memory, LearningBatch, record_learning_batch
+from utils.chart_of_accounts import chart_for_user
+from utils.data_version import bump_version, stage_version_bump
+from utils.aggregates import AggregateDelta
+
+CLASSIFY_BATCH_SIZE = int(os.environ.get("CLASSIFY_BATCH_SIZE", "50") or 50)
+CLASSIFY_WORKERS = int(os.environ.get("CLASSIFY_WORKERS", "4") or 4)
+CLASSIFY_LEASE_SECONDS = int(os.environ.get("CLASSIFY_LEASE_SECONDS", "300") or 300)
+
+logger = logging.getLogger(__name__)
+
+def _lease_until() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=CLASSIFY_LEASE_SECONDS)
+
+def claim_upload(db: firestore.Client, uid: str, upload_id: str, owner: str) -> bool:
+    """Take (or renew) the classify lease on a "classifying" upload.
+
+    Every instance resumes pending uploads on startup; the lease makes sure
+    only one of them classifies a given upload, so rows and vendor-learning
+    increments are not applied twice. An expired lease can be taken over.
+    """
+    upref = db.collection("users").document(uid).collection("uploads").document(upload_id)
+
+    @firestore.transactional
+    def _claim(txn: Any) -> bool:
+        snap = upref.get(transaction=txn)
+        if not snap.exists:
+            return False
+        up = snap.to_dict() or {}
+        if up.get("status") != "classifying":
+            return False
+        until = up.get("classifyLeaseUntil")
+        if until is not None and up.get("classifyOwner") != owner and until > datetime.now(timezone.utc):
+            return False
+        txn.update(upref, {"classifyOwner": owner, "classifyLeaseUntil": _lease_until()})
+        return True
+
+    return _claim(db.transaction())
+
+def _current(snap: Any, run: int, owner: str) -> bool:
+    """Whether the run that read ``run`` (and holds ``owner``'s lease) still owns the upload."""
+    up = (snap.to_dict() or {}) if snap.exists else {}
+    return snap.exists and int(up.get("classifyRun") or 0) == run and (not owner or up.get("classifyOwner") == owner)
+
+def mark_failed(db: firestore.Client, uid: str, upload_id: str, error: Exception, owner: str = "") -> None:
+    """Set a failed run's upload to "error", unless (with ``owner``) a replace or another
+    instance has taken the upload over since."""
+    upref = db.collection("users").document(uid).collection("uploads").document(upload_id)
+
+    @firestore.transactional
+    def _mark(txn: Any) -> bool:
+        snap = upref.get(transaction=txn)
+        if not snap.exists or (owner and (snap.to_dict() or {}).get("classifyOwner") != owner):
+            return False
+        txn.update(upref, {
+            "status": "error",
+            "classifyError": f"{type(error).__name__}: {error}"[:500],
+            "classifyOwner": firestore.DELETE_FIELD,
+            "classifyLeaseUntil": firestore.DELETE_FIELD,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        return True
+
+    try:
+        if _mark(db.transaction()):
+            bump_version(db, uid)
+    except Exception:
+        logger.exception("could not mark upload %s/%s as failed", uid, upload_id)
+
+def classify_upload(db: firestore.Client, uid: str, upload_id: str, should_stop: Callable[[], bool] = lambda: False, owner: str = "") -> bool:
+    """Classify an upload's rows in batches; returns True once the upload is ready.
+
+    Each batch commits its row updates together with the upload's progress
+    counters and cursor, so a restarted worker resumes after the last
+    committed batch. With ``owner`` each batch also renews the classify lease.
+
+    Every batch, and the final "ready", is a transaction that first checks
+    the upload's ``classifyRun`` (bumped by replace-upload) and lease are
+    still the ones this run started with; if not, the run stops quietly and
+    leaves the upload to the run that replaced it.
+    """
+    uref = db.collection("users").document(uid)
+    upref = uref.collection("uploads").document(upload_id)
+    snap = upref.get()
+    if not snap.exists:
+        return False
+    up = snap.to_dict() or {}
+    run = int(up.get("classifyRun") or 0)
+    cursor = str(up.get("classifyCursor") or "")
+    done = int(up.get("classifiedCount") or 0)
+    chart = chart_for_user(db, uid)
+    tcol = uref.collection("transactions")
+    base = tcol.where("uploadId", "==", upload_id).order_by("__name__")
+
+    @firestore.transactional
+    def _commit(txn: Any, updates: List[Tuple[Any, Dict[str, Any]]], delta: AggregateDelta, progress: Dict[str, Any]) -> bool:
+        if not _current(upref.get(transaction=txn), run, owner):
+            return False
+        for ref, data in updates:
+            txn.update(ref, data)
+        txn.update(upref, progress)
+        delta.stage(txn, uref)
+        stage_version_bump(txn, uref)
+        return True
+
+    while True:
+        if should_stop():
+            return False
+        q = base.start_after({"__name__": tcol.document(cursor)}) if cursor else base
+        docs = list(q.limit(CLASSIFY_BATCH_SIZE).stream())
+        if not docs:
+            break
+        rows = []
+        for d in docs:
+            rec = d.to_dict() or {}
+            memo = str(rec.get("memo") or "")
+            rows.append((d, rec, memo, clean_vendor_name(memo).lower()))
+        user_cache, global_cache = prefetch_vendor_memory(db, uid, [r[3] for r in rows])
+        learning = LearningBatch()
+        delta = AggregateDelta()
+        updates = []
+        for d, rec, memo, vendor_key in rows:
+            account, via = finalize_classification(
+                db=db, uid=uid, vendor_key=vendor_key, memo=memo,
+                amount=float(rec.get("amount") or 0.0), source=str(rec.get("source") or ""),
+                allowed_accounts=chart, user_mem_cache=user_cache, global_mem_cache=global_cache,
+            )
+            learning.add(vendor_key, account, uid)
+            updates.append((d.reference, {"account": account, "classificationSource": via, "updatedAt": firestore.SERVER_TIMESTAMP}))
+            delta.move(rec, {**rec, "account": account})
+        progress = {"classifiedCount": done + len(docs), "classifyCursor": docs[-1].id, "updatedAt": firestore.SERVER_TIMESTAMP}
+        if owner:
+            progress["classifyLeaseUntil"] = _lease_until()
+        if not _commit(db.transaction(), updates, delta, progress):
+            logger.info("classification of upload %s/%s superseded; stopping", uid, upload_id)
+            return False
+        done += len(docs)
+        cursor = docs[-1].id
+        record_learning_batch(db, learning)
+        if len(docs) < CLASSIFY_BATCH_SIZE:
+            break
+
+    @firestore.transactional
+    def _finish(txn: Any) -> bool:
+        if not _current(upref.get(transaction=txn), run, owner):
+            return False
+        txn.update(upref, {
+            "status": "ready", "classifiedCount": done, "classifyCursor": firestore.DELETE_FIELD,
+            "classifyOwner": firestore.DELETE_FIELD, "classifyLeaseUntil": firestore.DELETE_FIELD, "classifyError": firestore.DELETE_FIELD,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        return True
+
+    if not _finish(db.transaction()):
+        return False
+    bump_version(db, uid)
+    return True
+
+class ClassificationPipeline:
+    """Worker pool that classifies uploads in the background."""
+
+    def __init__(self, workers: int = CLASSIFY_WORKERS) -> None:
+        self._workers = max(1, workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._active: Dict[Tuple[str, str], bool] = {}
+        self._stopping = threading.Event()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="classify")
+        return self._executor
+
+    def submit(self, db: firestore.Client, uid: str, upload_id: str) -> bool:
+        if self._stopping.is_set():
+            return False
+        key = (uid, upload_id)
+        with self._lock:
+            if key in self._active:
+                # A run is already in flight; make it go round once more so
+                # rows written since it started (e.g. by replace-upload) are seen.
+                self._active[key] = True
+                return True
+            self._active[key] = False
+            self._pool().submit(self._run, db, uid, upload_id)
+        return True
+
+    def _run(self, db: firestore.Client, uid: str, upload_id: str) -> None:
+        key = (uid, upload_id)
+        while True:
+            try:
+                if not claim_upload(db, uid, upload_id, self.owner):
+                    # finished, failed, or leased by another instance
+                    with self._lock:
+                        self._active.pop(key, None)
+                    return
+                classify_upload(db, uid, upload_id, should_stop=self._stopping.is_set, owner=self.owner)
+            except Exception as e:
+                logger.exception("classification failed for upload %s/%s", uid, upload_id)
+                mark_failed(db, uid, upload_id, e, owner=self.owner)
+                with self._lock:
+                    self._active.pop(key, None)
+                return
+            with self._lock:
+                if self._active.get(key) and not self._stopping.is_set():
+                    self._active[key] = False
+                    continue
+                self._active.pop(key, None)
+                return
+
+    def resume_pending(self, db: firestore.Client) -> int:
+        """Submit every "classifying" upload; workers only run the ones whose lease they win.
+
+        Needs the collection-group field override on uploads.status from
+        firestore.indexes.json.
+        """
+        resumed = 0
+        try:
+            for snap in db.collection_group("uploads").where("status", "==", "classifying").select([]).stream():
+                user_ref = snap.reference.parent.parent
+                if user_ref is not None and self.submit(db, user_ref.id, snap.id):
+                    resumed += 1
+        except gexc.FailedPrecondition:
+            logger.exception("resume of pending classifications skipped: the uploads.status collection-group index is missing (deploy firestore.indexes.json)")
+        except Exception:
+            logger.exception("resume of pending classifications failed after %d uploads", resumed)
+        return resumed
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+pipeline = ClassificationPipeline()
@@ -1,40 +1,29 @@
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Iterable, List
 from google.cloud import firestore
-import os
+import asyncio, logging, os, threading
+from utils.bulk_writes import UNKNOWN_OUTCOME_ERRORS
+from utils.chart_of_accounts import ChartOfAccounts, UNCATEGORIZED
+
+AGG_MAX_TRACKED_USERS = 25
+GLOBAL_MIN_TOTAL = 5
+GLOBAL_MIN_USERS = 3
+LEARNING_FLUSH_SECONDS = float(os.environ.get("LEARNING_FLUSH_SECONDS", "2.0") or 2.0)
+LEARNING_MAX_PENDING = int(os.environ.get("LEARNING_MAX_PENDING", "400") or 400)
+LEARNING_MAX_RETRIES = int(os.environ.get("LEARNING_MAX_RETRIES", "3") or 3)
+_GET_ALL_CHUNK = 300
+_WRITE_CHUNK = 450
+
+logger = logging.getLogger(__name__)
 
 def _fallback_account(allowed_accounts=None) -> str:
-    if allowed_accounts:
-        lowers = {a.lower(): a for a in allowed_accounts}
-        for key in ("uncategorized", "7090 - uncategorized expense", "7090-uncategorized expense"):
-            for k, v in lowers.items():
-                if key in k:
-                    return v
-        return allowed_accounts[0]
-    return "7090 - Uncategorized Expense"
-
-def _force_map_to_allowed(chosen: str, allowed_accounts: list[str] | None) -> str:
-    if not chosen:
-        return _fallback_account(allowed_accounts)
-    if not allowed_accounts:
-        return chosen
-    lc_map = {a.lower(): a for a in allowed_accounts}
-    c = chosen.strip().lower()
-    if c in lc_map:
-        return lc_map[c]
-    for a in allowed_accounts:
-        al = a.lower()
-        if c in al or al in c:
-            return a
-    ctoks = [t for t in c.split(" ") if t]
-    best = None
-    best_hits = -1
-    for a in allowed_accounts:
-        toks = [t for t in a.lower().split(" ") if t]
-        hits = sum(1 for t in ctoks if t in toks)
-        if hits > best_hits:
-            best = a
-            best_hits = hits
-    return best or _fallback_account(allowed_accounts)
+    chart = ChartOfAccounts.coerce(allowed_accounts)
+    return chart.fallback if chart else UNCATEGORIZED
+
+def _force_map_to_allowed(chosen: str, allowed_accounts) -> str:
+    chart = ChartOfAccounts.coerce(allowed_accounts)
+    if chart is None:
+        return chosen or UNCATEGORIZED
+    return chart.resolve(chosen)
 
 def classify_llm(memo: str, amount: float = 0.0, source: str = "", allowed_accounts=None) -> str:
     api_key = os.environ.get("OPENAI_API_KEY", "").strip()
@@ -50,8 +39,9 @@ def classify_llm(memo: str, amount: float = 0.0, source: str = "", allowed_accou
             f"Source: {source}",
             "You must choose exactly one of these account labels:"
         ]
-        if allowed_accounts:
-            for a in allowed_accounts:
+        chart = ChartOfAccounts.coerce(allowed_accounts)
+        if chart:
+            for a in chart.labels:
                 lines.append(f"- {a}")
         prompt = "\n".join(lines)
         model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
@@ -88,6 +78,55 @@ def _get_global_memory(db: firestore.Client, vendor_key: str) -> str:
         pass
     return ""
 
+def _memory_refs(client: Any, uid: str, chunk: List[str]) -> List[Any]:
+    ucol = client.collection("users").document(uid).collection("vendor_memory")
+    gcol = client.collection("vendor_memory_global")
+    return [ucol.document(k) for k in chunk] + [gcol.document(k) for k in chunk]
+
+def _absorb_memory(snaps: Iterable[Any], user_cache: Dict[str, str], global_cache: Dict[str, str]) -> None:
+    for snap in snaps:
+        if not snap.exists:
+            continue
+        account = str((snap.to_dict() or {}).get("account") or "")
+        if snap.reference.parent.id == "vendor_memory_global":
+            global_cache[snap.id] = account
+        else:
+            user_cache[snap.id] = account
+
+def prefetch_vendor_memory(db: firestore.Client, uid: str, vendor_keys) -> Tuple[Dict[str, str], Dict[str, str]]:
+    keys = sorted(set(k for k in vendor_keys if k))
+    user_cache: Dict[str, str] = {k: "" for k in keys}
+    global_cache: Dict[str, str] = {k: "" for k in keys}
+    for i in range(0, len(keys), _GET_ALL_CHUNK // 2):
+        chunk = keys[i:i + _GET_ALL_CHUNK // 2]
+        try:
+            _absorb_memory(db.get_all(_memory_refs(db, uid, chunk)), user_cache, global_cache)
+        except Exception:
+            for k in chunk:
+                user_cache.pop(k, None)
+                global_cache.pop(k, None)
+    return user_cache, global_cache
+
+async def prefetch_vendor_memory_async(adb: Any, uid: str, vendor_keys) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """``prefetch_vendor_memory`` on the async client, with every chunk fetched concurrently."""
+    keys = sorted(set(k for k in vendor_keys if k))
+    user_cache: Dict[str, str] = {k: "" for k in keys}
+    global_cache: Dict[str, str] = {k: "" for k in keys}
+    chunks = [keys[i:i + _GET_ALL_CHUNK // 2] for i in range(0, len(keys), _GET_ALL_CHUNK // 2)]
+
+    async def _fetch(chunk: List[str]) -> List[Any]:
+        return [snap async for snap in adb.get_all(_memory_refs(adb, uid, chunk))]
+
+    results = await asyncio.gather(*(_fetch(c) for c in chunks), return_exceptions=True)
+    for chunk, snaps in zip(chunks, results):
+        if isinstance(snaps, BaseException):
+            for k in chunk:
+                user_cache.pop(k, None)
+                global_cache.pop(k, None)
+        else:
+            _absorb_memory(snaps, user_cache, global_cache)
+    return user_cache, global_cache
+
 def classify_with_memory(
     db: firestore.Client,
     uid: str,
@@ -115,26 +154,153 @@ def classify_with_memory(
         return gval, "memory:global"
     return "", ""
 
-def infer_from_structure(amount: float, source: str, allowed_accounts: list[str] | None) -> str:
+def infer_from_structure(amount: float, source: str, allowed_accounts) -> str:
     return ""
 
-def _bump_vendor_aggregate(db: firestore.Client, vendor_key: str, account: str, uid: str) -> None:
-    agg = db.collection("vendor_memory_agg").document(vendor_key)
-    snap = agg.get()
-    if snap.exists:
-        data = snap.to_dict() or {}
-    else:
-        data = {"total": 0, "byAccount": {}, "users": []}
-    users = set(data.get("users", []))
-    by_account = dict(data.get("byAccount", {}))
-    total = int(data.get("total", 0))
-    by_account[account] = int(by_account.get(account, 0)) + 1
-    total += 1
-    users.add(uid)
-    agg.set({"total": total, "byAccount": by_account, "users": list(users)}, merge=True)
-    top_account = max(by_account.items(), key=lambda kv: kv[1])[0]
-    if total >= 5 and len(users) >= 3:
-        db.collection("vendor_memory_global").document(vendor_key).set({"account": top_account}, merge=True)
+class LearningBatch:
+    """Vendor -> account learning counts aggregated before they touch Firestore."""
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.users: Dict[str, set] = {}
+
+    def add(self, vendor_key: str, account: str, uid: str, n: int = 1) -> None:
+        if not vendor_key or not account or n <= 0:
+            return
+        by_account = self.counts.setdefault(vendor_key, {})
+        by_account[account] = by_account.get(account, 0) + n
+        if uid:
+            self.users.setdefault(vendor_key, set()).add(uid)
+
+    def merge(self, other: "LearningBatch") -> None:
+        for vendor_key, by_account in other.counts.items():
+            mine = self.counts.setdefault(vendor_key, {})
+            for account, n in by_account.items():
+                mine[account] = mine.get(account, 0) + n
+        for vendor_key, users in other.users.items():
+            self.users.setdefault(vendor_key, set()).update(users)
+
+    def subset(self, vendor_keys: Iterable[str]) -> "LearningBatch":
+        out = LearningBatch()
+        for vendor_key in vendor_keys:
+            out.counts[vendor_key] = dict(self.counts[vendor_key])
+            if vendor_key in self.users:
+                out.users[vendor_key] = set(self.users[vendor_key])
+        return out
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.counts.values())
+
+def _apply_learning(db: firestore.Client, learning: LearningBatch) -> LearningBatch:
+    """Write ``learning``; returns the part left unwritten by a failed chunk (empty on success).
+
+    Global promotion is decided from the aggregates read before this
+    batch's increments, so concurrent flushes for one vendor can each miss
+    the other's counts; the vendor is re-evaluated on its next flush.
+    """
+    vendor_keys = list(learning.counts.keys())
+    agg_col = db.collection("vendor_memory_agg")
+    current: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(vendor_keys), _GET_ALL_CHUNK):
+        refs = [agg_col.document(k) for k in vendor_keys[i:i + _GET_ALL_CHUNK]]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                current[snap.id] = snap.to_dict() or {}
+    batch = db.batch()
+    ops = 0
+    start = 0
+    for pos, vendor_key in enumerate(vendor_keys):
+        by_account = learning.counts[vendor_key]
+        data = current.get(vendor_key) or {}
+        known_users = set(data.get("users") or [])
+        room = max(0, AGG_MAX_TRACKED_USERS - len(known_users))
+        new_users = sorted(u for u in learning.users.get(vendor_key, set()) if u not in known_users)[:room]
+        added = sum(by_account.values())
+        update: Dict[str, Any] = {
+            "total": firestore.Increment(added),
+            "byAccount": {a: firestore.Increment(n) for a, n in by_account.items()},
+        }
+        if new_users:
+            update["users"] = firestore.ArrayUnion(new_users)
+        batch.set(agg_col.document(vendor_key), update, merge=True)
+        ops += 1
+        merged = {a: int(n or 0) for a, n in dict(data.get("byAccount") or {}).items()}
+        for a, n in by_account.items():
+            merged[a] = merged.get(a, 0) + n
+        total = int(data.get("total") or 0) + added
+        if total >= GLOBAL_MIN_TOTAL and len(known_users) + len(new_users) >= GLOBAL_MIN_USERS:
+            top_account = max(merged.items(), key=lambda kv: kv[1])[0]
+            batch.set(db.collection("vendor_memory_global").document(vendor_key), {"account": top_account}, merge=True)
+            ops += 1
+        if ops >= _WRITE_CHUNK or pos == len(vendor_keys) - 1:
+            try:
+                batch.commit()
+            except Exception as e:
+                # a chunk whose outcome is unknown may have landed; re-sending its increments would double count
+                retry_from = pos + 1 if isinstance(e, UNKNOWN_OUTCOME_ERRORS) else start
+                logger.exception("learning commit failed; %d of %d vendors left unwritten", len(vendor_keys) - retry_from, len(vendor_keys))
+                return learning.subset(vendor_keys[retry_from:])
+            batch = db.batch()
+            ops = 0
+            start = pos + 1
+    return LearningBatch()
+
+class _LearningBuffer:
+    """Write-behind buffer that coalesces learning from concurrent requests."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending = LearningBatch()
+        self._db: firestore.Client | None = None
+        self._timer: threading.Timer | None = None
+        self._failures = 0
+
+    def _schedule(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Timer(LEARNING_FLUSH_SECONDS, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, db: firestore.Client, learning: LearningBatch) -> None:
+        if not len(learning):
+            return
+        with self._lock:
+            self._pending.merge(learning)
+            self._db = db
+            due = len(self._pending) >= LEARNING_MAX_PENDING
+            if not due:
+                self._schedule()
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, LearningBatch()
+            db = self._db
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if db is None or not len(pending):
+            return
+        try:
+            left = _apply_learning(db, pending)
+        except Exception:
+            logger.exception("learning flush failed before writing")
+            left = pending
+        with self._lock:
+            if not len(left):
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures > LEARNING_MAX_RETRIES:
+                logger.error("dropping %d vendor/account counts after %d failed learning flushes", len(left), self._failures)
+                self._failures = 0
+                return
+            self._pending.merge(left)
+            self._db = self._db or db
+            self._schedule()
+
+_LEARNING_BUFFER = _LearningBuffer()
 
 def finalize_classification(
     db: firestore.Client,
@@ -143,9 +309,11 @@ def finalize_classification(
     memo: str,
     amount: float,
     source: str,
-    allowed_accounts: list[str] | None
+    allowed_accounts,
+    user_mem_cache: Dict[str, str] | None = None,
+    global_mem_cache: Dict[str, str] | None = None
 ) -> Tuple[str, str]:
-    acc, via = classify_with_memory(db=db, uid=uid, vendor_key=vendor_key, user_mem_cache={}, global_mem_cache={})
+    acc, via = classify_with_memory(db=db, uid=uid, vendor_key=vendor_key, user_mem_cache=user_mem_cache, global_mem_cache=global_mem_cache)
     if acc:
         return acc, via
     acc_struct = infer_from_structure(amount, source, allowed_accounts)
@@ -155,7 +323,15 @@ def finalize_classification(
     return _force_map_to_allowed(acc_ai, allowed_accounts), "ai"
 
 def record_learning(db: firestore.Client, vendor_key: str, account: str, uid: str) -> None:
+    learning = LearningBatch()
+    learning.add(vendor_key, account, uid)
+    record_learning_batch(db, learning)
+
+def record_learning_batch(db: firestore.Client, learning: LearningBatch) -> None:
     try:
-        _bump_vendor_aggregate(db, vendor_key, account, uid)
+        _LEARNING_BUFFER.add(db, learning)
     except Exception:
         pass
+
+def flush_learning() -> None:
+    _LEARNING_BUFFER.flush()
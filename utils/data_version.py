@@ -0,0 +1,75 @@
+from typing import Any, Optional, Tuple
+import hashlib
+from fastapi import Response
+from google.cloud import firestore
+
+VERSION_COLLECTION = "meta"
+VERSION_DOC = "version"
+
+def _version_ref(uref: Any) -> Any:
+    return uref.collection(VERSION_COLLECTION).document(VERSION_DOC)
+
+def stage_version_bump(batch: Any, uref: Any) -> None:
+    batch.set(_version_ref(uref), {"v": firestore.Increment(1), "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+
+def bump_version(db: Any, uid: str) -> None:
+    """Mark the user's data as changed; call after the write it covers has committed."""
+    if not uid:
+        return
+    try:
+        _version_ref(db.collection("users").document(uid)).set(
+            {"v": firestore.Increment(1), "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True
+        )
+    except Exception:
+        pass
+
+def _version_of(snap: Any) -> int:
+    if not snap.exists:
+        return 0
+    try:
+        return int((snap.to_dict() or {}).get("v") or 0)
+    except Exception:
+        return 0
+
+def read_version(db: Any, uid: str) -> int:
+    return _version_of(_version_ref(db.collection("users").document(uid)).get())
+
+async def read_version_async(adb: Any, uid: str) -> int:
+    return _version_of(await _version_ref(adb.collection("users").document(uid)).get())
+
+def make_etag(version: int, *parts: str) -> str:
+    h = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:12]
+    return f'W/"v{version}-{h}"'
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    want = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if (tag[2:] if tag.startswith("W/") else tag) == want:
+            return True
+    return False
+
+def conditional(db: Any, uid: str, if_none_match: Optional[str], *parts: str) -> Tuple[str, Optional[Response]]:
+    """ETag for a user-scoped read, plus a ready 304 response when the client is current.
+
+    The version is read before the data, so a write landing mid-request can only
+    make the returned ETag older than the body, never newer.
+    """
+    return check_etag(read_version(db, uid), if_none_match, *parts)
+
+async def conditional_async(adb: Any, uid: str, if_none_match: Optional[str], *parts: str) -> Tuple[str, Optional[Response]]:
+    return check_etag(await read_version_async(adb, uid), if_none_match, *parts)
+
+def check_etag(version: int, if_none_match: Optional[str], *parts: str) -> Tuple[str, Optional[Response]]:
+    etag = make_etag(version, *parts)
+    if _matches(if_none_match, etag):
+        return etag, Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return etag, None
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
@@ -0,0 +1,95 @@
+from typing import Any, Iterable, List, Optional
+
+from utils.aggregates import AGGREGATE_FIELDS, AggregateDelta, month_of
+from utils.bulk_writes import BULK_WORKERS, commit_chunks
+from utils.change_log import TOMBSTONES, tombstone_data
+from utils.transfer_pairing import INDEX_FIELDS, unindex_transactions
+
+DELETE_CHUNK = 450
+# What deleting a user's transaction must read: pairing-index and aggregate inputs.
+ROW_FIELDS = tuple(dict.fromkeys(INDEX_FIELDS + AGGREGATE_FIELDS))
+
+class DeleteResult:
+    def __init__(self) -> None:
+        self.deleted = 0
+        self.failed = 0
+        self.errors: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def detail(self) -> str:
+        return f"Deleted {self.deleted} documents; {self.failed} could not be deleted"
+
+def _flush(db: Any, uid: Optional[str], groups: List[List[Any]], result: DeleteResult) -> None:
+    if not groups:
+        return
+    uref = db.collection("users").document(uid) if uid else None
+    chunks = []
+    for group in groups:
+        ops = [("delete", s.reference, None, False) for s in group]
+        if uref is not None:
+            ops += [("set", uref.collection(TOMBSTONES).document(s.id), tombstone_data(), False) for s in group]
+            delta = AggregateDelta()
+            for s in group:
+                delta.add(s.to_dict(), -1)
+            ops += delta.ops(uref)
+        chunks.append(ops)
+    res = commit_chunks(db, chunks)
+    gone = []
+    for i, group in enumerate(groups):
+        if i in res.errors:
+            result.failed += len(group)
+            result.errors.append(res.errors[i])
+        else:
+            result.deleted += len(group)
+            gone.extend(group)
+    if uid and gone:
+        try:
+            unindex_transactions(db, uid, [(s.id, s.to_dict() or {}) for s in gone])
+        except Exception as e:
+            result.errors.append(f"unindex: {type(e).__name__}: {e}"[:300])
+
+def delete_snapshots(db: Any, snaps: Iterable[Any], *, uid: Optional[str] = None, chunk: int = DELETE_CHUNK, window: int = BULK_WORKERS) -> DeleteResult:
+    """Delete snapshots as they stream in, ``window`` chunks committed at a time.
+
+    With ``uid`` the snapshots are that user's transactions (read with at
+    least ROW_FIELDS): each chunk also writes their tombstones and aggregate
+    decrements, so it carries under half as many deletes, and deleted rows
+    leave the pairing index.
+    """
+    result = DeleteResult()
+    seen: set = set()
+    groups: List[List[Any]] = []
+    group: List[Any] = []
+    months: set = set()
+    for snap in snaps:
+        if snap.id in seen:
+            continue
+        seen.add(snap.id)
+        group.append(snap)
+        if uid:
+            months.add(month_of((snap.to_dict() or {}).get("dateKey")))
+        if (2 * len(group) + len(months) + 1 if uid else len(group)) >= chunk:
+            groups.append(group)
+            group = []
+            months = set()
+            if len(groups) >= window:
+                _flush(db, uid, groups, result)
+                groups = []
+    if group:
+        groups.append(group)
+    _flush(db, uid, groups, result)
+    return result
+
+def _stream_keys(queries: Iterable[Any], fields: List[str]) -> Iterable[Any]:
+    for q in queries:
+        yield from q.select(fields).stream()
+
+def delete_matching(db: Any, queries: Iterable[Any], *, uid: Optional[str] = None, **kw: Any) -> DeleteResult:
+    """Delete everything matched by ``queries`` (deduplicated across them).
+
+    Only keys are read, plus ROW_FIELDS when deleting a user's transactions.
+    """
+    return delete_snapshots(db, _stream_keys(queries, list(ROW_FIELDS) if uid else []), uid=uid, **kw)
@@ -1,7 +1,10 @@
-from typing import Any, Optional
+from typing import Any, Dict, Iterable, List, Optional
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from google.cloud import firestore
 
+MATCH_WINDOW_DAYS = 5
+
 def _absf(x: Any) -> float:
     try:
         return abs(float(x or 0.0))
@@ -54,6 +57,80 @@ def _has_bank_match(db: firestore.Client, uid: str, date_key: str, amount_abs: f
         pass
     return False
 
+def _cents(x: float) -> int:
+    return int(round(x * 100))
+
+def _day(date_key: str) -> int:
+    return (_from_datekey(date_key) or datetime.utcnow()).toordinal()
+
+class BankMatchIndex:
+    """Bank rows keyed by amount in cents, each with a sorted list of days."""
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()) -> None:
+        self._by_cents: Dict[int, List[int]] = {}
+        for rec in records:
+            dt = _from_datekey(str(rec.get("dateKey") or ""))
+            a = _absf(rec.get("amount"))
+            if dt is None or a <= 0:
+                continue
+            self._by_cents.setdefault(_cents(a), []).append(dt.toordinal())
+        for days in self._by_cents.values():
+            days.sort()
+
+    @staticmethod
+    def _window_query(client: Any, uid: str, date_keys: Iterable[str], days: int) -> Any:
+        keys = sorted(k for k in date_keys if k)
+        if not keys:
+            return None
+        start, _ = _range_keys(keys[0], days=days)
+        _, end = _range_keys(keys[-1], days=days)
+        uref = client.collection("users").document(uid)
+        return (uref.collection("transactions")
+                .where("dateKey", ">=", start).where("dateKey", "<=", end)
+                .where("sourceType", "==", "bank")
+                .select(["amount", "dateKey", "uploadId"]))
+
+    @classmethod
+    def _from_snaps(cls, snaps: Iterable[Any], exclude_upload: str) -> "BankMatchIndex":
+        recs = (d.to_dict() or {} for d in snaps)
+        return cls(r for r in recs if not exclude_upload or r.get("uploadId") != exclude_upload)
+
+    @classmethod
+    def load(cls, db: firestore.Client, uid: str, date_keys: Iterable[str], days: int = MATCH_WINDOW_DAYS, exclude_upload: str = "") -> "BankMatchIndex":
+        q = cls._window_query(db, uid, date_keys, days)
+        if q is None:
+            return cls()
+        try:
+            return cls._from_snaps(q.stream(), exclude_upload)
+        except Exception:
+            return cls()
+
+    @classmethod
+    async def load_async(cls, adb: Any, uid: str, date_keys: Iterable[str], days: int = MATCH_WINDOW_DAYS, exclude_upload: str = "") -> "BankMatchIndex":
+        """``load`` on the async client; ``exclude_upload`` skips rows an in-flight replace is about to delete."""
+        q = cls._window_query(adb, uid, date_keys, days)
+        if q is None:
+            return cls()
+        try:
+            return cls._from_snaps([d async for d in q.stream()], exclude_upload)
+        except Exception:
+            return cls()
+
+    def has_match(self, date_key: str, amount_abs: float, tol: float = 0.01, days: int = MATCH_WINDOW_DAYS) -> bool:
+        if not date_key or amount_abs <= 0:
+            return False
+        center = _day(date_key)
+        c = _cents(amount_abs)
+        t = _cents(tol)
+        for cents in range(c - t, c + t + 1):
+            hits = self._by_cents.get(cents)
+            if not hits:
+                continue
+            i = bisect_left(hits, center - days)
+            if i < len(hits) and hits[i] <= center + days:
+                return True
+        return False
+
 def compute_display_amount(
     *,
     db: Optional[firestore.Client],
@@ -62,7 +139,8 @@ def compute_display_amount(
     source_type: str,
     source: str = "",
     date: str = "",
-    date_key: str = ""
+    date_key: str = "",
+    bank_index: Optional[BankMatchIndex] = None
 ) -> float:
     st = (source_type or "").strip().lower()
     sgn = _sign(amount)
@@ -73,7 +151,36 @@ def compute_display_amount(
     if st == "card":
         if sgn > 0:
             return abs_amt
-        if db is not None and uid and _has_bank_match(db, uid, key, abs_amt):
+        if bank_index is not None:
+            if bank_index.has_match(key, abs_amt):
+                return abs_amt
+        elif db is not None and uid and _has_bank_match(db, uid, key, abs_amt):
             return abs_amt
         return -abs_amt
     return float(amount or 0.0)
+
+def bank_match_keys(rows: List[Dict[str, Any]]) -> List[str]:
+    """Date keys of the rows whose display amount depends on a bank match (negative card rows)."""
+    return [
+        r.get("date_key") or _to_datekey(str(r.get("date") or ""))
+        for r in rows
+        if str(r.get("source_type") or "").strip().lower() == "card" and _sign(r.get("amount")) < 0
+    ]
+
+def compute_display_amounts(*, db: Optional[firestore.Client], uid: Optional[str], rows: List[Dict[str, Any]], bank_index: Optional[BankMatchIndex] = None) -> List[float]:
+    """Batch form of compute_display_amount; rows carry amount, source_type, source, date and date_key.
+
+    Bank matches for every negative card row are resolved against one
+    range query covering the whole span of the rows, unless the caller
+    passes an index it already loaded.
+    """
+    keys = [r.get("date_key") or _to_datekey(str(r.get("date") or "")) for r in rows]
+    if bank_index is not None:
+        index = bank_index
+    else:
+        needs = bank_match_keys(rows)
+        index = BankMatchIndex.load(db, uid, needs) if needs and db is not None and uid else BankMatchIndex()
+    return [
+        compute_display_amount(db=None, uid=None, amount=float(r.get("amount") or 0.0), source_type=str(r.get("source_type") or ""), source=str(r.get("source") or ""), date_key=k, bank_index=index)
+        for r, k in zip(rows, keys)
+    ]
@@ -0,0 +1,134 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from array import array
+import asyncio, hashlib, os, sqlite3, sys, threading
+import httpx
+
+EMBEDDING_MODEL = os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small") or "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3") or ":memory:"
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256") or 256)
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4") or 4)
+# ~6 KB per 1536-dim vector, so the default keeps the cache file near 120 MB
+EMBEDDING_CACHE_MAX_ROWS = int(os.environ.get("EMBEDDING_CACHE_MAX_ROWS", "20000") or 20000)
+_OPENAI_URL = "https://api.openai.com/v1/embeddings"
+
+class EmbeddingError(Exception):
+    pass
+
+def content_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+def _pack(vec: Iterable[float]) -> bytes:
+    arr = array("f", vec)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+def _unpack(blob: bytes) -> List[float]:
+    arr = array("f")
+    arr.frombytes(blob)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tolist()
+
+class EmbeddingCache:
+    """Content-hash keyed SQLite store of float32 little-endian vectors.
+
+    Holds at most ``max_rows`` vectors; inserts evict the least recently
+    written ones.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_rows: int = EMBEDDING_CACHE_MAX_ROWS) -> None:
+        self._max_rows = max(1, max_rows)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, dims INTEGER NOT NULL, vec BLOB NOT NULL)")
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        out: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" for _ in chunk)
+                for key, blob in self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", chunk):
+                    out[key] = _unpack(blob)
+        return out
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]) -> None:
+        if not items:
+            return
+        rows = [(key, model, len(vec), sqlite3.Binary(_pack(vec))) for key, vec in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, dims, vec) VALUES (?, ?, ?, ?)", rows)
+            # REPLACE assigns a new rowid, so rowid order is write order
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self._max_rows:
+                self._conn.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)", (count - self._max_rows,))
+            self._conn.commit()
+
+class EmbeddingService:
+    def __init__(self, cache: Optional[EmbeddingCache] = None, model: str = EMBEDDING_MODEL) -> None:
+        self.model = model
+        self._cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        if self._cache is None:
+            self._cache = EmbeddingCache()
+        return self._cache
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_connections=EMBEDDING_CONCURRENCY * 2, max_keepalive_connections=EMBEDDING_CONCURRENCY),
+            )
+            self._sem = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+        return self._client
+
+    async def _fetch(self, api_key: str, texts: List[str]) -> List[List[float]]:
+        client = self._http()
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json", "Accept": "application/json"}
+        async with self._sem:
+            try:
+                res = await client.post(_OPENAI_URL, headers=headers, json={"model": self.model, "input": texts})
+            except httpx.HTTPError as e:
+                raise EmbeddingError(str(e))
+        if res.status_code >= 300:
+            raise EmbeddingError(res.text)
+        try:
+            data = sorted((res.json() or {}).get("data") or [], key=lambda x: int(x.get("index") or 0))
+            vecs = [[float(v) for v in x.get("embedding") or []] for x in data]
+        except (ValueError, TypeError, AttributeError) as e:
+            raise EmbeddingError(f"malformed embeddings response: {e}")
+        if len(vecs) != len(texts):
+            raise EmbeddingError("embedding count mismatch")
+        return vecs
+
+    async def embed(self, api_key: str, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Return vectors aligned with ``texts`` and the number served from cache."""
+        uniq = list(dict.fromkeys(texts))
+        keys = {t: content_key(self.model, t) for t in uniq}
+        found = await asyncio.to_thread(self.cache.get_many, list(keys.values()))
+        misses = [t for t in uniq if keys[t] not in found]
+        if misses:
+            chunks = [misses[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(misses), EMBEDDING_BATCH_SIZE)]
+            results = await asyncio.gather(*(self._fetch(api_key, c) for c in chunks))
+            fresh: List[Tuple[str, List[float]]] = []
+            for chunk, vecs in zip(chunks, results):
+                for t, vec in zip(chunk, vecs):
+                    found[keys[t]] = vec
+                    fresh.append((keys[t], vec))
+            await asyncio.to_thread(self.cache.put_many, self.model, fresh)
+        return [found[keys[t]] for t in texts], len(uniq) - len(misses)
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+embedding_service = EmbeddingService()
@@ -0,0 +1,55 @@
+from typing import Any, Dict, Optional, Tuple
+import hashlib, re, urllib.parse
+
+# Fields lookup_fields() reads, and the fields it writes.
+LOOKUP_SOURCE_FIELDS = ("id", "date", "memo", "memo_clean", "memo_raw", "amount")
+LOOKUP_FIELDS = ("clientUid", "absCents", "fingerprintHash")
+
+def client_uid(t: Dict[str, Any]) -> str:
+    """The id the web client derives for a row: ``{date}-{memo[:24]}-{amount}``."""
+    if t.get("id"):
+        return str(t["id"])
+    date = (t.get("date") or "").split("T")[0] or (t.get("date") or "")
+    memo = str(t.get("memo_clean") or t.get("memo") or t.get("memo_raw") or "")[:24]
+    try:
+        amount = float(t.get("amount") or 0.0)
+    except Exception:
+        amount = 0.0
+    return f"{date}-{memo}-{amount}"
+
+def abs_cents(amount: Any) -> int:
+    try:
+        return int(round(abs(float(amount or 0.0)) * 100))
+    except Exception:
+        return 0
+
+def fingerprint_hash(date: Any, memo: Any, amount: Any) -> str:
+    """Hash of the (date, memo, amount) triple bulk-reclassify matches rows on."""
+    try:
+        amt = repr(float(amount or 0.0))
+    except Exception:
+        amt = "0.0"
+    raw = f"{date or ''}\x1f{memo or ''}\x1f{amt}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+def lookup_fields(t: Dict[str, Any]) -> Dict[str, Any]:
+    """Indexed fields stored on every transaction so detail lookups are single queries."""
+    return {
+        "clientUid": client_uid(t),
+        "absCents": abs_cents(t.get("amount")),
+        "fingerprintHash": fingerprint_hash(t.get("date"), t.get("memo"), t.get("amount")),
+    }
+
+_TRAILING_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\)?\s*$")
+
+def parse_slug(slug: str) -> Optional[Tuple[str, int]]:
+    """(dateKey, absCents) from a ``MM/DD/YYYY-...-amount`` slug, or None."""
+    s = urllib.parse.unquote(slug or "").strip()
+    if len(s) < 10 or s[2:3] != "/" or s[5:6] != "/":
+        return None
+    date_key = s[6:10] + s[0:2] + s[3:5]
+    if not date_key.isdigit():
+        return None
+    # amount is at the end of the slug; only its magnitude is matched
+    m = _TRAILING_AMOUNT.search(s[10:])
+    return date_key, abs_cents(m.group(1).replace(",", "")) if m else 0
@@ -0,0 +1,159 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+import os, threading
+import numpy as np
+import pandas as pd
+
+from utils.chart_of_accounts import UNCATEGORIZED
+
+LEDGER_CACHE_USERS = int(os.environ.get("LEDGER_CACHE_USERS", "64") or 64)
+LEDGER_FIELDS = ("date", "dateKey", "memo", "amount", "account", "source", "sourceType", "eventLeader", "pairReason", "fileName")
+POSTING_COLUMNS = ["id", "txnId", "date", "dateKey", "memo", "account", "type", "debit", "credit", "amount", "fileName"]
+LINE_COLUMNS = POSTING_COLUMNS[:-1] + ["balance", "fileName"]
+OFFSET_ACCOUNT = "Offset"
+
+def frame(rows: Iterable[Tuple[str, Dict[str, Any]]]) -> pd.DataFrame:
+    ids: List[str] = []
+    recs: List[Dict[str, Any]] = []
+    for txn_id, rec in rows:
+        ids.append(txn_id)
+        recs.append(rec)
+    df = pd.DataFrame.from_records(recs, columns=list(LEDGER_FIELDS))
+    df.insert(0, "txnId", ids)
+    return df
+
+def transactions_frame(tcol: Any) -> pd.DataFrame:
+    """A user's transactions, read once with only the fields the ledger needs."""
+    return frame((s.id, s.to_dict() or {}) for s in tcol.select(list(LEDGER_FIELDS)).stream())
+
+def _text(s: pd.Series, default: str = "") -> pd.Series:
+    s = s.where(s.notna(), "").astype(str)
+    return s.where(s != "", default) if default else s
+
+def postings(df: pd.DataFrame) -> pd.DataFrame:
+    """Two balanced lines per leading transaction, in the same shape as /journal/entries.
+
+    Shadow sides of transfer pairs (``eventLeader`` False or pairReason
+    "shadow") are dropped. A non-negative amount debits the row's account
+    and credits its source; a negative one does the reverse. Lines keep the
+    order of ``df``, debit before credit.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=POSTING_COLUMNS)
+    leader = df["eventLeader"].map(lambda v: v is not False)
+    keep = leader & (_text(df["pairReason"]) != "shadow")
+    df = df[keep.to_numpy()]
+    amount = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    account = _text(df["account"], UNCATEGORIZED).to_numpy()
+    source = _text(df["source"], OFFSET_ACCOUNT).to_numpy()
+    positive = amount >= 0
+    base = {
+        "txnId": df["txnId"].to_numpy(),
+        "date": _text(df["date"]).to_numpy(),
+        "dateKey": _text(df["dateKey"]).to_numpy(),
+        "memo": _text(df["memo"]).to_numpy(),
+        "amount": np.abs(amount),
+        "fileName": _text(df["fileName"]).to_numpy(),
+        "seq": np.arange(len(df)),
+    }
+    debit = pd.DataFrame({**base, "account": np.where(positive, account, source), "type": "Debit", "side": 0})
+    credit = pd.DataFrame({**base, "account": np.where(positive, source, account), "type": "Credit", "side": 1})
+    lines = pd.concat([debit, credit], ignore_index=True).sort_values(["seq", "side"], kind="mergesort", ignore_index=True)
+    lines["id"] = lines["txnId"] + np.where(lines["side"] == 0, "-debit", "-credit")
+    lines["debit"] = np.where(lines["side"] == 0, lines["amount"], 0.0)
+    lines["credit"] = np.where(lines["side"] == 1, lines["amount"], 0.0)
+    return lines[POSTING_COLUMNS]
+
+def journal_lines(df: pd.DataFrame) -> pd.DataFrame:
+    """``postings`` grouped by account in date order, with each account's running balance."""
+    lines = postings(df)
+    if lines.empty:
+        return pd.DataFrame(columns=LINE_COLUMNS)
+    lines = lines.sort_values(["account", "dateKey", "txnId"], kind="mergesort", ignore_index=True)
+    lines["balance"] = (lines["debit"] - lines["credit"]).groupby(lines["account"], sort=False).cumsum().round(2)
+    return lines[LINE_COLUMNS]
+
+def trial_balance(lines: pd.DataFrame, chart: Any) -> Dict[str, Any]:
+    if lines.empty:
+        return {"accounts": [], "totalDebit": 0.0, "totalCredit": 0.0, "balanced": True}
+    tb = lines.groupby("account", sort=True)[["debit", "credit"]].sum()
+    net = tb["debit"] - tb["credit"]
+    accounts = [
+        {"account": a, "type": chart.type_of(a), "debit": round(max(float(n), 0.0), 2), "credit": round(max(-float(n), 0.0), 2), "count": int(c)}
+        for a, n, c in zip(tb.index, net.to_numpy(), lines.groupby("account", sort=True).size().to_numpy())
+    ]
+    total_debit = round(sum(a["debit"] for a in accounts), 2)
+    total_credit = round(sum(a["credit"] for a in accounts), 2)
+    return {"accounts": accounts, "totalDebit": total_debit, "totalCredit": total_credit, "balanced": bool(abs(total_debit - total_credit) < 0.005)}
+
+def line_records(lines: pd.DataFrame, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    page = lines.iloc[start:stop]
+    return [
+        {k: (float(v) if isinstance(v, np.floating) else v) for k, v in rec.items()}
+        for rec in page.to_dict("records")
+    ]
+
+def iter_records(lines: pd.DataFrame, size: int = 1000) -> Iterator[Dict[str, Any]]:
+    for start in range(0, len(lines), size):
+        yield from line_records(lines, start, start + size)
+
+class Ledger:
+    def __init__(self, lines: pd.DataFrame, chart: Any) -> None:
+        self.lines = lines
+        self._chart = chart
+        self._trial: Optional[Dict[str, Any]] = None
+        self._by_account: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def trial_balance(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._trial is None:
+                self._trial = trial_balance(self.lines, self._chart)
+            return self._trial
+
+    def for_account(self, account: str) -> pd.DataFrame:
+        if not account:
+            return self.lines
+        with self._lock:
+            hit = self._by_account.get(account)
+            if hit is None:
+                hit = self._by_account[account] = self.lines[self.lines["account"].to_numpy() == account].reset_index(drop=True)
+            return hit
+
+class _LedgerCache:
+    """Computed ledgers per user, valid for one data version and chart."""
+
+    def __init__(self, users: int) -> None:
+        self._users = users
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[Tuple[int, str], Ledger]]" = OrderedDict()
+
+    def get(self, uid: str, key: Tuple[int, str]) -> Optional[Ledger]:
+        with self._lock:
+            hit = self._data.get(uid)
+            if hit is None or hit[0] != key:
+                return None
+            self._data.move_to_end(uid)
+            return hit[1]
+
+    def put(self, uid: str, key: Tuple[int, str], ledger: Ledger) -> None:
+        with self._lock:
+            self._data[uid] = (key, ledger)
+            self._data.move_to_end(uid)
+            while len(self._data) > self._users:
+                self._data.popitem(last=False)
+
+_CACHE = _LedgerCache(LEDGER_CACHE_USERS)
+
+def ledger_for(db: Any, uid: str, version: int, chart: Any) -> Ledger:
+    """The user's ledger as of ``version``; read that version before calling so a
+    concurrent write can only make the cached entry stale, never mislabeled as newer.
+    Chart edits do not bump the version, so the chart's fingerprint is part of the key."""
+    key = (version, str(getattr(chart, "fingerprint", "")))
+    hit = _CACHE.get(uid, key)
+    if hit is not None:
+        return hit
+    tcol = db.collection("users").document(uid).collection("transactions")
+    ledger = Ledger(journal_lines(transactions_frame(tcol)), chart)
+    _CACHE.put(uid, key, ledger)
+    return ledger
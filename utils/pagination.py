@@ -0,0 +1,118 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime
+import base64, json
+
+MAX_PAGE_SIZE = 5000
+# Equality filters combined with the dateKey range/order need the composite
+# indexes in firestore.indexes.json; without them Firestore fails the query
+# with FailedPrecondition.
+MISSING_INDEX_DETAIL = "This filter combination needs a Firestore index that is not deployed yet; see firestore.indexes.json"
+
+def encode_cursor(date_key: str, doc_id: str) -> str:
+    raw = json.dumps([date_key, doc_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date_key, doc_id = json.loads(raw.decode("utf-8"))
+        return str(date_key), str(doc_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+def to_date_key(s: Optional[str]) -> str:
+    s = (s or "").strip()
+    if not s:
+        return ""
+    for fmt in ("%Y%m%d", "%Y-%m-%d", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y%m%d")
+        except Exception:
+            pass
+    raise ValueError("invalid date")
+
+def parse_fields(raw: Optional[str]) -> List[str]:
+    return [f.strip() for f in (raw or "").split(",") if f.strip() and f.strip() != "id"]
+
+def transactions_query(
+    tcol: Any,
+    *,
+    start_key: str = "",
+    end_key: str = "",
+    source: str = "",
+    source_type: str = "",
+    account: str = "",
+    fields: Optional[List[str]] = None,
+) -> Any:
+    q = tcol
+    if source:
+        q = q.where("source", "==", source)
+    if account:
+        q = q.where("account", "==", account)
+    if source_type:
+        q = q.where("sourceType", "==", source_type)
+    if start_key:
+        q = q.where("dateKey", ">=", start_key)
+    if end_key:
+        q = q.where("dateKey", "<=", end_key)
+    q = q.order_by("dateKey").order_by("__name__")
+    if fields:
+        q = q.select(sorted(set(fields) | {"dateKey"}))
+    return q
+
+def _after(q: Any, tcol: Any, cursor: Tuple[str, str]) -> Any:
+    date_key, doc_id = cursor
+    return q.start_after({"dateKey": date_key, "__name__": tcol.document(doc_id)})
+
+def _page_query(tcol: Any, limit: int, cursor: Optional[str], offset: int, filters: Dict[str, Any]) -> Any:
+    q = transactions_query(tcol, **filters)
+    if cursor:
+        q = _after(q, tcol, decode_cursor(cursor))
+    elif offset > 0:
+        q = q.offset(offset)
+    return q.limit(limit + 1)
+
+def page_transactions(tcol: Any, *, limit: int, cursor: Optional[str] = None, offset: int = 0, **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One keyset page ordered by (dateKey, doc id); returns rows and the next cursor.
+
+    ``offset`` is only honoured without a cursor, for older clients.
+    """
+    limit = max(0, min(int(limit), MAX_PAGE_SIZE))
+    if not limit:
+        return [], None
+    return _page_rows(list(_page_query(tcol, limit, cursor, offset, filters).stream()), limit)
+
+async def page_transactions_async(tcol: Any, *, limit: int, cursor: Optional[str] = None, offset: int = 0, **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """``page_transactions`` over an async collection reference."""
+    limit = max(0, min(int(limit), MAX_PAGE_SIZE))
+    if not limit:
+        return [], None
+    return _page_rows([s async for s in _page_query(tcol, limit, cursor, offset, filters).stream()], limit)
+
+def _page_rows(snaps: List[Any], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    rows = []
+    for s in snaps[:limit]:
+        rec = s.to_dict() or {}
+        rec["id"] = s.id
+        rows.append(rec)
+    nxt = None
+    if len(snaps) > limit:
+        last = snaps[limit - 1]
+        nxt = encode_cursor(str((last.to_dict() or {}).get("dateKey") or ""), last.id)
+    return rows, nxt
+
+def iter_transactions(tcol: Any, *, page_size: int = 1000, cursor: Optional[str] = None, **filters: Any) -> Iterator[Any]:
+    """Yield snapshots across keyset pages without holding more than one page."""
+    q = transactions_query(tcol, **filters)
+    after: Optional[Tuple[str, str]] = decode_cursor(cursor) if cursor else None
+    while True:
+        page_q = _after(q, tcol, after) if after else q
+        n = 0
+        last = None
+        for snap in page_q.limit(page_size).stream():
+            n += 1
+            last = snap
+            yield snap
+        if n < page_size or last is None:
+            return
+        after = (str((last.to_dict() or {}).get("dateKey") or ""), last.id)
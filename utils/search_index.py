@@ -0,0 +1,179 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import bisect, os, re, threading
+
+from utils.change_log import CHANGES_SKEW_SECONDS, changes_since, decode_token, encode_token
+from utils.clean_vendor_name import clean_vendor_name
+from utils.data_version import read_version
+
+SEARCH_INDEX_USERS = int(os.environ.get("SEARCH_INDEX_USERS", "32") or 32)
+SEARCH_FIELDS = ("date", "dateKey", "memo", "amount", "account", "source", "sourceType")
+MAX_RESULTS = 500
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokens(text: Any) -> Set[str]:
+    return set(_TOKEN.findall(str(text or "").lower()))
+
+def _abs_cents(amount: Any) -> int:
+    try:
+        return abs(int(round(float(amount or 0.0) * 100)))
+    except Exception:
+        return 0
+
+class SearchIndex:
+    """Inverted index over one user's transactions: tokens of memo, vendor key, account and source."""
+
+    def __init__(self, version: int, token: str) -> None:
+        self.version = version
+        self.token = token
+        self.lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._doc_tokens: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._cents: Dict[str, int] = {}
+        self._sorted_tokens: Optional[List[str]] = None
+        self._by_amount: Optional[List[Tuple[int, str]]] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, doc_id: str, rec: Dict[str, Any]) -> None:
+        self.remove(doc_id)
+        row = {k: rec.get(k) for k in SEARCH_FIELDS}
+        memo = str(row.get("memo") or "")
+        toks = tokens(memo) | tokens(clean_vendor_name(memo) if memo else "") | tokens(row.get("account")) | tokens(row.get("source"))
+        self._rows[doc_id] = row
+        self._doc_tokens[doc_id] = toks
+        self._cents[doc_id] = _abs_cents(row.get("amount"))
+        for t in toks:
+            if t not in self._postings:
+                self._postings[t] = set()
+                self._sorted_tokens = None
+            self._postings[t].add(doc_id)
+        self._by_amount = None
+
+    def remove(self, doc_id: str) -> None:
+        if self._rows.pop(doc_id, None) is None:
+            return
+        for t in self._doc_tokens.pop(doc_id, ()):
+            ids = self._postings.get(t)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._postings[t]
+                    self._sorted_tokens = None
+        self._cents.pop(doc_id, None)
+        self._by_amount = None
+
+    def apply(self, upserts: Iterable[Dict[str, Any]], deleted: Iterable[str]) -> None:
+        with self.lock:
+            for doc_id in deleted:
+                self.remove(doc_id)
+            for rec in upserts:
+                self.add(str(rec["id"]), rec)
+
+    def _prefixed(self, term: str) -> Set[str]:
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        toks = self._sorted_tokens
+        out: Set[str] = set()
+        i = bisect.bisect_left(toks, term)
+        while i < len(toks) and toks[i].startswith(term):
+            out |= self._postings[toks[i]]
+            i += 1
+        return out
+
+    def _in_range(self, lo: Optional[int], hi: Optional[int]) -> Set[str]:
+        if self._by_amount is None:
+            self._by_amount = sorted((c, d) for d, c in self._cents.items())
+        pairs = self._by_amount
+        start = bisect.bisect_left(pairs, (lo, "")) if lo is not None else 0
+        stop = bisect.bisect_right(pairs, (hi, "\uffff")) if hi is not None else len(pairs)
+        return {d for _, d in pairs[start:stop]}
+
+    def search(self, query: str, min_amount: Optional[float] = None, max_amount: Optional[float] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], int]:
+        """Rows matching every query term as a prefix, within [min, max] of absolute amount, newest first."""
+        with self.lock:
+            return self._search(query, min_amount, max_amount, limit)
+
+    def _search(self, query: str, min_amount: Optional[float], max_amount: Optional[float], limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        hits: Optional[Set[str]] = None
+        for term in sorted(tokens(query), key=len, reverse=True):
+            ids = self._prefixed(term)
+            hits = ids if hits is None else hits & ids
+            if not hits:
+                return [], 0
+        lo = None if min_amount is None else _abs_cents(min_amount)
+        hi = None if max_amount is None else _abs_cents(max_amount)
+        if lo is not None or hi is not None:
+            ranged = self._in_range(lo, hi)
+            hits = ranged if hits is None else hits & ranged
+        if hits is None:
+            return [], 0
+        ordered = sorted(hits, key=lambda d: (str(self._rows[d].get("dateKey") or ""), d), reverse=True)
+        return [{**self._rows[d], "id": d} for d in ordered[:max(0, min(limit, MAX_RESULTS))]], len(hits)
+
+class _IndexCache:
+    def __init__(self, users: int) -> None:
+        self._users = users
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, SearchIndex]" = OrderedDict()
+        self._building: Dict[str, threading.Lock] = {}
+
+    def get(self, uid: str) -> Optional[SearchIndex]:
+        with self._lock:
+            hit = self._data.get(uid)
+            if hit is not None:
+                self._data.move_to_end(uid)
+            return hit
+
+    def put(self, uid: str, index: SearchIndex) -> None:
+        with self._lock:
+            self._data[uid] = index
+            self._data.move_to_end(uid)
+            while len(self._data) > self._users:
+                gone, _ = self._data.popitem(last=False)
+                self._building.pop(gone, None)
+
+    def build_lock(self, uid: str) -> threading.Lock:
+        with self._lock:
+            return self._building.setdefault(uid, threading.Lock())
+
+_CACHE = _IndexCache(SEARCH_INDEX_USERS)
+
+def _build(db: Any, uid: str, version: int) -> SearchIndex:
+    index = SearchIndex(version, encode_token(datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SKEW_SECONDS)))
+    tcol = db.collection("users").document(uid).collection("transactions")
+    for s in tcol.select(list(SEARCH_FIELDS)).stream():
+        index.add(s.id, s.to_dict() or {})
+    return index
+
+def index_for(db: Any, uid: str, version: Optional[int] = None) -> SearchIndex:
+    """The user's index as of ``version`` (read now if not given).
+
+    Writes bump the version and stamp ``updatedAt``/tombstones, so a stale
+    index catches up from the change feed instead of rescanning; it is
+    rebuilt only when first used or when the feed resets.
+    """
+    if version is None:
+        version = read_version(db, uid)
+    hit = _CACHE.get(uid)
+    if hit is not None and hit.version == version:
+        return hit
+    with _CACHE.build_lock(uid):
+        hit = _CACHE.get(uid)
+        if hit is not None and hit.version == version:
+            return hit
+        if hit is not None:
+            try:
+                changes = changes_since(db, uid, decode_token(hit.token))
+            except ValueError:
+                changes = {"reset": True}
+            if not changes["reset"]:
+                hit.apply(changes["upserts"], changes["deleted"])
+                hit.version, hit.token = version, changes["token"]
+                return hit
+        index = _build(db, uid, version)
+        _CACHE.put(uid, index)
+        return index
@@ -0,0 +1,181 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import io, uuid
+import pandas as pd
+from google.cloud import firestore
+
+from utils.bulk_writes import BulkWrites
+from utils.change_log import CHANGES_SKEW_SECONDS, changes_since, decode_token, encode_token
+from utils.data_version import read_version
+
+SNAPSHOTS = "snapshots"
+SNAPSHOT_DOC = "transactions"
+PARTS = "parts"
+# Firestore caps a document at 1 MiB; parts stay well under it.
+PART_BYTES = 900 * 1024
+MEDIA_TYPE = "application/vnd.apache.parquet"
+TEXT_FIELDS = (
+    "date", "dateKey", "memo", "account", "source", "sourceType", "uploadId", "fileName",
+    "classificationSource", "pairId", "pairReason", "pairedWith", "plaidTxId", "itemId",
+)
+NUMBER_FIELDS = ("amount", "displayAmount")
+SNAPSHOT_FIELDS = TEXT_FIELDS + NUMBER_FIELDS + ("eventLeader",)
+
+def _manifest_ref(uref: Any) -> Any:
+    return uref.collection(SNAPSHOTS).document(SNAPSHOT_DOC)
+
+def _parts(db: Any, uid: str) -> Any:
+    return _manifest_ref(db.collection("users").document(uid)).collection(PARTS)
+
+def frame(rows: Iterable[Tuple[str, Dict[str, Any]]]) -> pd.DataFrame:
+    """Typed columns so every snapshot of a user has the same Parquet schema."""
+    ids: List[str] = []
+    recs: List[Dict[str, Any]] = []
+    for doc_id, rec in rows:
+        ids.append(doc_id)
+        recs.append(rec)
+    df = pd.DataFrame.from_records(recs, columns=list(SNAPSHOT_FIELDS))
+    df.insert(0, "id", pd.Series(ids, dtype="string"))
+    for f in TEXT_FIELDS:
+        df[f] = df[f].where(df[f].notna(), None).astype("string")
+    for f in NUMBER_FIELDS:
+        df[f] = pd.to_numeric(df[f], errors="coerce").astype("float64")
+    df["eventLeader"] = df["eventLeader"].map(lambda v: v if isinstance(v, bool) else None).astype("boolean")
+    return df
+
+def encode(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+    return buf.getvalue()
+
+def decode(data: bytes) -> pd.DataFrame:
+    return pd.read_parquet(io.BytesIO(data), engine="pyarrow")
+
+def apply_changes(df: pd.DataFrame, upserts: List[Dict[str, Any]], deleted: List[str]) -> pd.DataFrame:
+    gone = set(deleted) | {str(r["id"]) for r in upserts}
+    kept = df[~df["id"].isin(gone).to_numpy()]
+    if upserts:
+        kept = pd.concat([kept, frame((str(r["id"]), r) for r in upserts)], ignore_index=True)
+    return kept.sort_values(["dateKey", "id"], kind="mergesort", ignore_index=True)
+
+def read_manifest(db: Any, uid: str) -> Optional[Dict[str, Any]]:
+    snap = _manifest_ref(db.collection("users").document(uid)).get()
+    return (snap.to_dict() or {}) if snap.exists else None
+
+def read_data(db: Any, uid: str, manifest: Dict[str, Any]) -> Optional[bytes]:
+    """The snapshot bytes for ``manifest``, or None if a newer build already replaced its parts."""
+    parts = _parts(db, uid)
+    gen = str(manifest.get("generation") or "")
+    refs = [parts.document(f"{gen}-{i}") for i in range(int(manifest.get("parts") or 0))]
+    by_id = {s.id: s for s in db.get_all(refs)} if refs else {}
+    out = bytearray()
+    for ref in refs:
+        s = by_id.get(ref.id)
+        if s is None or not s.exists:
+            return None
+        out += (s.to_dict() or {}).get("data") or b""
+    return bytes(out)
+
+def _delete_parts(db: Any, uid: str, manifest: Optional[Dict[str, Any]]) -> None:
+    if not manifest or not manifest.get("generation"):
+        return
+    parts = _parts(db, uid)
+    stale = BulkWrites(db)
+    for i in range(int(manifest.get("parts") or 0)):
+        stale.delete(parts.document(f"{manifest['generation']}-{i}"))
+    stale.commit()
+
+def _swap_manifest(db: Any, uid: str, manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Install ``manifest`` and return the one it replaced, read in the same transaction,
+    so concurrent builds each delete exactly the generation they superseded."""
+    mref = _manifest_ref(db.collection("users").document(uid))
+
+    @firestore.transactional
+    def _swap(txn: Any) -> Optional[Dict[str, Any]]:
+        snap = mref.get(transaction=txn)
+        txn.set(mref, manifest)
+        return (snap.to_dict() or {}) if snap.exists else None
+
+    return _swap(db.transaction())
+
+def _advance_token(db: Any, uid: str, generation: str, token: str, version: int) -> None:
+    """Move the token forward only if no other build replaced the snapshot meanwhile;
+    the newer one's data may predate ``token``."""
+    mref = _manifest_ref(db.collection("users").document(uid))
+
+    @firestore.transactional
+    def _advance(txn: Any) -> None:
+        snap = mref.get(transaction=txn)
+        if snap.exists and (snap.to_dict() or {}).get("generation") == generation:
+            txn.update(mref, {"token": token, "version": version})
+
+    _advance(db.transaction())
+
+def _write(db: Any, uid: str, data: bytes, *, token: str, version: int, rows: int) -> bool:
+    """Parts under a fresh generation first, then the manifest, then the replaced generation's parts,
+    so a reader following the manifest never sees a mix of two builds."""
+    parts = _parts(db, uid)
+    gen = uuid.uuid4().hex[:16]
+    chunks = [data[i:i + PART_BYTES] for i in range(0, len(data), PART_BYTES)] or [b""]
+    writes = BulkWrites(db, chunk=8)
+    for i, chunk in enumerate(chunks):
+        writes.set(parts.document(f"{gen}-{i}"), {"data": chunk})
+    if not writes.commit().ok:
+        _delete_parts(db, uid, {"generation": gen, "parts": len(chunks)})
+        return False
+    replaced = _swap_manifest(db, uid, {
+        "generation": gen, "parts": len(chunks), "bytes": len(data), "rows": rows,
+        "token": token, "version": version, "format": "parquet", "builtAt": firestore.SERVER_TIMESTAMP,
+    })
+    if replaced and replaced.get("generation") != gen:
+        _delete_parts(db, uid, replaced)
+    return True
+
+def build_snapshot(db: Any, uid: str, *, full: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """Bring the user's snapshot up to date.
+
+    An existing snapshot is patched from /transactions/changes since its
+    token; a missing one, a reset change feed or ``full`` reads every row.
+    """
+    version = read_version(db, uid)
+    manifest = None if full else read_manifest(db, uid)
+    data = read_data(db, uid, manifest) if manifest else None
+    out: Dict[str, Any] = {"mode": "full", "rows": 0, "bytes": 0, "written": False}
+    df = None
+    token = ""
+    if data is not None and manifest.get("token"):
+        try:
+            changes = changes_since(db, uid, decode_token(str(manifest["token"])))
+        except ValueError:
+            changes = {"reset": True}
+        if not changes["reset"]:
+            token = changes["token"]
+            if not changes["upserts"] and not changes["deleted"]:
+                if not dry_run:
+                    # keep the token inside the tombstone window so the next run stays incremental
+                    _advance_token(db, uid, str(manifest.get("generation") or ""), token, version)
+                return {**out, "mode": "unchanged", "rows": int(manifest.get("rows") or 0), "bytes": len(data)}
+            df = apply_changes(decode(data), changes["upserts"], changes["deleted"])
+            out["mode"] = "incremental"
+    if df is None:
+        token = encode_token(datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SKEW_SECONDS))
+        tcol = db.collection("users").document(uid).collection("transactions")
+        df = frame((s.id, s.to_dict() or {}) for s in tcol.select(list(SNAPSHOT_FIELDS)).stream())
+        df = df.sort_values(["dateKey", "id"], kind="mergesort", ignore_index=True)
+    blob = encode(df)
+    out.update(rows=len(df), bytes=len(blob))
+    if not dry_run:
+        out["written"] = _write(db, uid, blob, token=token, version=version, rows=len(df))
+    return out
+
+def load_snapshot(db: Any, uid: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+    """The current manifest and bytes, building the first snapshot on demand."""
+    for _ in range(2):
+        manifest = read_manifest(db, uid)
+        if manifest is None:
+            build_snapshot(db, uid)
+            continue
+        data = read_data(db, uid, manifest)
+        if data is not None:
+            return manifest, data
+    return None
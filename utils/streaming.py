@@ -0,0 +1,76 @@
+from typing import Any, Dict, Iterable, Iterator, Optional, TypeVar
+from datetime import date, datetime
+import itertools, json
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+    _ORJSON_AVAILABLE = True
+except Exception:
+    _ORJSON_AVAILABLE = False
+
+STREAM_FORMATS = ("ndjson", "json")
+T = TypeVar("T")
+_FLUSH_BYTES = 64 * 1024
+
+def _default(o: Any) -> Any:
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, bytes):
+        return o.decode("utf-8", "replace")
+    if hasattr(o, "path") and hasattr(o, "id"):
+        return o.path
+    return str(o)
+
+if _ORJSON_AVAILABLE:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _buffered(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    buf = bytearray()
+    limit = 0
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= limit:
+            limit = _FLUSH_BYTES
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+def _ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield dumps(row) + b"\n"
+
+def _json_object(key: str, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    yield b'{"' + key.encode("utf-8") + b'":['
+    first = True
+    for row in rows:
+        yield dumps(row) if first else b"," + dumps(row)
+        first = False
+    yield b"]}"
+
+def stream_rows(rows: Iterable[Dict[str, Any]], fmt: str, key: str) -> StreamingResponse:
+    """Stream rows as NDJSON, or as ``{"<key>": [...]}`` encoded incrementally."""
+    if fmt == "ndjson":
+        return StreamingResponse(_buffered(_ndjson(rows)), media_type="application/x-ndjson")
+    return StreamingResponse(_buffered(_json_object(key, rows)), media_type="application/json")
+
+def stream_bytes(chunks: Iterable[bytes], media_type: str, filename: str = "", headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream pre-encoded chunks, coalesced to ~64 KiB writes; ``filename`` makes it a download."""
+    out = dict(headers or {})
+    if filename:
+        out["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(_buffered(chunks), media_type=media_type, headers=out)
+
+def peeked(rows: Iterable[T]) -> Iterator[T]:
+    """Pull the first item now, so a failing query raises before the response has started."""
+    it = iter(rows)
+    try:
+        first = next(it)
+    except StopIteration:
+        return iter(())
+    return itertools.chain((first,), it)
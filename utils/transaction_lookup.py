@@ -0,0 +1,129 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os, threading
+
+from utils.bulk_writes import BULK_WORKERS
+from utils.fingerprints import client_uid, fingerprint_hash, parse_slug
+
+LOOKUP_CACHE_USERS = int(os.environ.get("LOOKUP_CACHE_USERS", "512") or 512)
+LOOKUP_CACHE_PER_USER = int(os.environ.get("LOOKUP_CACHE_PER_USER", "256") or 256)
+_GET_ALL_CHUNK = 300
+_IN_CHUNK = 30
+
+class _LookupCache:
+    """Per-user LRU of client id -> Firestore doc id.
+
+    Only the mapping is cached; the row itself is always read by id, so a
+    cached entry never serves stale account or amount data.
+    """
+
+    def __init__(self, users: int, per_user: int) -> None:
+        self._users = users
+        self._per_user = per_user
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, OrderedDict[str, str]]" = OrderedDict()
+
+    def get(self, uid: str, tid: str) -> Optional[str]:
+        with self._lock:
+            per = self._data.get(uid)
+            if per is None or tid not in per:
+                return None
+            self._data.move_to_end(uid)
+            per.move_to_end(tid)
+            return per[tid]
+
+    def put(self, uid: str, tid: str, doc_id: str) -> None:
+        with self._lock:
+            per = self._data.get(uid)
+            if per is None:
+                per = self._data[uid] = OrderedDict()
+                while len(self._data) > self._users:
+                    self._data.popitem(last=False)
+            self._data.move_to_end(uid)
+            per[tid] = doc_id
+            per.move_to_end(tid)
+            while len(per) > self._per_user:
+                per.popitem(last=False)
+
+    def discard(self, uid: str, tid: Optional[str] = None) -> None:
+        with self._lock:
+            if tid is None:
+                self._data.pop(uid, None)
+            elif uid in self._data:
+                self._data[uid].pop(tid, None)
+
+_CACHE = _LookupCache(LOOKUP_CACHE_USERS, LOOKUP_CACHE_PER_USER)
+
+def _unmigrated(tcol: Any, tid: str) -> Any:
+    # rows jobs.migrate_lookup_fields has not reached have no clientUid; derive it over that day's rows
+    if tid[10:11] != "-":
+        return None
+    for snap in tcol.where("date", "==", tid[:10]).stream():
+        if client_uid(snap.to_dict() or {}) == tid:
+            return snap
+    return None
+
+def _by_index(tcol: Any, tid: str) -> Any:
+    for snap in tcol.where("clientUid", "==", tid).limit(1).stream():
+        return snap
+    snap = _unmigrated(tcol, tid)
+    if snap is not None:
+        return snap
+    key = parse_slug(tid)
+    if key:
+        date_key, cents = key
+        q = tcol.where("dateKey", "==", date_key).where("absCents", "in", [cents - 1, cents, cents + 1]).limit(1)
+        for snap in q.stream():
+            return snap
+    return None
+
+def find_transaction(db: Any, uid: str, tid: str) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Resolve a Firestore doc id, client uid or slug to ``(ref, record)``.
+
+    Slugs match on dateKey (YYYYMMDD) and absCents, so rows stored before
+    jobs.migrate_lookup_fields ran are only found by slug once it has.
+
+    Rows resolved once are remembered per user, so repeat views cost a single
+    document read.
+    """
+    tcol = db.collection("users").document(uid).collection("transactions")
+    cached = _CACHE.get(uid, tid)
+    if cached:
+        snap = tcol.document(cached).get()
+        if snap.exists:
+            return snap.reference, (snap.to_dict() or {})
+        _CACHE.discard(uid, tid)
+    if tid and "/" not in tid:
+        snap = tcol.document(tid).get()
+        if snap.exists:
+            return snap.reference, (snap.to_dict() or {})
+    snap = _by_index(tcol, tid)
+    if snap is None:
+        return None, None
+    _CACHE.put(uid, tid, snap.id)
+    return snap.reference, (snap.to_dict() or {})
+
+def existing_rows(db: Any, tcol: Any, doc_ids: Iterable[str], field_paths: Sequence[str] = ()) -> List[Any]:
+    """Snapshots of the given doc ids that exist, via multi-gets projected to ``field_paths``."""
+    refs = [tcol.document(i) for i in dict.fromkeys(str(x) for x in doc_ids) if i and "/" not in i]
+    out = []
+    for i in range(0, len(refs), _GET_ALL_CHUNK):
+        out.extend(s for s in db.get_all(refs[i:i + _GET_ALL_CHUNK], field_paths=list(field_paths)) if s.exists)
+    return out
+
+def rows_by_fingerprint(tcol: Any, fingerprints: Iterable[Dict[str, Any]], field_paths: Sequence[str] = ()) -> List[Any]:
+    """Snapshots of rows matching any (date, memo, amount) fingerprint, using chunked ``in`` queries on fingerprintHash."""
+    hashes = list(dict.fromkeys(
+        fingerprint_hash(str(fp.get("date") or ""), str(fp.get("memo") or ""), fp.get("amount"))
+        for fp in fingerprints if isinstance(fp, dict)
+    ))
+    chunks = [hashes[i:i + _IN_CHUNK] for i in range(0, len(hashes), _IN_CHUNK)]
+    if not chunks:
+        return []
+
+    def _query(chunk: List[str]) -> List[Any]:
+        return list(tcol.where("fingerprintHash", "in", chunk).select(list(field_paths)).stream())
+
+    with ThreadPoolExecutor(max_workers=min(BULK_WORKERS, len(chunks)), thread_name_prefix="fp-lookup") as pool:
+        return [snap for snaps in pool.map(_query, chunks) for snap in snaps]
@@ -1,6 +1,12 @@
 from typing import Optional, Tuple, Dict, Any, List
 from datetime import datetime, timedelta
 from google.cloud import firestore
+import logging, os
+
+from utils.bulk_writes import BulkWrites
+from utils.data_version import bump_version
+
+logger = logging.getLogger(__name__)
 
 WINDOW_DAYS = 5
 AMOUNT_TOL = 0.01
@@ -35,73 +41,342 @@ def _range_keys(center_key: str, days: int) -> Tuple[str, str]:
     b = (dt + timedelta(days=days)).strftime("%Y%m%d")
     return a, b
 
-def _find_candidate(db: firestore.Client, uid: str, *, want_inflow: bool, amount_abs: float, start_key: str, end_key: str, types: List[str], exclude_doc_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
-    uref = db.collection("users").document(uid)
-    q = (uref.collection("transactions")
-         .where("dateKey", ">=", start_key)
-         .where("dateKey", "<=", end_key)
-         .where("sourceType", "in", types))
+_GET_ALL_CHUNK = 300
+_WRITE_CHUNK = 450
+INDEX_FIELDS = ("amount", "date", "dateKey", "sourceType")
+PAIR_TYPES = ["bank", "card", "loan"]
+
+def _cents(x: float) -> int:
+    return int(round(x * 100))
+
+def _row_key(rec: Dict[str, Any]) -> str:
+    dk = _datekey(str(rec.get("date") or rec.get("dateKey") or ""))
     try:
-        for d in q.stream():
-            if d.id == exclude_doc_id:
-                continue
-            rec = d.to_dict() or {}
-            amt = float(rec.get("amount") or 0.0)
-            if want_inflow and amt >= 0:
-                continue
-            if (not want_inflow) and amt <= 0:
-                continue
-            if abs(_absf(amt) - amount_abs) <= AMOUNT_TOL:
-                return d.id, rec
+        datetime.strptime(dk, "%Y%m%d")
     except Exception:
-        return None
+        return ""
+    return dk
+
+def _day(date_key: str) -> int:
+    return datetime.strptime(date_key, "%Y%m%d").toordinal()
+
+def _pair_rule(st: str, amt: float) -> Optional[Tuple[List[str], bool]]:
+    """Candidate source types and sign (True = outflow) a row may pair with."""
+    if st == "bank" and amt >= 0:
+        return ["card", "loan"], True
+    if st == "bank" and amt < 0:
+        return ["bank"], False
+    if st in ("card", "loan") and amt <= 0:
+        return ["bank"], False
     return None
 
-def pair_on_ingest(db: firestore.Client, uid: str, doc_id: str) -> Optional[str]:
-    dref = db.collection("users").document(uid).collection("transactions").document(doc_id)
-    snap = dref.get()
-    if not snap.exists:
-        return None
-    row = snap.to_dict() or {}
-    if row.get("pairId"):
-        return row.get("pairId")
-
-    st = str(row.get("sourceType") or "").lower()
-    amt = float(row.get("amount") or 0.0)
-    dk = _datekey(row.get("date") or row.get("dateKey") or "")
-    if not dk:
-        return None
+def _pair_fields(doc_id: str, st: str, amt: float, other_id: str, other: Dict[str, Any]) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+    pair_id = f"pair:{min(doc_id, other_id)}:{max(doc_id, other_id)}"
+    other_st = str(other.get("sourceType") or "").lower()
+    if st == "bank" and amt >= 0:
+        reason = "card_payment" if other_st == "card" else "loan_payment"
+        leader, shadow = doc_id, other_id
+    elif st == "bank":
+        reason = "bank_transfer"
+        leader = other_id if float(other.get("amount") or 0.0) >= 0 else doc_id
+        shadow = doc_id if leader == other_id else other_id
+    else:
+        reason = "card_payment" if st == "card" else "loan_payment"
+        leader, shadow = other_id, doc_id
+    return pair_id, {
+        leader: {"pairId": pair_id, "eventLeader": True, "pairedWith": shadow, "pairReason": reason, "updatedAt": firestore.SERVER_TIMESTAMP},
+        shadow: {"pairId": pair_id, "eventLeader": False, "pairedWith": leader, "pairReason": "shadow", "updatedAt": firestore.SERVER_TIMESTAMP},
+    }
+
+class _CandidateIndex:
+    def __init__(self) -> None:
+        self._by_cents: Dict[int, List[Tuple[int, str]]] = {}
+        self.rows: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, doc_id: str, rec: Dict[str, Any]) -> None:
+        dk = _row_key(rec)
+        if not dk or doc_id in self.rows:
+            return
+        self.rows[doc_id] = rec
+        self._by_cents.setdefault(_cents(_absf(rec.get("amount"))), []).append((_day(dk), doc_id))
+
+    def best(self, doc_id: str, day: int, amount_abs: float, types: List[str], want_outflow: bool, taken: set) -> Optional[str]:
+        best_key = None
+        best_id = None
+        c = _cents(amount_abs)
+        tol = _cents(AMOUNT_TOL)
+        for cents in range(c - tol, c + tol + 1):
+            for other_day, other_id in self._by_cents.get(cents, ()):
+                if other_id == doc_id or other_id in taken or abs(other_day - day) > WINDOW_DAYS:
+                    continue
+                rec = self.rows[other_id]
+                if str(rec.get("sourceType") or "").lower() not in types:
+                    continue
+                amt = float(rec.get("amount") or 0.0)
+                if (want_outflow and amt >= 0) or ((not want_outflow) and amt <= 0):
+                    continue
+                if abs(_absf(amt) - amount_abs) > AMOUNT_TOL + 1e-9:
+                    continue
+                key = (abs(other_day - day), other_day, other_id)
+                if best_key is None or key < best_key:
+                    best_key, best_id = key, other_id
+        return best_id
+
+PAIR_INDEX = "pair_candidates"
+_INDEX_META = "_meta"
+# bumped when the bucket layout changes; an index built with another one is rebuilt
+_INDEX_SCHEME = 2
+PAIR_PENDING = "pairPending"
+# pending ids live in the meta doc, which must stay far below Firestore's 1 MiB
+PAIR_PENDING_MAX = int(os.environ.get("PAIR_PENDING_MAX", "2000") or 2000)
+_VERIFY_ROUNDS = 3
+
+def _is_candidate(st: str, amt: float) -> bool:
+    return (st in ("card", "loan") and amt < 0) or (st == "bank" and amt > 0)
 
+def _bucket_id(cents: int, date_key: str) -> str:
+    # whole dollars x month; entries carry the exact amount, so the cent tolerance
+    # only reaches a second bucket for amounts within a cent of a dollar boundary
+    return f"{cents // 100}_{date_key[:6]}"
+
+def _candidate_buckets(rec: Dict[str, Any]) -> List[str]:
+    dk = _row_key(rec)
     start_key, end_key = _range_keys(dk, WINDOW_DAYS)
-    amount_abs = _absf(amt)
+    c = _cents(_absf(rec.get("amount")))
+    tol = _cents(AMOUNT_TOL)
+    return sorted({_bucket_id(cents, key) for cents in (c - tol, c + tol) for key in (start_key, end_key)})
 
-    if st == "bank" and amt >= 0:
-        found = _find_candidate(db, uid, want_inflow=True, amount_abs=amount_abs, start_key=start_key, end_key=end_key, types=["card", "loan"], exclude_doc_id=doc_id)
-        if found:
-            other_id, other = found
-            pair_id = f"pair:{min(doc_id, other_id)}:{max(doc_id, other_id)}"
-            dref.set({"pairId": pair_id, "eventLeader": True, "pairedWith": other_id, "pairReason": "card_payment" if (other.get("sourceType") == "card") else "loan_payment"}, merge=True)
-            db.collection("users").document(uid).collection("transactions").document(other_id).set({"pairId": pair_id, "eventLeader": False, "pairedWith": doc_id, "pairReason": "shadow"}, merge=True)
-            return pair_id
+def _entry(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {"d": _row_key(rec), "a": float(rec.get("amount") or 0.0), "t": str(rec.get("sourceType") or "").lower()}
 
-    if st == "bank" and amt < 0:
-        found = _find_candidate(db, uid, want_inflow=False, amount_abs=amount_abs, start_key=start_key, end_key=end_key, types=["bank"], exclude_doc_id=doc_id)
-        if found:
-            other_id, other = found
-            pair_id = f"pair:{min(doc_id, other_id)}:{max(doc_id, other_id)}"
-            leader = other_id if float(other.get("amount") or 0.0) >= 0 else doc_id
-            shadow = doc_id if leader == other_id else other_id
-            db.collection("users").document(uid).collection("transactions").document(leader).set({"pairId": pair_id, "eventLeader": True, "pairedWith": shadow, "pairReason": "bank_transfer"}, merge=True)
-            db.collection("users").document(uid).collection("transactions").document(shadow).set({"pairId": pair_id, "eventLeader": False, "pairedWith": leader, "pairReason": "shadow"}, merge=True)
-            return pair_id
+def _entry_rec(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {"dateKey": str(entry.get("d") or ""), "amount": float(entry.get("a") or 0.0), "sourceType": str(entry.get("t") or "")}
 
-    if st in ("card", "loan") and amt <= 0:
-        found = _find_candidate(db, uid, want_inflow=False, amount_abs=amount_abs, start_key=start_key, end_key=end_key, types=["bank"], exclude_doc_id=doc_id)
-        if found:
-            other_id, _ = found
-            pair_id = f"pair:{min(doc_id, other_id)}:{max(doc_id, other_id)}"
-            db.collection("users").document(uid).collection("transactions").document(other_id).set({"pairId": pair_id, "eventLeader": True, "pairedWith": doc_id, "pairReason": "card_payment" if st == "card" else "loan_payment"}, merge=True)
-            dref.set({"pairId": pair_id, "eventLeader": False, "pairedWith": other_id, "pairReason": "shadow"}, merge=True)
-            return pair_id
+def _commit_sets(db: firestore.Client, ops: List[Tuple[Any, Dict[str, Any]]]) -> None:
+    writes = BulkWrites(db, chunk=_WRITE_CHUNK)
+    for ref, data in ops:
+        writes.set(ref, data, merge=True)
+    res = writes.commit()
+    if not res.ok:
+        raise RuntimeError(f"pairing writes failed in chunks {res.failed}")
 
-    return None
+def _bucket_ops(icol: Any, changes: Dict[str, Dict[str, Any]]) -> List[Tuple[Any, Dict[str, Any]]]:
+    return [(icol.document(b), {"entries": entries}) for b, entries in sorted(changes.items()) if entries]
+
+def rebuild_pair_index(db: firestore.Client, uid: str) -> int:
+    """(Re)build the per-user index of unpaired pairing candidates from a full scan."""
+    return sum(len(entries) for entries in _rebuild(db, uid).values())
+
+def _rebuild(db: firestore.Client, uid: str) -> Dict[str, Dict[str, Any]]:
+    """rebuild_pair_index, returning the bucket entries it wrote so callers need not read them back."""
+    uref = db.collection("users").document(uid)
+    icol = uref.collection(PAIR_INDEX)
+    stale = BulkWrites(db, chunk=_WRITE_CHUNK)
+    for d in icol.select([]).stream():
+        if d.id != _INDEX_META:
+            stale.delete(d.reference)
+    if not stale.commit().ok:
+        raise RuntimeError("could not clear the pairing index")
+    changes: Dict[str, Dict[str, Any]] = {}
+    q = uref.collection("transactions").where("sourceType", "in", PAIR_TYPES).select(["amount", "date", "dateKey", "sourceType", "pairId"])
+    for d in q.stream():
+        rec = d.to_dict() or {}
+        if rec.get("pairId") or not _row_key(rec) or not _is_candidate(str(rec.get("sourceType") or "").lower(), float(rec.get("amount") or 0.0)):
+            continue
+        changes.setdefault(_bucket_id(_cents(_absf(rec.get("amount"))), _row_key(rec)), {})[d.id] = _entry(rec)
+    _commit_sets(db, _bucket_ops(icol, changes) + [(icol.document(_INDEX_META), {"built": True, "scheme": _INDEX_SCHEME, "builtAt": firestore.SERVER_TIMESTAMP})])
+    return changes
+
+def unindex_transactions(db: firestore.Client, uid: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """Drop deleted or no-longer-pairable rows from the candidate index."""
+    icol = db.collection("users").document(uid).collection(PAIR_INDEX)
+    changes: Dict[str, Dict[str, Any]] = {}
+    for doc_id, rec in rows:
+        if _row_key(rec):
+            changes.setdefault(_bucket_id(_cents(_absf(rec.get("amount"))), _row_key(rec)), {})[doc_id] = firestore.DELETE_FIELD
+    _commit_sets(db, _bucket_ops(icol, changes))
+
+def _match(fresh: Dict[str, Dict[str, Any]], index: _CandidateIndex, taken: set) -> List[Tuple[str, str]]:
+    taken = set(taken)
+    out = []
+    for doc_id, rec in sorted(fresh.items(), key=lambda kv: (_row_key(kv[1]), kv[0])):
+        if doc_id in taken:
+            continue
+        amt = float(rec.get("amount") or 0.0)
+        types, want_outflow = _pair_rule(str(rec.get("sourceType") or "").lower(), amt)
+        other_id = index.best(doc_id, _day(_row_key(rec)), _absf(amt), types, want_outflow, taken)
+        if other_id:
+            taken.update((doc_id, other_id))
+            out.append((doc_id, other_id))
+    return out
+
+def _load_buckets(db: firestore.Client, icol: Any, bucket_ids: List[str], meta_ref: Any = None) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Bucket entries by bucket id, plus the meta doc when ``meta_ref`` is given (same multi-get)."""
+    meta: Dict[str, Any] = {}
+    buckets: Dict[str, Dict[str, Any]] = {}
+    refs = ([meta_ref] if meta_ref is not None else []) + [icol.document(b) for b in bucket_ids]
+    for i in range(0, len(refs), _GET_ALL_CHUNK):
+        for snap in db.get_all(refs[i:i + _GET_ALL_CHUNK]):
+            if not snap.exists:
+                continue
+            if snap.reference == meta_ref:
+                meta = snap.to_dict() or {}
+            else:
+                buckets[snap.id] = dict((snap.to_dict() or {}).get("entries") or {})
+    return meta, buckets
+
+def _take_row(doc_id: str, rec: Dict[str, Any], result: Dict[str, str], fresh: Dict[str, Dict[str, Any]]) -> None:
+    if rec.get("pairId"):
+        result[doc_id] = str(rec.get("pairId"))
+    elif _row_key(rec) and _pair_rule(str(rec.get("sourceType") or "").lower(), float(rec.get("amount") or 0.0)):
+        fresh[doc_id] = rec
+
+def _load_rows(db: firestore.Client, refs: List[Any], result: Dict[str, str], fresh: Dict[str, Dict[str, Any]]) -> None:
+    for i in range(0, len(refs), _GET_ALL_CHUNK):
+        for snap in db.get_all(refs[i:i + _GET_ALL_CHUNK]):
+            if snap.exists:
+                _take_row(snap.id, snap.to_dict() or {}, result, fresh)
+
+def pair_batch(db: firestore.Client, uid: str, doc_ids: List[str], rows: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, str]:
+    """Pair a set of freshly ingested transactions in one pass.
+
+    Candidates come from the per-user pair_candidates index: only the
+    buckets (whole dollars x month) around each new row are read, so the
+    cost does not grow with the user's history. ``rows`` are the records
+    the caller just wrote (amount, date/dateKey, sourceType, pairId), which
+    then need not be read back. Matching is a hash on cents
+    plus the date window; rows are processed in (dateKey, id) order and each
+    takes the closest unpaired candidate, ties broken by date then id.
+    Chosen candidates are re-read before pairing and stale index entries
+    are pruned. Rows left over by a failed earlier call (see
+    ``pair_or_defer``) are retried along with ``doc_ids``. Returns doc id ->
+    pair id.
+    """
+    uref = db.collection("users").document(uid)
+    tcol = uref.collection("transactions")
+    icol = uref.collection(PAIR_INDEX)
+    meta_ref = icol.document(_INDEX_META)
+    ids = sorted(set(i for i in doc_ids if i))
+    rows = rows or {}
+    result: Dict[str, str] = {}
+    fresh: Dict[str, Dict[str, Any]] = {}
+    for doc_id in ids:
+        if doc_id in rows:
+            _take_row(doc_id, rows[doc_id], result, fresh)
+    _load_rows(db, [tcol.document(x) for x in ids if x not in rows], result, fresh)
+
+    def _bucket_ids() -> List[str]:
+        return sorted(set(b for rec in fresh.values() for b in _candidate_buckets(rec)))
+
+    bucket_ids = _bucket_ids()
+    meta, buckets = _load_buckets(db, icol, bucket_ids, meta_ref)
+    pending = sorted(set(str(x) for x in meta.get(PAIR_PENDING) or []))
+    if pending:
+        _load_rows(db, [tcol.document(x) for x in pending if x not in set(ids)], result, fresh)
+        more = [b for b in _bucket_ids() if b not in set(bucket_ids)]
+        buckets.update(_load_buckets(db, icol, more)[1])
+        bucket_ids = _bucket_ids()
+    if not fresh and not pending:
+        return result
+
+    if not meta.get("built") or meta.get("scheme") != _INDEX_SCHEME:
+        built = _rebuild(db, uid)
+        buckets = {b: dict(built[b]) for b in bucket_ids if b in built}
+    index = _CandidateIndex()
+    for doc_id, rec in fresh.items():
+        index.add(doc_id, rec)
+    located: Dict[str, str] = {}
+    for bucket_id, entries in buckets.items():
+        for doc_id, entry in entries.items():
+            located[doc_id] = bucket_id
+            index.add(doc_id, _entry_rec(entry or {}))
+
+    taken: set = set()
+    verified = set(fresh)
+    proposals = _match(fresh, index, taken)
+    for _ in range(_VERIFY_ROUNDS):
+        check = sorted(set(o for _, o in proposals if o not in verified))
+        if not check:
+            break
+        stale = set(check)
+        for snap in db.get_all([tcol.document(x) for x in check]):
+            rec = (snap.to_dict() or {}) if snap.exists else {}
+            if snap.exists and not rec.get("pairId") and _row_key(rec) == index.rows[snap.id].get("dateKey") and _cents(_absf(rec.get("amount"))) == _cents(_absf(index.rows[snap.id].get("amount"))):
+                stale.discard(snap.id)
+                verified.add(snap.id)
+        if not stale:
+            break
+        taken |= stale
+        proposals = _match(fresh, index, taken)
+    proposals = [(a, b) for a, b in proposals if b in verified]
+
+    writes: Dict[str, Dict[str, Any]] = {}
+    matched = set()
+    for doc_id, other_id in proposals:
+        amt = float(fresh[doc_id].get("amount") or 0.0)
+        pair_id, fields = _pair_fields(doc_id, str(fresh[doc_id].get("sourceType") or "").lower(), amt, other_id, index.rows[other_id])
+        writes.update(fields)
+        matched.update((doc_id, other_id))
+        result[doc_id] = pair_id
+        if other_id in fresh:
+            result[other_id] = pair_id
+
+    changes: Dict[str, Dict[str, Any]] = {}
+    for doc_id in matched | taken:
+        if doc_id in located:
+            changes.setdefault(located[doc_id], {})[doc_id] = firestore.DELETE_FIELD
+    for doc_id, rec in fresh.items():
+        if doc_id in matched or not _is_candidate(str(rec.get("sourceType") or "").lower(), float(rec.get("amount") or 0.0)):
+            continue
+        bucket_id = _bucket_id(_cents(_absf(rec.get("amount"))), _row_key(rec))
+        if located.get(doc_id) and located[doc_id] != bucket_id:
+            changes.setdefault(located[doc_id], {})[doc_id] = firestore.DELETE_FIELD
+        changes.setdefault(bucket_id, {})[doc_id] = _entry(rec)
+    done = [(meta_ref, {PAIR_PENDING: firestore.ArrayRemove(pending)})] if pending else []
+    _commit_sets(db, [(tcol.document(k), v) for k, v in writes.items()] + _bucket_ops(icol, changes) + done)
+    if writes:
+        bump_version(db, uid)
+    return result
+
+def _queue_pending(db: firestore.Client, uid: str, ids: List[str]) -> int:
+    """Add ``ids`` to the retry queue, keeping at most PAIR_PENDING_MAX; returns how many were dropped.
+
+    On overflow the index is marked unbuilt, so the next pair_batch rebuilds
+    it from a full scan and the dropped rows still become candidates for
+    later rows; only their own match against older rows is lost.
+    """
+    meta_ref = db.collection("users").document(uid).collection(PAIR_INDEX).document(_INDEX_META)
+
+    @firestore.transactional
+    def _queue(txn: Any) -> int:
+        snap = meta_ref.get(transaction=txn)
+        queued = list(dict.fromkeys([str(x) for x in ((snap.to_dict() or {}) if snap.exists else {}).get(PAIR_PENDING) or []] + ids))
+        update: Dict[str, Any] = {PAIR_PENDING: queued[:PAIR_PENDING_MAX]}
+        if len(queued) > PAIR_PENDING_MAX:
+            update["built"] = False
+        txn.set(meta_ref, update, merge=True)
+        return max(0, len(queued) - PAIR_PENDING_MAX)
+
+    return _queue(db.transaction())
+
+def pair_or_defer(db: firestore.Client, uid: str, doc_ids: List[str], rows: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, str]:
+    """``pair_batch`` for the ingest paths: rows already saved must not miss pairing
+    or the candidate index because of a transient error, so on failure they are
+    queued on the index's meta doc and retried by the user's next ``pair_batch``."""
+    ids = sorted(set(i for i in doc_ids if i))
+    if not ids:
+        return {}
+    try:
+        return pair_batch(db, uid, ids, rows)
+    except Exception:
+        logger.exception("pairing failed for %d rows of user %s; queued for retry", len(ids), uid)
+    try:
+        dropped = _queue_pending(db, uid, ids)
+        if dropped:
+            logger.error("pairing retry queue of user %s is full; %d rows left to the index rebuild", uid, dropped)
+    except Exception:
+        logger.exception("could not queue %d unpaired rows of user %s", len(ids), uid)
+    return {}
+
+def pair_on_ingest(db: firestore.Client, uid: str, doc_id: str) -> Optional[str]:
+    return pair_batch(db, uid, [doc_id]).get(doc_id)